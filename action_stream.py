@@ -0,0 +1,120 @@
+# action_stream.py
+"""
+Incremental scanner for the planner's JSON reply.
+
+With PLANNER_STREAM=1 the planner reply arrives as text deltas. feed() each
+delta to an ActionStream; it scans only the new characters and keeps:
+
+  fields    top-level members of the first JSON object whose values are
+            complete, decoded ({"action": "click", "selector": "..."} while
+            "value" and the rest are still streaming)
+  complete  True once that object's closing brace arrived
+  text()    the object's source, from its "{" to the matching "}"
+
+String contents (including braces and escaped quotes) are skipped properly,
+so text() is the first balanced object, not the greedy first-"{"-to-last-"}"
+slice. Prose before the object is ignored. Nested values such as "expect" or
+"plan" are decoded once they close.
+
+    stream = ActionStream()
+    for delta in deltas:
+        stream.feed(delta)
+        if stream.ready():  # action + selector/element_id known
+            ...
+"""
+import json
+
+_WS = " \t\r\n"
+
+
+class ActionStream:
+    def __init__(self):
+        self.fields = {}
+        self.complete = False
+        self._buf = ""
+        self._i = 0
+        self._start = None
+        self._end = None
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._tok = None      # start of the current string or nested value at depth 1
+        self._prim = None     # start of the current number/true/false/null at depth 1
+        self._key = None      # member name waiting for its value
+
+    def feed(self, chunk: str):
+        self._buf += chunk
+        buf = self._buf
+        while self._i < len(buf) and not self.complete:
+            c = buf[self._i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._depth == 1:
+                        self._member(buf[self._tok:self._i + 1])
+            elif self._start is None:
+                if c == "{":
+                    self._start, self._depth = self._i, 1
+            elif c == '"':
+                self._in_str = True
+                if self._depth == 1:
+                    self._tok = self._i
+            elif c in "{[":
+                if self._depth == 1:
+                    self._tok = self._i
+                self._depth += 1
+            elif c in "}]":
+                if self._depth == 1:
+                    self._primitive_done()
+                self._depth -= 1
+                if self._depth == 0:
+                    self._end, self.complete = self._i, True
+                elif self._depth == 1:
+                    self._member(buf[self._tok:self._i + 1])
+            elif self._depth == 1:
+                if c == ",":
+                    self._primitive_done()
+                elif c not in _WS and c != ":" and self._key is not None and self._prim is None:
+                    self._prim = self._i
+            self._i += 1
+        return self
+
+    def _member(self, raw: str):
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            value = None
+        if self._key is None and isinstance(value, str):
+            self._key = value
+        elif self._key is not None:
+            self.fields[self._key] = value
+            self._key = None
+
+    def _primitive_done(self):
+        if self._prim is None:
+            return
+        raw, self._prim = self._buf[self._prim:self._i].strip(), None
+        self._member(raw)
+
+    def ready(self, marks: bool = False) -> bool:
+        """
+        The action kind and its target are known (the rest of the object may
+        still be streaming). With marks the target may be an element_id that
+        arrives after an empty selector, so wait for element_id itself.
+        """
+        if "action" not in self.fields:
+            return False
+        if marks:
+            return "element_id" in self.fields
+        return "selector" in self.fields or "element_id" in self.fields
+
+    def started(self) -> bool:
+        return self._start is not None
+
+    def text(self) -> str | None:
+        """Source of the first complete object, or None while it is still open."""
+        return self._buf[self._start:self._end + 1] if self.complete else None
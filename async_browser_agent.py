@@ -0,0 +1,986 @@
+# async_browser_agent.py
+"""
+asyncio port of BrowserAgent.
+
+One Chromium process is shared by many tasks; every task gets its own isolated
+BrowserContext (cookies, storage, pages).  The executor helpers mirror the sync
+ones in browser_agent.py one-for-one so execute_action keeps the same semantics
+(dialog scoping, chip openers, popup selection, idempotent fills, debouncing).
+"""
+import asyncio
+import re
+import sys
+import time
+from collections import deque
+
+from playwright.async_api import async_playwright, TimeoutError as PwTimeout
+
+import dom_probe
+from marks import MARK_ACTION_TIMEOUT_MS, OBS_MARKS, ElementRegistry, mark_elements_async, mark_selector, with_marks
+from observation import build_observation_async, DEFAULT_TOKEN_BUDGET
+from preflight import PREFLIGHT, feedback, preflight_async
+from pw_profiler import PW_PROFILE, Profiler, profiled
+from selector_cache import CACHED_CLICK_TIMEOUT_MS, app_domain, get_selector_cache
+from settle import NetworkTracker, SETTLE_CAP_MS, SETTLE_QUIET_MS, settle_async
+from timeout_budget import DEFAULT_TIMEOUT_MS, Deadline, get_timeout_budgets
+from tracing import span, traced
+
+from browser_agent import (
+    CHIP_LABEL_HINTS,
+    LONG_TEXT_THRESHOLD,
+    PLAN_EXPECT_TIMEOUT_MS,
+    _expect_label,
+    _extract_role_name,
+    _is_dialog_scoped,
+    _is_generic_selector,
+    _normalize_nav_selector,
+    _normalize_text,
+    _parse_value_from_selector,
+    _plan_summary,
+    _preflight_reason,
+    _step_failed,
+)
+
+
+@traced("probe.visible_dialog")
+async def _visible_dialog(page):
+    try:
+        dlg = page.get_by_role("dialog")
+        return dlg if await dlg.count() > 0 else None
+    except Exception:
+        return None
+
+
+@traced("probe.dialog_is_open")
+async def _dialog_is_open(page) -> bool:
+    return dom_probe.dialog_open(await dom_probe.probe_async(page, light=True))
+
+
+@traced("probe.popup_is_open")
+async def _popup_is_open(page) -> bool:
+    return dom_probe.popup_open(await dom_probe.probe_async(page, light=True))
+
+
+@traced("probe.ensure_no_popover")
+async def _ensure_no_popover(page):
+    if await _popup_is_open(page):
+        try:
+            await page.keyboard.press("Escape")
+            await settle_async(page, quiet_ms=50, cap_ms=300)
+        except Exception:
+            pass
+
+
+@traced("ladder.wait_any_popup")
+async def _wait_any_popup(page, timeout=4000) -> bool:
+    """
+    Wait briefly for dropdown popover (menu/listbox). Returns True if visible.
+    """
+    try:
+        m = page.get_by_role("menu")
+        if await m.count():
+            await m.first.wait_for(state="visible", timeout=timeout)
+            return True
+    except Exception:
+        pass
+    try:
+        lb = page.get_by_role("listbox")
+        if await lb.count():
+            await lb.first.wait_for(state="visible", timeout=timeout)
+            return True
+    except Exception:
+        pass
+    return False
+
+
+@traced("ladder.open_property_chip")
+async def _open_property_chip(page, label_regex: str) -> bool:
+    """
+    Open a property picker (e.g., Status, Priority) inside the *currently visible* dialog.
+    Same strategy ladder as browser_agent._open_property_chip, ranked from one dom_probe snapshot.
+    """
+    snap = await dom_probe.probe_async(page)
+    if not dom_probe.dialog_open(snap):
+        return False
+
+    if dom_probe.popup_open(snap):
+        await _ensure_no_popover(page)
+        snap = await dom_probe.probe_async(page)
+
+    async def _click_and_wait(opener) -> bool:
+        try:
+            await opener.scroll_into_view_if_needed(timeout=500)
+        except Exception:
+            pass
+        try:
+            await opener.click(timeout=1200)
+        except Exception:
+            try:
+                await opener.click(timeout=1200, force=True)
+            except Exception:
+                return False
+        if await _wait_any_popup(page, timeout=1500):
+            return True
+        try:
+            await page.keyboard.press("ArrowDown")
+            if await _wait_any_popup(page, timeout=800):
+                return True
+        except Exception:
+            pass
+        return False
+
+    for chip in dom_probe.property_openers(snap, label_regex):
+        if await _click_and_wait(dom_probe.probe_locator(page, chip["id"])):
+            return True
+
+    try:
+        dlg = page.get_by_role("dialog")
+        container = dlg.locator(f':has-text(/{label_regex}/i)')
+        if await container.count():
+            row = container.first
+            for css in ("[role=combobox]", "button", "[role=button]"):
+                ctl = row.locator(css)
+                if await ctl.count() and await _click_and_wait(ctl.first):
+                    return True
+    except Exception:
+        pass
+
+    return False
+
+
+@traced("ladder.click_chip_in_dialog")
+async def _click_chip_in_dialog(page, text_val: str) -> bool:
+    snap = await dom_probe.probe_async(page, text=text_val)
+    if not dom_probe.dialog_open(snap): return False
+    chip = dom_probe.find_chip(snap, re.escape(text_val))
+    hits = [h for h in snap["text_hits"] if h["in_dialog"]]
+    target = chip or (hits[0] if hits else None)
+    if not target:
+        return False
+    try:
+        await dom_probe.probe_locator(page, target["id"]).click()
+        await _wait_any_popup(page, timeout=1500)
+        return True
+    except Exception:
+        return False
+
+
+@traced("ladder.open_chip_generic")
+async def _open_chip_generic(page, sel: str) -> bool:
+    name_pat, _ = _extract_role_name(sel)
+    if name_pat and await _open_property_chip(page, name_pat):
+        return True
+    for hint in CHIP_LABEL_HINTS:
+        if re.search(hint, sel, re.I) and await _open_property_chip(page, hint):
+            return True
+    m = re.search(r'>>\s*text\s*=\s*(?:"([^"]+)"|\'([^\']+)\'|([^\s][^>]*))\s*$', sel, re.I)
+    val = (m.group(1) or m.group(2) or m.group(3)).strip() if m else None
+    if val:
+        return await _click_chip_in_dialog(page, val)
+    return False
+
+
+@traced("probe.any_chip_has_value")
+async def _any_chip_has_value(page, desired_regex: str) -> bool:
+    return dom_probe.any_chip_has_value(await dom_probe.probe_async(page), desired_regex)
+
+
+async def _read_text_like_from_locator(loc) -> str:
+    try:
+        return await loc.input_value()
+    except Exception:
+        try:
+            return await loc.inner_text()
+        except Exception:
+            return ""
+
+
+@traced("probe.prefer_desc_textbox")
+async def _prefer_desc_textbox(page):
+    try:
+        loc = page.get_by_role("textbox", name=re.compile(r"(description|summary)", re.I))
+        if await loc.count() > 0:
+            return loc.first
+    except Exception:
+        pass
+    try:
+        loc = page.locator('[aria-label*="description" i], [aria-label*="summary" i]')
+        if await loc.count() > 0:
+            return loc.first
+    except Exception:
+        pass
+    return None
+
+
+@traced("probe.top_dialog_name")
+async def _top_dialog_name(page) -> str:
+    try:
+        d = page.get_by_role("dialog")
+        if await d.count():
+            return _normalize_text(await d.first.inner_text() or "")
+    except Exception:
+        pass
+    return ""
+
+
+@traced("ladder.select_from_popup")
+async def _select_from_popup(page, value: str) -> bool:
+    """
+    Selects an item from the currently-open popup (menu/listbox) regardless of
+    role differences (menuitemradio/menuitem/option), virtualization, or filters.
+    """
+    async def _try_click(loc) -> bool:
+        try:
+            if await loc.count():
+                el = loc.first
+                try:
+                    await el.scroll_into_view_if_needed(timeout=500)
+                except Exception:
+                    pass
+                try:
+                    await el.click(timeout=1000)
+                except Exception:
+                    await el.click(timeout=1000, force=True)
+                return True
+        except Exception:
+            pass
+        return False
+
+    try:
+        await page.wait_for_selector('[role="menu"], [role="listbox"], [data-animated-popover-content]', timeout=1500)
+    except Exception:
+        return False
+
+    snap = await dom_probe.probe_async(page, text=value)
+
+    for cand in dom_probe.popup_item_candidates(snap, value, scope="popup"):
+        if await _try_click(dom_probe.probe_locator(page, cand["id"])):
+            return True
+
+    if any(p["has_filter"] for p in snap["popups"]):
+        try:
+            filt = page.locator('[role="menu"] input,[role="listbox"] input,[data-animated-popover-content] input').first
+            try:
+                await filt.fill(value)
+            except Exception:
+                await filt.type(value)
+            await page.keyboard.press("Enter")
+            return True
+        except Exception:
+            pass
+
+    for cand in dom_probe.popup_item_candidates(snap, value, scope="page"):
+        if await _try_click(dom_probe.probe_locator(page, cand["id"])):
+            return True
+
+    try:
+        loc = page.get_by_text(value, exact=False)
+        if await _try_click(loc):
+            return True
+    except Exception:
+        pass
+    return False
+
+
+@traced("plan.check_expect")
+async def _check_expect(page, expect: dict, timeout_ms: int = PLAN_EXPECT_TIMEOUT_MS) -> str | None:
+    deadline = time.monotonic() + timeout_ms / 1000.0
+
+    def remaining() -> int:
+        return max(int((deadline - time.monotonic()) * 1000), 1)
+
+    for key, want in (expect or {}).items():
+        try:
+            if key in ("visible", "hidden"):
+                await page.locator(want).first.wait_for(state=key, timeout=remaining())
+            elif key == "text":
+                await page.get_by_text(str(want), exact=False).first.wait_for(state="visible", timeout=remaining())
+            elif key == "url":
+                await page.wait_for_url(re.compile(want), timeout=remaining())
+            elif key in ("dialog", "popup"):
+                is_open = _dialog_is_open if key == "dialog" else _popup_is_open
+                while await is_open(page) != bool(want):
+                    if time.monotonic() >= deadline:
+                        return _expect_label(key, want)
+                    await settle_async(page, quiet_ms=50, cap_ms=min(remaining(), 300))
+        except Exception:
+            return _expect_label(key, want)
+    return None
+
+
+async def _discard(task):
+    """Cancel a prepare_action task that is no longer wanted and wait for it to unwind."""
+    if task is not None:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+class AsyncBrowserPool:
+    """
+    Owns one Playwright driver + one Chromium process and hands out isolated
+    AsyncBrowserAgent instances (one BrowserContext each).
+
+        async with AsyncBrowserPool(headless=True, max_contexts=8) as pool:
+            agent = await pool.new_agent()
+            ...
+            await agent.close()
+
+    max_contexts bounds how many contexts may be alive at once; new_agent()
+    waits for a free slot.
+    """
+
+    def __init__(self, headless=False, max_contexts=4, default_timeout_ms=15000):
+        self.headless = headless
+        self.max_contexts = max_contexts
+        self.default_timeout_ms = default_timeout_ms
+        self.playwright = None
+        self.browser = None
+        self._slots = asyncio.Semaphore(max_contexts)
+
+    async def start(self):
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=self.headless)
+        return self
+
+    async def new_agent(self) -> "AsyncBrowserAgent":
+        await self._slots.acquire()
+        try:
+            context = await self.browser.new_context()
+            page = await context.new_page()
+            page.set_default_timeout(self.default_timeout_ms)
+        except Exception:
+            self._slots.release()
+            raise
+        return AsyncBrowserAgent(context, page, on_close=self._slots.release, default_timeout_ms=self.default_timeout_ms)
+
+    async def close(self):
+        if self.browser:
+            await self.browser.close()
+        if self.playwright:
+            await self.playwright.stop()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class AsyncBrowserAgent:
+    def __init__(self, context, page, on_close=None, default_timeout_ms=DEFAULT_TIMEOUT_MS):
+        self.context = context
+        self.page = page
+        self.last_result = "Browser initialized."
+        self._recent_clicks = deque(maxlen=100)
+        self._on_close = on_close
+        self.selector_cache = get_selector_cache()
+        self.selector_stats = {"hits": 0, "misses": 0, "invalidated": 0}
+        self._resolution = None
+        self.network = NetworkTracker().attach(page)
+        self.default_timeout_ms = default_timeout_ms
+        self.timeouts = get_timeout_budgets()
+        self._deadline = Deadline(default_timeout_ms)
+        self.preflight_stats = {"checked": 0, "rejected": 0, "early": 0}
+        self.marks = ElementRegistry()
+        self._prepare_task = None  # prepare_action started by start_prepare
+        self.profiler = Profiler() if PW_PROFILE else None
+        self.page = profiled(self.page, self.profiler)  # after NetworkTracker: listeners stay on the raw page
+
+    async def click_menu_item(self, text_regex: str = ".*") -> bool:
+        """Click the first menuitem whose accessible name matches text_regex (case-insensitive)."""
+        try:
+            menuitem = self.page.get_by_role("menuitem", name=re.compile(text_regex, re.I))
+            if await menuitem.count() > 0:
+                await menuitem.first.click()
+                self.last_result = f"Selected menu item matching /{text_regex}/"
+                return True
+        except Exception:
+            pass
+        return False
+
+    def _remaining_ms(self) -> int:
+        return self._deadline.remaining_ms()
+
+    def _rung(self):
+        """BrowserAgent._rung: reset the page default timeout to what is left of the budget."""
+        self.page.set_default_timeout(self._remaining_ms())
+
+    @traced("ladder.wait_visible")
+    async def _wait_visible(self, sel, timeout=None):
+        await self.page.wait_for_selector(sel, state="visible", timeout=timeout or self._remaining_ms())
+
+    async def navigate(self, url):
+        await self.page.goto(url)
+        self.last_result = f"Navigated to {url}"
+
+    async def get_visible_text(self):
+        try:
+            return await self.page.inner_text("body")
+        except Exception:
+            return ""
+
+    async def get_observation(self, token_budget=DEFAULT_TOKEN_BUDGET, tracker=None):
+        task, self._prepare_task = self._prepare_task, None
+        await _discard(task)
+        text = await build_observation_async(self.page, token_budget, tracker)
+        if OBS_MARKS:
+            self.marks = await mark_elements_async(self.page)
+            text = with_marks(text, self.marks)
+        return text
+
+    async def settle(self, quiet_ms=SETTLE_QUIET_MS, cap_ms=SETTLE_CAP_MS) -> dict:
+        return await settle_async(self.page, quiet_ms, cap_ms, self.network)
+
+    def _should_debounce(self, sel: str, window_s: float = 2.0) -> bool:
+        now = time.time()
+        while self._recent_clicks and (now - self._recent_clicks[0][0]) > window_s:
+            self._recent_clicks.popleft()
+        recent_same = sum(1 for ts, s in self._recent_clicks if s == sel)
+        if recent_same >= 2:
+            return True
+        self._recent_clicks.append((now, sel))
+        return False
+
+    async def _select_popup_item(self, sel: str) -> bool:
+        desired = _parse_value_from_selector(sel)
+        if not desired:
+            return False
+        if await _any_chip_has_value(self.page, re.escape(desired)):
+            self.last_result = f"Skipped selecting '{desired}': already set."
+            return True
+        self._rung()
+        if await _select_from_popup(self.page, desired):
+            self._resolved("popup_select", desired)
+            await settle_async(self.page, quiet_ms=50, cap_ms=300)  # let the popup close
+            if await _any_chip_has_value(self.page, re.escape(desired)):
+                self.last_result = f"Selected '{desired}' from popup"
+            else:
+                self.last_result = f"Clicked '{desired}' from popup (unverified)"
+            return True
+        return False
+
+    def _resolved(self, strategy: str, target: str):
+        self._resolution = (strategy, target)
+
+    @traced("ladder.cached")
+    async def _click_cached(self, strategy: str, target: str) -> bool:
+        page, t = self.page, min(CACHED_CLICK_TIMEOUT_MS, self._remaining_ms())
+        try:
+            if strategy == "locator":
+                await page.locator(target).first.click(timeout=t)
+            elif strategy == "text":
+                await page.get_by_text(target, exact=False).first.click(timeout=t)
+            elif strategy == "popup_select":
+                if await _any_chip_has_value(page, re.escape(target)):
+                    self.last_result = f"Skipped selecting '{target}': already set."
+                    return True
+                if not await _select_from_popup(page, target):
+                    return False
+            elif strategy == "chip_open":
+                if not (await _visible_dialog(page) and not await _popup_is_open(page)
+                        and await _open_chip_generic(page, target)):
+                    return False
+            elif strategy == "dialog_chip":
+                if not await _click_chip_in_dialog(page, target):
+                    return False
+            else:
+                dlg = await _visible_dialog(page)
+                if not dlg:
+                    return False
+                if strategy == "dialog_locator":
+                    await dlg.locator(target).first.click(timeout=t)
+                elif strategy == "dialog_button":
+                    await dlg.get_by_role("button", name=re.compile(re.escape(target), re.I)).first.click(timeout=t)
+                elif strategy == "dialog_button_text":
+                    await dlg.locator(f'button:has-text("{target}")').first.click(timeout=t)
+                elif strategy == "dialog_text":
+                    await dlg.get_by_text(target, exact=False).first.click(timeout=t)
+                else:
+                    return False
+        except Exception:
+            return False
+        self.last_result = f"Clicked {target} (learned {strategy})"
+        return True
+
+    @traced("action.marked")
+    async def _execute_marked(self, action):
+        """BrowserAgent._execute_marked: act on a set-of-marks element_id; None falls back to the selector."""
+        kind, element_id = action.get("action"), action["element_id"]
+        if kind not in ("click", "fill"):
+            return None
+        entry = self.marks.get(element_id)
+        error = f"element [{element_id}] is not in the current element list"
+        if entry:
+            loc = self.page.locator(mark_selector(element_id))
+            t = min(MARK_ACTION_TIMEOUT_MS, self._remaining_ms())
+            try:
+                if kind == "click":
+                    await loc.click(timeout=t)
+                else:
+                    await loc.fill(action.get("value", ""), timeout=t)
+                if not action.get("selector"):
+                    action["selector"] = action["_normalized_selector"] = self.marks.role_selector(element_id)
+                verb = "Clicked" if kind == "click" else f"Filled '{action.get('value', '')[:30]}' into"
+                self.last_result = f'{verb} [{element_id}] {entry["role"]} "{entry["name"]}"'
+                return True
+            except Exception as e:
+                error = f"element [{element_id}] {entry['role']} \"{entry['name']}\": {str(e).splitlines()[0]}"
+        if (action.get("selector") or "").strip():
+            return None
+        self.last_result = f"Error: {error}. Pick an element_id from the current list."
+        return True
+
+    @traced("action.preflight")
+    async def _preflight_rejects(self, sel: str, engine: str, arg) -> bool:
+        if not PREFLIGHT:
+            return False
+        self.preflight_stats["checked"] += 1
+        report = await self._take_prepared(sel, engine, arg) or await preflight_async(self.page, sel, engine, arg)
+        reason = _preflight_reason(report, sel, engine, arg)
+        if not reason:
+            return False
+        self.preflight_stats["rejected"] += 1
+        self.last_result = feedback(sel, reason)
+        return True
+
+    def start_prepare(self, action):
+        """
+        BrowserAgent.prepare_action, started as a task. The streaming planner
+        runs in a worker thread, so it schedules this with
+        loop.call_soon_threadsafe. A task still running from an earlier
+        reply is cancelled and awaited before this one starts.
+        """
+        self._prepare_task = asyncio.ensure_future(self._prepare_after(self._prepare_task, action))
+
+    async def _prepare_after(self, previous, action):
+        await _discard(previous)
+        return await self.prepare_action(action)
+
+    @traced("action.prepare")
+    async def prepare_action(self, action):
+        if not PREFLIGHT or action.get("element_id") is not None:
+            return None
+        sel = _normalize_nav_selector((action.get("_normalized_selector") or action.get("selector") or "").strip())
+        if not sel:
+            return None
+        engine, arg = action.get("_selector_engine", "locator"), action.get("_get_by_arg")
+        return (sel, engine, arg), await preflight_async(self.page, sel, engine, arg, scroll=True)
+
+    async def _take_prepared(self, sel: str, engine: str, arg) -> dict | None:
+        task, self._prepare_task = self._prepare_task, None
+        if task is None:
+            return None
+        prepared = (await asyncio.gather(task, return_exceptions=True))[0]
+        if isinstance(prepared, tuple) and prepared[0] == (sel, engine, arg):
+            self.preflight_stats["early"] += 1
+            return prepared[1]
+        return None
+
+    async def _click_learned(self, sel, engine, arg, lowered) -> bool:
+        """BrowserAgent._execute_learned: selector_cache lookup and pre-flight around the click ladder."""
+        cache = self.selector_cache
+        if not sel:
+            return await self._click(sel, engine, arg, lowered)
+
+        domain = app_domain(self.page.url)
+        entry = cache.get(domain, sel) if cache else None
+        if entry:
+            if await self._click_cached(entry["strategy"], entry["target"]):
+                self.selector_stats["hits"] += 1
+                return True
+            cache.invalidate(domain, sel)
+            self.selector_stats["invalidated"] += 1
+        elif cache:
+            self.selector_stats["misses"] += 1
+
+        if await self._preflight_rejects(sel, engine, arg):
+            return True
+
+        self._resolution = None
+        keep_going = await self._click(sel, engine, arg, lowered)
+        if cache and self._resolution and not _step_failed(self.last_result):
+            cache.put(domain, sel, *self._resolution)
+        return keep_going
+
+    async def _click(self, sel, engine, arg, lowered) -> bool:
+        page = self.page
+        is_popup_item = ("role=menuitem" in lowered) or ("role=option" in lowered) or ("menuitemradio" in lowered)
+
+        if is_popup_item and await self._select_popup_item(sel):
+            return True
+
+        dlg = await _visible_dialog(page)
+        dialog_scoped = ("role=dialog" in lowered) or (">>" in sel)
+
+        if dlg and not dialog_scoped:
+            try:
+                self._rung()
+                loc = dlg.locator(sel)
+                if await loc.count():
+                    await loc.first.click()
+                    self._resolved("dialog_locator", sel)
+                    self.last_result = f"Clicked (scoped to open dialog) {sel}"
+                    return True
+            except Exception:
+                pass
+
+        if dlg:
+            top = await _top_dialog_name(page)
+            if re.search(r"(discard|delete|remove|unsaved|are you sure)", top, re.I):
+                if not dialog_scoped:
+                    self.last_result = "Blocked click outside confirmation dialog while edit dialog is open."
+                    return True
+
+        self._rung()
+        if dlg and not await _popup_is_open(page) and await _open_chip_generic(page, sel):
+            self._resolved("chip_open", sel)
+            self.last_result = "Opened chip via dialog-scoped, label-first strategy"
+            return True
+
+        if is_popup_item and await self._select_popup_item(sel):
+            return True
+
+        try:
+            _submit_pat = r"(create|save|submit|confirm|finish|publish|done)"
+            looks_like_submit = (
+                dialog_scoped
+                and (
+                    re.search(rf"(role=button|button:has-text)\(.*{_submit_pat}.*\)", sel, re.I)
+                    or re.search(r'\b(text\s*=\s*)?"?(Create|Save|Submit|Confirm|Finish|Publish|Done)\b', sel, re.I)
+                )
+            )
+            name_pat, _ = _extract_role_name(sel)
+
+            if looks_like_submit and not await _dialog_is_open(page):
+                self.last_result = "Skipped submit: dialog already closed (likely submitted)."
+                return True
+
+            if self._should_debounce(sel):
+                self.last_result = f"Debounced repeat click on {sel}"
+                return True
+
+            if engine == "get_by_text" and arg:
+                self._rung()
+                el = page.get_by_text(arg, exact=False)
+                target = el.first if await el.count() else el
+                await target.wait_for(state="visible", timeout=self._remaining_ms())
+                await target.click()
+                self._resolved("text", arg)
+                self.last_result = f"Clicked by text: {arg}"
+                return True
+
+            if ">> text=" in sel and "role=dialog" in sel:
+                self._rung()
+                try:
+                    left, right = sel.split(">>", 1)
+                    text_val = right.split("text=", 1)[1].strip().strip('"').strip("'")
+                    dlg = await _visible_dialog(page)
+                    if dlg and text_val:
+                        btn = dlg.get_by_role("button", name=re.compile(re.escape(text_val), re.I))
+                        if await btn.count() > 0:
+                            await btn.first.click()
+                            self._resolved("dialog_button", text_val)
+                            self.last_result = f"Clicked dialog button matching '{text_val}'"
+                            return True
+                        btn = dlg.locator(f'button:has-text("{text_val}")')
+                        if await btn.count() > 0:
+                            await btn.first.click()
+                            self._resolved("dialog_button_text", text_val)
+                            self.last_result = f"Clicked dialog button:has-text('{text_val}')"
+                            return True
+                        el = dlg.get_by_text(text_val, exact=False)
+                        if await el.count() > 0:
+                            await el.first.click()
+                            self._resolved("dialog_text", text_val)
+                            self.last_result = f"Clicked dialog text '{text_val}' (generic)"
+                            return True
+                except Exception:
+                    pass
+            try:
+                await self._wait_visible(sel)
+                self._rung()
+                await page.locator(sel).first.click()
+                self._resolved("locator", sel)
+            except Exception:
+                m = re.search(r'>>\s*text\s*=\s*(?:"([^"]+)"|\'([^\']+)\'|([^\s][^>]*))\s*$', sel, flags=re.I)
+                text_val = (m.group(1) or m.group(2) or m.group(3)).strip() if m else None
+                self._rung()
+                if text_val and await _click_chip_in_dialog(page, text_val):
+                    self._resolved("dialog_chip", text_val)
+                    try:
+                        await page.wait_for_selector('[role="menu"], [role="listbox"]', timeout=1500)
+                    except Exception:
+                        pass
+                    self.last_result = f"Clicked dialog chip/button '{text_val}'"
+                    return True
+
+                if not text_val and not name_pat:
+                    try:
+                        await page.wait_for_selector('[role="menu"], [role="listbox"]', timeout=1500)
+                    except Exception:
+                        pass
+                    self._rung()
+                    for token in ("Backlog", "Status", "Health", "Priority", "Labels", "Start", "Target"):
+                        if token.lower() in sel.lower():
+                            if await _click_chip_in_dialog(page, token):
+                                self._resolved("dialog_chip", token)
+                                self.last_result = f"Clicked dialog chip/button '{token}'"
+                                return True
+                            break
+
+                self._rung()
+                if _is_dialog_scoped(sel):
+                    if await _popup_is_open(page):
+                        self.last_result = "Popup already open; skipping chip re-click."
+                        return True
+                    await page.locator(sel).first.click()
+                    if not await _wait_any_popup(page, timeout=800):
+                        try:
+                            await page.keyboard.press("Escape")
+                        except Exception:
+                            pass
+                        if not await _wait_any_popup(page, timeout=800):
+                            self.last_result = "Chip clicked but no popup appeared; treating as no-op."
+                            return True
+                else:
+                    dlg = await _visible_dialog(page)
+                    if dlg:
+                        await dlg.locator(sel).first.click()
+                        self._resolved("dialog_locator", sel)
+                    else:
+                        await page.locator(sel).first.click()
+                        self._resolved("locator", sel)
+
+            self.last_result = f"Clicked {sel}"
+        except Exception as e:
+            self.last_result = f"Error executing action: {e}"
+        return True
+
+    async def _fill(self, sel, arg, val):
+        page = self.page
+        filled = False
+
+        if sel:
+            try:
+                loc = page.locator(sel)
+                count = 0
+                try:
+                    count = await loc.count()
+                except Exception:
+                    count = 1
+
+                if count > 1 and _is_generic_selector(sel):
+                    raise RuntimeError(
+                        f"Ambiguous selector '{sel}'. Refine with aria-label or role+name "
+                        f"(e.g., [aria-label='Project description'] or textbox name=/project name/i)."
+                    )
+
+                if count == 0:
+                    dlg = await _visible_dialog(page)
+                    if dlg:
+                        loc = dlg.locator(sel)
+                        try:
+                            count = await loc.count()
+                        except Exception:
+                            count = 0
+
+                self._rung()
+                if count > 1 and len(val) >= LONG_TEXT_THRESHOLD:
+                    t = await _prefer_desc_textbox(page)
+                    if t:
+                        await t.fill(val)
+                        self.last_result = f"Filled desc-like textbox with '{val[:30]}...'"
+                        return
+                    await loc.first.fill(val)
+                    self.last_result = f"Filled first of multi-match {sel} with '{val[:30]}...'"
+                    return
+
+                if count >= 1:
+                    el = loc.first
+                    await el.wait_for(state="visible", timeout=self._remaining_ms())
+                    self._rung()
+
+                    current = _normalize_text(await _read_text_like_from_locator(el))
+                    target = _normalize_text(val)
+                    if current and target and current == target:
+                        self.last_result = f"Skipped fill for {sel}: already set."
+                        return
+
+                    is_contenteditable = False
+                    try:
+                        ce = await el.get_attribute("contenteditable")
+                        is_contenteditable = ce in ("", "true")
+                    except Exception:
+                        pass
+
+                    if is_contenteditable:
+                        await el.click()
+                        mod = "Meta" if sys.platform == "darwin" else "Control"
+                        await page.keyboard.press(f"{mod}+A")
+                        await page.keyboard.press("Backspace")
+                        await el.type(val)
+                    else:
+                        try:
+                            await el.fill(val)
+                        except Exception:
+                            await el.click()
+                            await el.type(val)
+
+                    preview = (val[:30] + "...") if len(val) > 30 else val
+                    self.last_result = f"Filled {sel} with '{preview}'"
+                    filled = True
+            except Exception:
+                pass
+
+        if not filled:
+            self._rung()
+            dlg = await _visible_dialog(page)
+            root = dlg if dlg else page
+
+            if len(val) >= LONG_TEXT_THRESHOLD:
+                t = root.get_by_role("textbox", name=re.compile(r"(description|summary)", re.I))
+                if await t.count() > 0:
+                    await t.first.fill(val)
+                    self.last_result = f"Filled description textbox with '{val[:30]}...'"
+                    filled = True
+                else:
+                    t = root.locator('[aria-label="Project description"], [aria-label*="description" i], [aria-label*="summary" i]')
+                    if await t.count() > 0:
+                        await t.first.fill(val)
+                        self.last_result = f"Filled aria description with '{val[:30]}...'"
+                        filled = True
+            else:
+                t = root.get_by_role("textbox", name=re.compile(r"(project name|name)", re.I))
+                if await t.count() > 0:
+                    await t.first.fill(val)
+                    self.last_result = f"Filled name textbox with '{val[:30]}...'"
+                    filled = True
+                else:
+                    t = root.locator('[aria-label="Project name"], [aria-label*="name" i]')
+                    if await t.count() > 0:
+                        await t.first.fill(val)
+                        self.last_result = f"Filled aria name with '{val[:30]}...'"
+                        filled = True
+
+        if not filled:
+            raise RuntimeError(f"Could not fill any field using selector='{sel}' arg='{arg}'")
+
+    async def execute_action(self, action):
+        """BrowserAgent.execute_action: one learned timeout budget shared by the whole ladder."""
+        kind = action.get("action")
+        domain = app_domain(self.page.url)
+        self._deadline = self.timeouts.deadline(domain, kind)
+        self._rung()
+        self._resolution = None
+        started = time.monotonic()
+        if self.profiler:
+            self.profiler.begin_action()
+        with span("action", kind=kind) as attrs:
+            try:
+                keep_going = await self._execute_marked(action) if action.get("element_id") is not None else None
+                if keep_going is None:
+                    keep_going = await self._execute(action)
+            finally:
+                self.page.set_default_timeout(self.default_timeout_ms)
+                if self.profiler:
+                    attrs["pw"] = self.profiler.end_action()
+            attrs["ok"] = ok = not _step_failed(self.last_result)
+            self.timeouts.observe(domain, kind, (time.monotonic() - started) * 1000, ok=ok)
+            if self._resolution:
+                attrs["strategy"] = self._resolution[0]
+        return keep_going
+
+    @traced("action.ladder")
+    async def _execute(self, action):
+        try:
+            kind = action.get("action")
+            engine = action.get("_selector_engine", "locator")
+            sel = (action.get("_normalized_selector") or action.get("selector") or "").strip()
+            arg = action.get("_get_by_arg")
+            val = action.get("value", "")
+            sel = _normalize_nav_selector(sel)
+            lowered = (sel or "").lower()
+
+            if kind == "click":
+                return await self._click_learned(sel, engine, arg, lowered)
+
+            elif kind == "fill":
+                await self._fill(sel, arg, val)
+
+            elif kind == "press":
+                await self.page.keyboard.press(val or "Enter")
+                self.last_result = f"Pressed key {val or 'Enter'}"
+
+            elif kind == "navigate":
+                await self.page.goto(val)
+                self.last_result = f"Navigated to {val}"
+
+            elif kind == "done":
+                self.last_result = "Task completed."
+                return False
+
+            return True
+
+        except PwTimeout as e:
+            self.last_result = f"Timeout: {e}"
+            return True
+        except Exception as e:
+            self.last_result = f"Error executing action: {e}"
+            return True
+
+    async def execute_plan(self, steps, on_step=None):
+        """Async BrowserAgent.execute_plan; on_step may be a plain function or a coroutine function."""
+        lines, reason, keep_going, executed = [], None, True, 0
+        for i, step in enumerate(steps):
+            url_before = self.page.url
+            keep_going = await self.execute_action(step)
+            executed += 1
+            lines.append(f"{i + 1}. {self.last_result}")
+            if keep_going:
+                await self.settle()
+            if on_step:
+                res = on_step(i, step)
+                if asyncio.iscoroutine(res):
+                    await res
+            if not keep_going:
+                break
+            if _step_failed(self.last_result):
+                reason = "step failed"
+                break
+            expect = step.get("expect") or {}
+            unmet = await _check_expect(self.page, expect) if expect else None
+            if unmet:
+                reason = f"postcondition not met ({unmet})"
+                break
+            if self.page.url != url_before and step.get("action") != "navigate" and "url" not in expect:
+                reason = f"page navigated to {self.page.url}"
+                break
+        self.last_result = _plan_summary(lines, executed, len(steps), reason)
+        return keep_going, executed
+
+    async def screenshot(self, path):
+        await self.page.screenshot(path=path)
+
+    async def focus_boxes(self) -> list:
+        try:
+            snap = await dom_probe.probe_async(self.page, light=True)
+        except Exception:
+            return []
+        return [x["box"] for x in snap.get("dialogs", []) + snap.get("popups", [])]
+
+    async def capture_screenshot(self, quality=70) -> bytes:
+        return await self.page.screenshot(type="jpeg", quality=quality, scale="css")
+
+    async def close(self):
+        if self.profiler:
+            self.profiler.close()
+        try:
+            self.timeouts.save()
+        except OSError:
+            pass
+        try:
+            await self.context.close()
+        finally:
+            if self._on_close:
+                self._on_close()
+                self._on_close = None
@@ -0,0 +1,150 @@
+# batch_runner.py
+"""
+Batch entry point: stream task specs from a JSONL file and fan them out to a
+pool of browser worker processes, each running main.run_agent.
+
+Each line is a JSON object:
+  {"app_url": "https://linear.app/", "app_name": "linear", "user_task": "...",
+   "inputs": {"auth.email": "me@example.com"},   # optional, pre-seeds prompts
+   "idempotent": true}                             # optional, allows replaying side-effect steps
+
+Lines without app_url/user_task (e.g. comments or unrelated records) are
+reported as "skipped". Worker processes have no terminal, so credentials that
+a task needs must be supplied through "inputs"; otherwise that task errors.
+
+    python batch_runner.py tasks.jsonl --workers 4 --results batch_results.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from token_usage import aggregate, format_usage
+
+
+def iter_task_specs(path):
+    """Yield (line_no, spec_or_None, error_or_None) without loading the whole file."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                spec = json.loads(line)
+            except Exception as e:
+                yield line_no, None, f"invalid JSON: {e}"
+                continue
+            if not isinstance(spec, dict) or not spec.get("app_url") or not spec.get("user_task"):
+                yield line_no, None, "missing app_url/user_task"
+                continue
+            yield line_no, spec, None
+
+
+def _error_result(line_no, spec, e, started):
+    return {
+        "line": line_no,
+        "app_name": spec.get("app_name"),
+        "status": "error",
+        "error": f"{type(e).__name__}: {e}",
+        "steps": 0,
+        "duration_s": round(time.monotonic() - started, 3),
+    }
+
+
+def _run_one(line_no, spec, headless):
+    # Imported here so the parent process never starts Playwright.
+    from main import run_agent
+    from user_input_manager import UserInputManager
+
+    started = time.monotonic()
+    try:
+        summary = run_agent(
+            spec["app_url"],
+            spec.get("app_name") or spec["app_url"],
+            spec["user_task"],
+            headless=headless,
+            inputs=UserInputManager(preset=spec.get("inputs")),
+            idempotent=bool(spec.get("idempotent")),
+        )
+    except Exception as e:  # EOFError from a prompt, Playwright errors, ...
+        return _error_result(line_no, spec, e, started)
+    return {"line": line_no, **summary}
+
+
+def run_batch(path, workers=2, headless=True, results_path=None, max_pending=None):
+    """
+    Run every task in `path` across `workers` processes. At most `max_pending`
+    tasks (default 2 * workers) are submitted ahead, so huge files stream.
+    Returns the list of per-task result dicts in completion order. A task
+    whose worker died is reported as an error; a broken pool is replaced and
+    the batch goes on.
+    """
+    max_pending = max_pending or 2 * workers
+    results = []
+    out = open(results_path, "a", encoding="utf-8") if results_path else None
+
+    def _report(res):
+        results.append(res)
+        print(f"[line {res['line']}] {res['status']:<8} steps={res.get('steps', 0):<3} "
+              f"{res.get('duration_s', 0):>8.1f}s  {res.get('app_name') or ''} {res.get('error', '')}".rstrip())
+        if out:
+            out.write(json.dumps(res, ensure_ascii=False) + "\n")
+            out.flush()
+
+    def _collect(futures):
+        for fut in futures:
+            line_no, spec, started = pending.pop(fut)
+            try:
+                res = fut.result()
+            except Exception as e:  # BrokenProcessPool when a worker dies, unpicklable results, ...
+                res = _error_result(line_no, spec, e, started)
+            _report(res)
+
+    pending = {}  # future -> (line_no, spec, submitted at)
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        for line_no, spec, err in iter_task_specs(path):
+            if err:
+                _report({"line": line_no, "status": "skipped", "error": err, "steps": 0, "duration_s": 0.0})
+                continue
+            try:
+                fut = pool.submit(_run_one, line_no, spec, headless)
+            except BrokenProcessPool:  # its pending tasks have already failed; start a fresh pool
+                pool.shutdown(wait=False)
+                pool = ProcessPoolExecutor(max_workers=workers)
+                fut = pool.submit(_run_one, line_no, spec, headless)
+            pending[fut] = (line_no, spec, time.monotonic())
+            if len(pending) >= max_pending:
+                _collect(wait(pending, return_when=FIRST_COMPLETED).done)
+        _collect(wait(pending).done)
+    finally:
+        pool.shutdown()
+        if out:
+            out.close()
+
+    by_status = {}
+    for r in results:
+        by_status[r["status"]] = by_status.get(r["status"], 0) + 1
+    print("Batch summary: " + ", ".join(f"{k}={v}" for k, v in sorted(by_status.items())))
+    usage = aggregate([r.get("usage") for r in results], succeeded=by_status.get("done", 0))
+    print("Batch usage: " + format_usage(usage))
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run agent tasks from a JSONL file across worker processes.")
+    ap.add_argument("tasks", help="JSONL file with app_url, app_name, user_task per line")
+    ap.add_argument("--workers", type=int, default=int(os.getenv("BATCH_WORKERS", "2")))
+    ap.add_argument("--results", default=None, help="append per-task results as JSONL to this file")
+    ap.add_argument("--headed", action="store_true", help="show browser windows")
+    args = ap.parse_args(argv)
+
+    results = run_batch(args.tasks, workers=args.workers, headless=not args.headed, results_path=args.results)
+    return 0 if all(r["status"] in ("done", "skipped") for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
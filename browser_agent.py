@@ -5,22 +5,35 @@ import sys
 import time
 from collections import deque
 
-
+import dom_probe
+from marks import MARK_ACTION_TIMEOUT_MS, OBS_MARKS, ElementRegistry, mark_elements, mark_selector, with_marks
+from observation import build_observation, DEFAULT_TOKEN_BUDGET
+from preflight import PREFLIGHT, feedback, preflight, verdict
+from pw_profiler import PW_PROFILE, Profiler, profiled
+from selector_cache import CACHED_CLICK_TIMEOUT_MS, app_domain, get_selector_cache
+from settle import NetworkTracker, SETTLE_CAP_MS, SETTLE_QUIET_MS, settle
+from timeout_budget import Deadline, get_timeout_budgets
+from tracing import span, traced
+
+
+@traced("probe.dialog_is_open")
 def _dialog_is_open(page) -> bool:
-    return bool(_visible_dialog(page))
+    return dom_probe.dialog_open(dom_probe.probe(page, light=True))
 
 
 
 
+@traced("probe.ensure_no_popover")
 def _ensure_no_popover(page):
     if _popup_is_open(page):
         try:
             page.keyboard.press("Escape")
-            time.sleep(0.05)
+            settle(page, quiet_ms=50, cap_ms=300)
         except Exception:
             pass
 
 
+@traced("ladder.open_property_chip")
 def _open_property_chip(page, label_regex: str) -> bool:
     """
     Open a property picker (e.g., Status, Priority) inside the *currently visible* dialog.
@@ -31,14 +44,16 @@ def _open_property_chip(page, label_regex: str) -> bool:
     3) Fallbacks: role=button/combobox by accessible name; then row by text + button.
     4) Last resort: if only the *current value* is visible (e.g., Backlog/No priority),
        click that chip but still treat it as the property opener.
+
+    Steps 2-4 are ranked from one dom_probe snapshot instead of per-candidate counts.
     """
-    dlg = _visible_dialog(page)
-    if not dlg:
+    snap = dom_probe.probe(page)
+    if not dom_probe.dialog_open(snap):
         return False
 
-    _ensure_no_popover(page)
-
-    pat = re.compile(label_regex, re.I)
+    if dom_probe.popup_open(snap):
+        _ensure_no_popover(page)
+        snap = dom_probe.probe(page)
 
     def _click_and_wait(opener) -> bool:
         try:
@@ -62,40 +77,14 @@ def _open_property_chip(page, label_regex: str) -> bool:
             pass
         return False
 
-    try:
-        rows = dlg.get_by_role("group", name=pat)
-        if not rows.count():
-            rows = dlg.get_by_role("region", name=pat)
-        if rows.count():
-            row = rows.first
-            for q in ("role=combobox", "role=button"):
-                ctl = row.locator(q)
-                if ctl.count():
-                    if _click_and_wait(ctl.first):
-                        return True
-            btn = row.locator("button")
-            if btn.count() and _click_and_wait(btn.first):
-                return True
-    except Exception:
-        pass
-
-    try:
-        cmb = dlg.get_by_role("combobox", name=pat)
-        if cmb.count() and _click_and_wait(cmb.first):
-            return True
-    except Exception:
-        pass
-    try:
-        btn = dlg.get_by_role("button", name=pat)
-        if btn.count() and _click_and_wait(btn.first):
+    for chip in dom_probe.property_openers(snap, label_regex):
+        if _click_and_wait(dom_probe.probe_locator(page, chip["id"])):
             return True
-    except Exception:
-        pass
 
+    # Label text that is not exposed as a group/region name (plain row layouts).
     try:
-        container = dlg.locator(f'[role="group"]:has-text(/{label_regex}/i), [role="region"]:has-text(/{label_regex}/i)')
-        if not container.count():
-            container = dlg.locator(f':has-text(/{label_regex}/i)')
+        dlg = page.get_by_role("dialog")
+        container = dlg.locator(f':has-text(/{label_regex}/i)')
         if container.count():
             row = container.first
             for css in ("[role=combobox]", "button", "[role=button]"):
@@ -105,23 +94,6 @@ def _open_property_chip(page, label_regex: str) -> bool:
     except Exception:
         pass
 
-    try:
-        value_patterns = []
-        if re.search(r"status", label_regex, re.I):
-            value_patterns = [r"Backlog", r"Planned", r"In\s*Progress", r"Completed", r"Canceled|Cancelled"]
-        elif re.search(r"priority", label_regex, re.I):
-            value_patterns = [r"No\s*priority", r"Low", r"Medium", r"High", r"Urgent"]
-
-        for vp in value_patterns:
-            chip = dlg.get_by_role("button", name=re.compile(vp, re.I))
-            if not chip.count():
-                chip = dlg.locator(f'button:has-text(/{vp}/i)')
-            if chip.count() and _click_and_wait(chip.first):
-                return True
-    except Exception:
-        pass
-
-    
     return False
 
 
@@ -133,6 +105,7 @@ CHIP_LABEL_HINTS = [
 ]
 
 
+@traced("ladder.open_chip_generic")
 def _open_chip_generic(page, sel: str) -> bool:
     name_pat, _ = _extract_role_name(sel)
     if name_pat and _open_property_chip(page, name_pat):
@@ -169,40 +142,17 @@ def _parse_value_from_selector(sel: str) -> str | None:
         return (m.group(1) or m.group(2) or m.group(3)).strip().strip('"').strip("'")
     return None
 
+@traced("probe.any_chip_has_value")
 def _any_chip_has_value(page, desired_regex: str) -> bool:
     """
     Generic: scan all dialog chip/buttons and see if any already show desired_regex.
     Works even if we don't know which property (Status/Priority/etc.).
     """
-    dlg = _visible_dialog(page)
-    if not dlg:
-        return False
-    try:
-        btns = dlg.get_by_role("button")
-        n = btns.count()
-        for i in range(min(n, 20)): 
-            try:
-                txt = _normalize_text(btns.nth(i).inner_text() or "")
-                if txt and re.search(desired_regex, txt, re.I):
-                    return True
-            except Exception:
-                pass
-    except Exception:
-        pass
-    return False
+    return dom_probe.any_chip_has_value(dom_probe.probe(page), desired_regex)
 
+@traced("probe.popup_is_open")
 def _popup_is_open(page) -> bool:
-    try:
-        if page.get_by_role("menu").count() > 0:
-            return True
-    except Exception:
-        pass
-    try:
-        if page.get_by_role("listbox").count() > 0:
-            return True
-    except Exception:
-        pass
-    return False
+    return dom_probe.popup_open(dom_probe.probe(page, light=True))
 
 
 def _extract_role_name(sel: str) -> tuple[str|None, bool]:
@@ -232,6 +182,7 @@ def _read_text_like_from_locator(loc) -> str:
 
 LONG_TEXT_THRESHOLD = 40  
 
+@traced("probe.prefer_desc_textbox")
 def _prefer_desc_textbox(page):
     try:
         loc = page.get_by_role("textbox", name=re.compile(r"(description|summary)", re.I))
@@ -252,6 +203,7 @@ def _is_dialog_scoped(sel: str) -> bool:
     s = (sel or "").lower()
     return ("role=dialog" in s) or (">>" in s)
 
+@traced("probe.visible_dialog")
 def _visible_dialog(page):
     try:
         dlg = page.get_by_role("dialog")
@@ -262,27 +214,20 @@ def _visible_dialog(page):
 def _normalize_text(s: str) -> str:
     return " ".join((s or "").split()).strip()
 
+@traced("probe.find_chip_in_dialog")
 def _find_chip_in_dialog(page, prop_regex: str):
     """
     Return (chip_button_locator, inner_text) for a chip whose accessible name or visible text
     matches prop_regex (case-insensitive), or (None, "") if not found.
     """
-    dlg = _visible_dialog(page)
-    if not dlg:
+    snap = dom_probe.probe(page)
+    if not dom_probe.dialog_open(snap):
         return None, ""
+    chip = dom_probe.find_chip(snap, prop_regex)
+    if chip:
+        return dom_probe.probe_locator(page, chip["id"]), chip["text"]
     try:
-        btn = dlg.get_by_role("button", name=re.compile(prop_regex, re.I))
-        if btn.count():
-            return btn.first, (btn.first.inner_text() or "")
-    except Exception:
-        pass
-    try:
-        btn = dlg.locator(f'button:has-text(/\\b{prop_regex}\\b/i)')
-        if btn.count():
-            return btn.first, (btn.first.inner_text() or "")
-    except Exception:
-        pass
-    try:
+        dlg = page.get_by_role("dialog")
         el = dlg.get_by_text(re.compile(prop_regex, re.I))
         if el.count():
             return el.first, (el.first.inner_text() or "")
@@ -294,10 +239,6 @@ def _chip_text_in_dialog(page, prop_regex: str) -> str:
     btn, txt = _find_chip_in_dialog(page, prop_regex)
     if not btn:
         return ""
-    try:
-        txt = btn.inner_text() or txt
-    except Exception:
-        pass
     return _normalize_text(txt)
 
 def _chip_has_value(page, prop_regex: str, desired_value_regex: str) -> bool:
@@ -305,36 +246,24 @@ def _chip_has_value(page, prop_regex: str, desired_value_regex: str) -> bool:
     return bool(txt and re.search(desired_value_regex, txt, re.I))
 
 
+@traced("ladder.click_chip_in_dialog")
 def _click_chip_in_dialog(page, text_val: str) -> bool:
-    dlg = _visible_dialog(page)
-    if not dlg: return False
-    try:
-        btn = dlg.get_by_role("button", name=re.compile(re.escape(text_val), re.I))
-        if btn.count():
-            btn.first.click()
-            _wait_any_popup(page, timeout=1500)
-            return True
-    except Exception:
-        pass
-    try:
-        btn = dlg.locator(f'button:has-text("{text_val}")')
-        if btn.count():
-            btn.first.click()
-            _wait_any_popup(page, timeout=1500)
-            return True
-    except Exception:
-        pass
+    snap = dom_probe.probe(page, text=text_val)
+    if not dom_probe.dialog_open(snap): return False
+    chip = dom_probe.find_chip(snap, re.escape(text_val))
+    hits = [h for h in snap["text_hits"] if h["in_dialog"]]
+    target = chip or (hits[0] if hits else None)
+    if not target:
+        return False
     try:
-        el = dlg.get_by_text(text_val, exact=False)
-        if el.count():
-            el.first.click()
-            _wait_any_popup(page, timeout=1500)
-            return True
+        dom_probe.probe_locator(page, target["id"]).click()
+        _wait_any_popup(page, timeout=1500)
+        return True
     except Exception:
-        pass
-    return False
+        return False
 
 
+@traced("ladder.wait_any_popup")
 def _wait_any_popup(page, timeout=4000) -> bool:
     """
     Wait briefly for dropdown popover (menu/listbox). Returns True if visible.
@@ -360,13 +289,13 @@ def _wait_any_popup(page, timeout=4000) -> bool:
 
 
 
+@traced("ladder.select_from_popup")
 def _select_from_popup(page, value: str) -> bool:
     """
     Selects an item from the currently-open popup (menu/listbox) regardless of
     role differences (menuitemradio/menuitem/option), virtualization, or filters.
+    Candidates are ranked from a single dom_probe snapshot.
     """
-    pat = re.compile(re.escape(value), re.I)
-
     def _try_click(loc) -> bool:
         try:
             if loc.count():
@@ -389,89 +318,39 @@ def _select_from_popup(page, value: str) -> bool:
     except Exception:
         return False
 
-    for role in ("menu", "listbox"):
-        try:
-            cnt = page.get_by_role(role)
-            if not cnt.count():
-                continue
-            for item_role in ("menuitemradio", "menuitem", "option"):
-                loc = cnt.get_by_role(item_role, name=pat)
-                if _try_click(loc):
-                    return True
-            loc = cnt.get_by_text(value, exact=False)
-            if _try_click(loc):
-                return True
-        except Exception:
-            pass
+    snap = dom_probe.probe(page, text=value)
 
-    try:
-        pop = page.locator('[data-animated-popover-content]')
-        if pop.count():
-            for item_role in ("menuitemradio", "menuitem", "option"):
-                loc = pop.get_by_role(item_role, name=pat)
-                if _try_click(loc):
-                    return True
-            loc = pop.get_by_text(value, exact=False)
-            if _try_click(loc):
-                return True
-    except Exception:
-        pass
+    for cand in dom_probe.popup_item_candidates(snap, value, scope="popup"):
+        if _try_click(dom_probe.probe_locator(page, cand["id"])):
+            return True
 
-    try:
-        filt = page.locator('[role="menu"] input,[role="listbox"] input,[data-animated-popover-content] input').first
-        if filt.count():
+    if any(p["has_filter"] for p in snap["popups"]):
+        try:
+            filt = page.locator('[role="menu"] input,[role="listbox"] input,[data-animated-popover-content] input').first
             try:
                 filt.fill(value)
             except Exception:
                 filt.type(value)
-            try:
-                page.keyboard.press("Enter")
-                return True
-            except Exception:
-                pass
-    except Exception:
-        pass
-
-    for item_role in ("menuitemradio", "menuitem", "option"):
-        try:
-            loc = page.get_by_role(item_role, name=pat)
-            if _try_click(loc):
-                return True
+            page.keyboard.press("Enter")
+            return True
         except Exception:
             pass
 
+    for cand in dom_probe.popup_item_candidates(snap, value, scope="page"):
+        if _try_click(dom_probe.probe_locator(page, cand["id"])):
+            return True
+
     try:
         loc = page.get_by_text(value, exact=False)
         if _try_click(loc):
             return True
     except Exception:
         pass
-
-    try:
-        for role_parent, role_item in (("menu","menuitem"),
-                                       ("menu","menuitemradio"),
-                                       ("listbox","option")):
-            parent = page.get_by_role(role_parent)
-            if parent.count():
-                item = parent.get_by_role(role_item, name=re.compile(re.escape(value), re.I))
-                if item.count():
-                    item.first.click()
-                    return True
-        dlg = _visible_dialog(page)
-        if dlg:
-            el = dlg.get_by_text(re.compile(re.escape(value), re.I))
-            if el.count():
-                el.first.click()
-                return True
-    except Exception:
-        pass
     return False
 
 
 
 
-    
-
 def _is_generic_selector(sel: str) -> bool:
     s = (sel or "").strip().lower()
     generics = (
@@ -486,6 +365,7 @@ def _is_generic_selector(sel: str) -> bool:
 
 
 
+@traced("probe.top_dialog_name")
 def _top_dialog_name(page) -> str:
             try:
                 d = page.get_by_role("dialog")
@@ -533,6 +413,74 @@ def _normalize_nav_selector(sel: str) -> str:
     return sel
 
 
+def _ladder_can_rescue(sel: str, engine: str, dialog_open: bool) -> bool:
+    """True when a click-ladder rung can succeed even though `sel` itself matches nothing visible."""
+    if engine == "get_by_text":
+        return False
+    lowered = sel.lower()
+    if any(r in lowered for r in ("role=menuitem", "role=option", "menuitemradio")) and _parse_value_from_selector(sel):
+        return True
+    if _is_dialog_scoped(sel):
+        return True
+    return dialog_open and bool(_extract_role_name(sel)[0] or any(re.search(h, sel, re.I) for h in CHIP_LABEL_HINTS))
+
+
+def _preflight_reason(report: dict, sel: str, engine: str, arg) -> str | None:
+    wanted = arg if engine == "get_by_text" else _parse_value_from_selector(sel)
+    return verdict(report, wanted, _ladder_can_rescue(sel, engine, bool(report.get("dialog_open"))))
+
+
+PLAN_EXPECT_TIMEOUT_MS = 2000
+
+
+def _step_failed(result: str) -> bool:
+    return "Error" in (result or "") or "Timeout" in (result or "")
+
+
+def _expect_label(key, want) -> str:
+    return f"{key}={want!r}"
+
+
+@traced("plan.check_expect")
+def _check_expect(page, expect: dict, timeout_ms: int = PLAN_EXPECT_TIMEOUT_MS) -> str | None:
+    """
+    Wait up to timeout_ms (shared by all keys) for a plan step's postcondition:
+      visible/hidden: selector state   text: visible text   url: regex on page.url
+      dialog/popup: open (true) or closed (false)
+    Returns the first unmet condition, or None when all hold. Unknown keys are ignored.
+    """
+    deadline = time.monotonic() + timeout_ms / 1000.0
+
+    def remaining() -> int:
+        return max(int((deadline - time.monotonic()) * 1000), 1)
+
+    for key, want in (expect or {}).items():
+        try:
+            if key in ("visible", "hidden"):
+                page.locator(want).first.wait_for(state=key, timeout=remaining())
+            elif key == "text":
+                page.get_by_text(str(want), exact=False).first.wait_for(state="visible", timeout=remaining())
+            elif key == "url":
+                page.wait_for_url(re.compile(want), timeout=remaining())
+            elif key in ("dialog", "popup"):
+                is_open = _dialog_is_open if key == "dialog" else _popup_is_open
+                while is_open(page) != bool(want):
+                    if time.monotonic() >= deadline:
+                        return _expect_label(key, want)
+                    settle(page, quiet_ms=50, cap_ms=min(remaining(), 300))
+        except Exception:
+            return _expect_label(key, want)
+    return None
+
+
+def _plan_summary(lines: list, executed: int, total: int, reason: str | None) -> str:
+    if reason:
+        lines.append(f"Plan stopped after step {executed} of {total}: {reason}. Re-plan from the current page.")
+    else:
+        lines.append(f"Plan complete: all {total} steps executed.")
+    return "\n".join(lines)
+
+
 
 class BrowserAgent:
     def __init__(self, headless=False, default_timeout_ms=15000):
@@ -540,8 +488,20 @@ class BrowserAgent:
         self.browser = self.playwright.chromium.launch(headless=headless)
         self.page = self.browser.new_page()
         self.page.set_default_timeout(default_timeout_ms)
+        self.default_timeout_ms = default_timeout_ms
         self.last_result = "Browser initialized."
         self._recent_clicks = deque(maxlen=100)  
+        self.selector_cache = get_selector_cache()
+        self.selector_stats = {"hits": 0, "misses": 0, "invalidated": 0}
+        self._resolution = None
+        self.network = NetworkTracker().attach(self.page)
+        self.timeouts = get_timeout_budgets()
+        self._deadline = Deadline(default_timeout_ms)
+        self.preflight_stats = {"checked": 0, "rejected": 0, "early": 0}
+        self.marks = ElementRegistry()
+        self._prepared = None  # ((sel, engine, arg), preflight report) from prepare_action
+        self.profiler = Profiler() if PW_PROFILE else None
+        self.page = profiled(self.page, self.profiler)  # after NetworkTracker: listeners stay on the raw page
 
 
     def click_menu_item(self, text_regex: str = ".*") -> bool:
@@ -556,8 +516,17 @@ class BrowserAgent:
             pass
         return False
 
-    def _wait_visible(self, sel, timeout=15000):
-        self.page.wait_for_selector(sel, state="visible", timeout=timeout)
+    def _remaining_ms(self) -> int:
+        """What is left of the current action's timeout budget (shared by all ladder rungs)."""
+        return self._deadline.remaining_ms()
+
+    def _rung(self):
+        """Untimed Playwright calls in the next ladder rung get what is left of the budget, not all of it."""
+        self.page.set_default_timeout(self._remaining_ms())
+
+    @traced("ladder.wait_visible")
+    def _wait_visible(self, sel, timeout=None):
+        self.page.wait_for_selector(sel, state="visible", timeout=timeout or self._remaining_ms())
     
     def navigate(self, url):
         self.page.goto(url)
@@ -569,6 +538,23 @@ class BrowserAgent:
         except Exception:
             return ""
 
+    def get_observation(self, token_budget=DEFAULT_TOKEN_BUDGET, tracker=None):
+        """
+        Token-budgeted accessibility-tree view (dialog/popup first) for the planner.
+        With an observation.ObservationTracker, returns a diff against the previous step when possible.
+        With OBS_MARKS=1 the interactable elements are tagged first and listed by ID (see marks.py).
+        """
+        self._prepared = None
+        text = build_observation(self.page, token_budget, tracker)
+        if OBS_MARKS:
+            self.marks = mark_elements(self.page)
+            text = with_marks(text, self.marks)
+        return text
+
+    def settle(self, quiet_ms=SETTLE_QUIET_MS, cap_ms=SETTLE_CAP_MS) -> dict:
+        """Return once the DOM is quiet and the network idle (at most cap_ms); see settle.py."""
+        return settle(self.page, quiet_ms, cap_ms, self.network)
+
     def _should_debounce(self, sel: str, window_s: float = 2.0) -> bool:
         """
         Prevents tight loops clicking the exact same selector when state isn't changing.
@@ -586,7 +572,179 @@ class BrowserAgent:
     
     
 
+    def _resolved(self, strategy: str, target: str):
+        """Remember which ladder rung handled the current click (learned into selector_cache)."""
+        self._resolution = (strategy, target)
+
+    @traced("ladder.cached")
+    def _click_cached(self, strategy: str, target: str) -> bool:
+        """Replay a learned resolution with a short timeout; False means fall back to the ladder."""
+        page, t = self.page, min(CACHED_CLICK_TIMEOUT_MS, self._remaining_ms())
+        try:
+            if strategy == "locator":
+                page.locator(target).first.click(timeout=t)
+            elif strategy == "text":
+                page.get_by_text(target, exact=False).first.click(timeout=t)
+            elif strategy == "popup_select":
+                if _any_chip_has_value(page, re.escape(target)):
+                    self.last_result = f"Skipped selecting '{target}': already set."
+                    return True
+                if not _select_from_popup(page, target):
+                    return False
+            elif strategy == "chip_open":
+                if not (_visible_dialog(page) and not _popup_is_open(page) and _open_chip_generic(page, target)):
+                    return False
+            elif strategy == "dialog_chip":
+                if not _click_chip_in_dialog(page, target):
+                    return False
+            else:
+                dlg = _visible_dialog(page)
+                if not dlg:
+                    return False
+                if strategy == "dialog_locator":
+                    dlg.locator(target).first.click(timeout=t)
+                elif strategy == "dialog_button":
+                    dlg.get_by_role("button", name=re.compile(re.escape(target), re.I)).first.click(timeout=t)
+                elif strategy == "dialog_button_text":
+                    dlg.locator(f'button:has-text("{target}")').first.click(timeout=t)
+                elif strategy == "dialog_text":
+                    dlg.get_by_text(target, exact=False).first.click(timeout=t)
+                else:
+                    return False
+        except Exception:
+            return False
+        self.last_result = f"Clicked {target} (learned {strategy})"
+        return True
+
     def execute_action(self, action):
+        """
+        Run one action within a timeout budget learned for this app and action
+        kind (see timeout_budget); every wait in the fallback ladder draws from
+        the same deadline, and successful actions feed the latency history.
+        """
+        kind = action.get("action")
+        domain = app_domain(self.page.url)
+        self._deadline = self.timeouts.deadline(domain, kind)
+        self._rung()
+        self._resolution = None
+        started = time.monotonic()
+        if self.profiler:
+            self.profiler.begin_action()
+        with span("action", kind=kind) as attrs:
+            try:
+                keep_going = self._execute_marked(action) if action.get("element_id") is not None else None
+                if keep_going is None:
+                    keep_going = self._execute_learned(action, domain)
+            finally:
+                self.page.set_default_timeout(self.default_timeout_ms)
+                if self.profiler:
+                    attrs["pw"] = self.profiler.end_action()
+            attrs["ok"] = ok = not _step_failed(self.last_result)
+            self.timeouts.observe(domain, kind, (time.monotonic() - started) * 1000, ok=ok)
+            if self._resolution:
+                attrs["strategy"] = self._resolution[0]
+        return keep_going
+
+    @traced("action.marked")
+    def _execute_marked(self, action):
+        """
+        Click/fill the set-of-marks element named by action["element_id"]: one
+        registry lookup, one Playwright call. Returns None to fall back to the
+        selector path when the element is gone and the planner also gave a selector.
+        """
+        kind, element_id = action.get("action"), action["element_id"]
+        if kind not in ("click", "fill"):
+            return None
+        entry = self.marks.get(element_id)
+        error = f"element [{element_id}] is not in the current element list"
+        if entry:
+            loc = self.page.locator(mark_selector(element_id))
+            t = min(MARK_ACTION_TIMEOUT_MS, self._remaining_ms())
+            try:
+                if kind == "click":
+                    loc.click(timeout=t)
+                else:
+                    loc.fill(action.get("value", ""), timeout=t)
+                if not action.get("selector"):  # what trajectories and guards key on
+                    action["selector"] = action["_normalized_selector"] = self.marks.role_selector(element_id)
+                verb = "Clicked" if kind == "click" else f"Filled '{action.get('value', '')[:30]}' into"
+                self.last_result = f'{verb} [{element_id}] {entry["role"]} "{entry["name"]}"'
+                return True
+            except Exception as e:
+                error = f"element [{element_id}] {entry['role']} \"{entry['name']}\": {str(e).splitlines()[0]}"
+        if (action.get("selector") or "").strip():
+            return None
+        self.last_result = f"Error: {error}. Pick an element_id from the current list."
+        return True
+
+    @traced("action.preflight")
+    def _preflight_rejects(self, sel: str, engine: str, arg) -> bool:
+        """One-round-trip selector check (see preflight); a rejection goes straight back to the planner."""
+        if not PREFLIGHT:
+            return False
+        self.preflight_stats["checked"] += 1
+        report = self._take_prepared(sel, engine, arg) or preflight(self.page, sel, engine, arg)
+        reason = _preflight_reason(report, sel, engine, arg)
+        if not reason:
+            return False
+        self.preflight_stats["rejected"] += 1
+        self.last_result = feedback(sel, reason)
+        return True
+
+    @traced("action.prepare")
+    def prepare_action(self, action):
+        """
+        Early dispatch from the streaming planner (llm_agent on_early): pre-flight
+        the selector and scroll its first visible match into view while the rest
+        of the reply arrives. _preflight_rejects then reuses the report.
+        """
+        if not PREFLIGHT or action.get("element_id") is not None:
+            return
+        sel = _normalize_nav_selector((action.get("_normalized_selector") or action.get("selector") or "").strip())
+        if sel:
+            engine, arg = action.get("_selector_engine", "locator"), action.get("_get_by_arg")
+            self._prepared = ((sel, engine, arg), preflight(self.page, sel, engine, arg, scroll=True))
+
+    def _take_prepared(self, sel: str, engine: str, arg) -> dict | None:
+        prepared, self._prepared = self._prepared, None
+        if prepared and prepared[0] == (sel, engine, arg):
+            self.preflight_stats["early"] += 1
+            return prepared[1]
+        return None
+
+    def _execute_learned(self, action, domain):
+        """
+        Clicks first try the resolution learned for this app + selector (see
+        selector_cache); a miss or a failed cached attempt is pre-flighted and
+        then runs the full ladder in _execute, and a successful rung is stored
+        for next time.
+        """
+        cache = self.selector_cache
+        key = _normalize_nav_selector((action.get("_normalized_selector") or action.get("selector") or "").strip())
+        if not key or action.get("action") != "click":
+            return self._execute(action)
+
+        entry = cache.get(domain, key) if cache else None
+        if entry:
+            if self._click_cached(entry["strategy"], entry["target"]):
+                self.selector_stats["hits"] += 1
+                return True
+            cache.invalidate(domain, key)
+            self.selector_stats["invalidated"] += 1
+        elif cache:
+            self.selector_stats["misses"] += 1
+
+        if self._preflight_rejects(key, action.get("_selector_engine", "locator"), action.get("_get_by_arg")):
+            return True
+
+        self._resolution = None
+        keep_going = self._execute(action)
+        if cache and self._resolution and not _step_failed(self.last_result):
+            cache.put(domain, key, *self._resolution)
+        return keep_going
+
+    @traced("action.ladder")
+    def _execute(self, action):
         
         try:
             kind = action.get("action")
@@ -608,12 +766,10 @@ class BrowserAgent:
                         if _any_chip_has_value(self.page, re.escape(desired)):
                             self.last_result = f"Skipped selecting '{desired}': already set."
                             return True
+                        self._rung()
                         if _select_from_popup(self.page, desired):
-                            time.sleep(0.05)
-                            for _ in range(5):
-                                if not _popup_is_open(self.page):
-                                    break
-                                time.sleep(0.05)
+                            self._resolved("popup_select", desired)
+                            settle(self.page, quiet_ms=50, cap_ms=300)  # let the popup close
                             if _any_chip_has_value(self.page, re.escape(desired)):
                                 self.last_result = f"Selected '{desired}' from popup"
                             else:
@@ -626,9 +782,11 @@ class BrowserAgent:
 
                 if dlg and not dialog_scoped:
                     try:
+                        self._rung()
                         loc = dlg.locator(sel)
                         if loc.count():
                             loc.first.click()
+                            self._resolved("dialog_locator", sel)
                             self.last_result = f"Clicked (scoped to open dialog) {sel}"
                             return True
                     except Exception:
@@ -641,7 +799,9 @@ class BrowserAgent:
                             self.last_result = "Blocked click outside confirmation dialog while edit dialog is open."
                             return True
                         
+                self._rung()
                 if dlg and not _popup_is_open(self.page) and _open_chip_generic(self.page, sel):
+                    self._resolved("chip_open", sel)
                     self.last_result = "Opened chip via dialog-scoped, label-first strategy"
                     return True
 
@@ -652,13 +812,10 @@ class BrowserAgent:
                         if _any_chip_has_value(self.page, re.escape(desired)):
                             self.last_result = f"Skipped selecting '{desired}': already set."
                             return True
+                        self._rung()
                         if _select_from_popup(self.page, desired):
-                            time.sleep(0.05)
-                            ok = True
-                            for _ in range(5):
-                                if not _popup_is_open(self.page):
-                                    break
-                                time.sleep(0.05)
+                            self._resolved("popup_select", desired)
+                            settle(self.page, quiet_ms=50, cap_ms=300)  # let the popup close
                             if _any_chip_has_value(self.page, re.escape(desired)):
                                 self.last_result = f"Selected '{desired}' from popup"
                             else:
@@ -687,12 +844,15 @@ class BrowserAgent:
                     
 
                     if engine == "get_by_text" and arg:
+                        self._rung()
                         el = self.page.get_by_text(arg, exact=False)
-                        (el.first if el.count() else el).wait_for(state="visible", timeout=15000)
+                        (el.first if el.count() else el).wait_for(state="visible", timeout=self._remaining_ms())
                         (el.first if el.count() else el).click()
+                        self._resolved("text", arg)
                         self.last_result = f"Clicked by text: {arg}"
                     else:
                         if ">> text=" in sel and "role=dialog" in sel:
+                            self._rung()
                             try:
                                 left, right = sel.split(">>", 1)
                                 text_val = right.split("text=", 1)[1].strip().strip('"').strip("'")
@@ -701,27 +861,34 @@ class BrowserAgent:
                                     btn = dlg.get_by_role("button", name=re.compile(re.escape(text_val), re.I))
                                     if btn.count() > 0:
                                         btn.first.click()
+                                        self._resolved("dialog_button", text_val)
                                         self.last_result = f"Clicked dialog button matching '{text_val}'"
                                         return True
                                     btn = dlg.locator(f'button:has-text("{text_val}")')
                                     if btn.count() > 0:
                                         btn.first.click()
+                                        self._resolved("dialog_button_text", text_val)
                                         self.last_result = f"Clicked dialog button:has-text('{text_val}')"
                                         return True
                                     el = dlg.get_by_text(text_val, exact=False)
                                     if el.count() > 0:
                                         (el.first if el.count() else el).click()
+                                        self._resolved("dialog_text", text_val)
                                         self.last_result = f"Clicked dialog text '{text_val}' (generic)"
                                         return True
                             except Exception:
                                 pass
                         try:
                             self._wait_visible(sel)
+                            self._rung()
                             self.page.locator(sel).first.click()
+                            self._resolved("locator", sel)
                         except Exception:
                             m = re.search(r'>>\s*text\s*=\s*(?:"([^"]+)"|\'([^\']+)\'|([^\s][^>]*))\s*$', sel, flags=re.I)
                             text_val = (m.group(1) or m.group(2) or m.group(3)).strip() if m else None
+                            self._rung()
                             if text_val and _click_chip_in_dialog(self.page, text_val):
+                                self._resolved("dialog_chip", text_val)
                                 try:
                                     self.page.wait_for_selector('[role="menu"], [role="listbox"]', timeout=1500)
                                 except Exception:
@@ -736,13 +903,16 @@ class BrowserAgent:
                                     self.page.wait_for_selector('[role="menu"], [role="listbox"]', timeout=1500)
                                 except Exception:
                                     pass
+                                self._rung()
                                 for token in ("Backlog", "Status", "Health", "Priority", "Labels", "Start", "Target"):
                                     if token.lower() in sel.lower():
                                         if _click_chip_in_dialog(self.page, token):
+                                            self._resolved("dialog_chip", token)
                                             self.last_result = f"Clicked dialog chip/button '{token}'"
                                             return True
                                         break
 
+                            self._rung()
                             if _is_dialog_scoped(sel):
                                 if _popup_is_open(self.page):
                                     self.last_result = "Popup already open; skipping chip re-click."
@@ -761,8 +931,10 @@ class BrowserAgent:
                                 dlg = _visible_dialog(self.page)
                                 if dlg:
                                     dlg.locator(sel).first.click()
+                                    self._resolved("dialog_locator", sel)
                                 else:
                                     self.page.locator(sel).first.click()
+                                    self._resolved("locator", sel)
 
                         self.last_result = f"Clicked {sel}"
                 except Exception as e:
@@ -797,6 +969,7 @@ class BrowserAgent:
                                 except Exception:
                                     count = 0
 
+                        self._rung()
                         if count > 1 and len(val) >= LONG_TEXT_THRESHOLD:
                             t = _prefer_desc_textbox(self.page)
                             if t:
@@ -809,7 +982,8 @@ class BrowserAgent:
 
                         if count >= 1:
                             el = loc.first
-                            el.wait_for(state="visible", timeout=15000)
+                            el.wait_for(state="visible", timeout=self._remaining_ms())
+                            self._rung()
 
                             current = _normalize_text(_read_text_like_from_locator(el))
                             target  = _normalize_text(val)
@@ -845,6 +1019,7 @@ class BrowserAgent:
                         pass
 
                 if not filled:
+                    self._rung()
                     dlg = _visible_dialog(self.page)
                     root = dlg if dlg else self.page
 
@@ -898,9 +1073,65 @@ class BrowserAgent:
             return True
 
 
+    def execute_plan(self, steps, on_step=None):
+        """
+        Run a planned sequence of actions back to back without re-planning.
+        Stops early when a step fails, its "expect" postcondition does not hold,
+        the page navigates without an expected "url", or a step ends the task.
+        on_step(index, action) runs after each executed step (e.g. screenshots).
+        Returns (keep_going, executed); last_result lists every step's outcome
+        and the stop reason for the planner.
+        """
+        lines, reason, keep_going, executed = [], None, True, 0
+        for i, step in enumerate(steps):
+            url_before = self.page.url
+            keep_going = self.execute_action(step)
+            executed += 1
+            lines.append(f"{i + 1}. {self.last_result}")
+            if keep_going:
+                self.settle()  # screenshot and postcondition see the settled page
+            if on_step:
+                on_step(i, step)
+            if not keep_going:
+                break
+            if _step_failed(self.last_result):
+                reason = "step failed"
+                break
+            expect = step.get("expect") or {}
+            unmet = _check_expect(self.page, expect) if expect else None
+            if unmet:
+                reason = f"postcondition not met ({unmet})"
+                break
+            if self.page.url != url_before and step.get("action") != "navigate" and "url" not in expect:
+                reason = f"page navigated to {self.page.url}"
+                break
+        self.last_result = _plan_summary(lines, executed, len(steps), reason)
+        return keep_going, executed
+
     def screenshot(self, path):
         self.page.screenshot(path=path)
 
+    def focus_boxes(self) -> list:
+        """Boxes of open dialogs/popups (one light dom_probe), for cropping planner screenshots to them."""
+        try:
+            snap = dom_probe.probe(self.page, light=True)
+        except Exception:
+            return []
+        return [x["box"] for x in snap.get("dialogs", []) + snap.get("popups", [])]
+
+    def capture_screenshot(self, quality=70) -> bytes:
+        """
+        One in-memory JPEG at CSS-pixel scale (no disk write, no re-encode).
+        The same buffer feeds both the planner payload and the dataset.
+        """
+        return self.page.screenshot(type="jpeg", quality=quality, scale="css")
+
     def close(self):
+        if self.profiler:
+            self.profiler.close()
+        try:
+            self.timeouts.save()
+        except OSError:
+            pass
         self.browser.close()
         self.playwright.stop()
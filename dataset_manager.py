@@ -2,8 +2,18 @@
 import os
 import json
 import hashlib
+import io
+import queue
 import re
+import threading
 from datetime import datetime
+from PIL import Image, ImageChops
+
+# Max Hamming distance (of 64 bits) at which a capture counts as a duplicate
+# of the previous capture; negative disables deduplication.
+DEDUP_THRESHOLD = int(os.getenv("DATASET_DEDUP_THRESHOLD", "3"))
+_THUMB_SIZE = (320, 180)
+_PIXEL_TOLERANCE = 40  # per-pixel gray delta treated as JPEG noise
 
 def _slugify(text: str) -> str:
     text = re.sub(r"[^\w\s-]", "", text, flags=re.UNICODE)     
@@ -17,9 +27,154 @@ def _short_slug(text: str, max_len: int = 64) -> str:
     h = hashlib.sha1(slug.encode("utf-8")).hexdigest()[:8]
     return f"{slug[:max_len-9]}-{h}"
 
+def dhash(data: bytes, size: int = 8) -> int:
+    """
+    Difference hash of an encoded image: grayscale, (size+1) x size, one bit
+    per horizontal gradient. JPEG draft mode decodes at reduced scale, so this
+    stays in the low milliseconds for full-page screenshots.
+    """
+    img = Image.open(io.BytesIO(data))
+    img.draft("L", ((size + 1) * 8, size * 8))
+    px = img.convert("L").resize((size + 1, size), Image.BILINEAR).tobytes()
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = px[row * (size + 1) + col]
+            right = px[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _thumbnail(data: bytes):
+    img = Image.open(io.BytesIO(data))
+    img.draft("L", _THUMB_SIZE)
+    return img.convert("L").resize(_THUMB_SIZE, Image.BILINEAR)
+
+
+def _same_pixels(a, b) -> bool:
+    """No thumbnail pixel moved by more than the noise tolerance."""
+    diff = ImageChops.difference(a, b).point(lambda v: 255 if v > _PIXEL_TOLERANCE else 0)
+    return diff.getbbox() is None
+
+
+def _fsync_write(path: str, data: bytes):
+    """Write via a temp file + fsync + rename so readers never see a torn file."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _fsync_append(path: str, data: bytes):
+    with open(path, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_json(path: str, obj):
+    _fsync_write(path, json.dumps(obj, indent=4, ensure_ascii=False).encode("utf-8"))
+
+
+def _append_jsonl(path: str, record: dict):
+    _fsync_append(path, (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+class DatasetWriter:
+    """
+    Background persistence for dataset files.
+
+    One bounded queue per worker thread. Every job for a directory goes to
+    the same worker, so a task's steps.jsonl appends and metadata.json
+    rewrites land in the order they were submitted. JSON is serialized on
+    the worker, so a record filled in by an earlier job for the same
+    directory (save_capture) is written complete. Submit calls block once
+    a worker has max_queue / workers jobs pending (backpressure), so a slow
+    disk throttles the agent instead of growing memory. flush() waits until
+    everything queued so far is on disk (fsync'd) and re-raises the first
+    write error; close() flushes and stops the workers.
+    """
+
+    def __init__(self, max_queue=64, workers=2):
+        self._queues = [queue.Queue(maxsize=max(1, max_queue // workers)) for _ in range(workers)]
+        self._errors = []
+        self._dirs = set()
+        self._threads = [
+            threading.Thread(target=self._run, args=(q,), name=f"dataset-writer-{i}", daemon=True)
+            for i, q in enumerate(self._queues)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _run(self, q):
+        while True:
+            job = q.get()
+            try:
+                if job is None:
+                    return
+                fn, args = job
+                fn(*args)
+            except Exception as e:
+                self._errors.append(e)
+            finally:
+                q.task_done()
+
+    def submit(self, path: str, fn, *args):
+        """Run fn(*args) on the worker that owns path's directory, after the jobs already queued there."""
+        d = os.path.dirname(os.path.abspath(path))
+        self._dirs.add(d)
+        self._queues[hash(d) % len(self._queues)].put((fn, args))
+
+    def _submit(self, fn, *args):
+        self.submit(args[0], fn, *args)
+
+    def write_bytes(self, path: str, data: bytes):
+        self._submit(_fsync_write, path, data)
+
+    def write_json(self, path: str, obj):
+        self._submit(_write_json, path, obj)
+
+    def append_jsonl(self, path: str, record: dict):
+        self._submit(_append_jsonl, path, record)
+
+    def flush(self):
+        for q in self._queues:
+            q.join()
+        for d in list(self._dirs):  # make the renames themselves durable
+            try:
+                fd = os.open(d, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+        if self._errors:
+            err, self._errors = self._errors[0], []
+            raise err
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            for q in self._queues:
+                q.put(None)
+            for t in self._threads:
+                t.join()
+
+
 class DatasetManager:
-    def __init__(self, base_dir="dataset"):
+    def __init__(self, base_dir="dataset", writer: DatasetWriter | None = None, dedup_threshold: int = DEDUP_THRESHOLD):
         self.base_dir = base_dir
+        self.writer = writer
+        self.dedup_threshold = dedup_threshold
+        self._prev_capture = {}  # task dir -> (hash, thumbnail, image name, step) of the previous capture
         os.makedirs(self.base_dir, exist_ok=True)
 
     def create_task_dir(self, app_name: str, user_task: str) -> str:
@@ -31,6 +186,9 @@ class DatasetManager:
         if not os.path.exists(readme):
             with open(readme, "w", encoding="utf-8") as f:
                 f.write(user_task)
+        stale_steps = os.path.join(path, "steps.jsonl")  # from a previous run of this task
+        if os.path.exists(stale_steps):
+            os.remove(stale_steps)
         return path
 
     def save_screenshot(self, path, page, step_num):
@@ -38,8 +196,90 @@ class DatasetManager:
         page.screenshot(path=img_path)
         return img_path
 
+    def save_image(self, path, step_num, data: bytes, ext="jpg"):
+        """Write an already-captured screenshot buffer as step_<n>.<ext>."""
+        img_path = os.path.join(path, f"step_{step_num}.{ext}")
+        if self.writer:
+            self.writer.write_bytes(img_path, data)
+        else:
+            with open(img_path, "wb") as f:
+                f.write(data)
+        return img_path
+
+    def save_capture(self, path, step_num, data: bytes, record: dict | None = None, ext="jpg") -> dict:
+        """
+        Store a screenshot unless it is a near-duplicate of the previous
+        capture of this task: perceptual hash within dedup_threshold, confirmed
+        by a 320x180 thumbnail comparison (a dHash alone does not see a freshly
+        typed field value). A duplicate points at the stored file the previous
+        capture resolved to. Adds the fields to `record` (and returns it):
+          {"image": "step_3.jpg", "phash": "..."}                        stored
+          {"image": "step_2.jpg", "phash": "...", "duplicate_of": 2,
+           "phash_distance": 1}                                           reference
+        With a writer, hashing and the write run on the writer thread and the
+        fields arrive before any later save_step/save_metadata of this task
+        serializes the record.
+        """
+        record = {} if record is None else record
+        img_path = os.path.join(path, f"step_{step_num}.{ext}")
+        if self.writer:
+            self.writer.submit(img_path, self._store_capture, path, img_path, step_num, data, record)
+        else:
+            self._store_capture(path, img_path, step_num, data, record)
+        return record
+
+    def _store_capture(self, path, img_path, step_num, data, record):
+        try:
+            h, thumb = dhash(data), _thumbnail(data)
+        except Exception:
+            h, thumb = None, None
+        prev = self._prev_capture.pop(path, None)
+        if h is not None and prev and self.dedup_threshold >= 0:
+            dist = hamming(h, prev[0])
+            if dist <= self.dedup_threshold and _same_pixels(thumb, prev[1]):
+                self._prev_capture[path] = (h, thumb, prev[2], prev[3])
+                record.update(image=prev[2], phash=f"{h:016x}", duplicate_of=prev[3], phash_distance=dist)
+                return
+
+        if self.writer:
+            _fsync_write(img_path, data)  # already on the writer thread
+        else:
+            with open(img_path, "wb") as f:
+                f.write(data)
+        name = os.path.basename(img_path)
+        record["image"] = name
+        if h is not None:
+            record["phash"] = f"{h:016x}"
+            self._prev_capture[path] = (h, thumb, name, step_num)
+
+    def save_step(self, path, record: dict):
+        """Append one step record to steps.jsonl as the run progresses."""
+        jsonl_path = os.path.join(path, "steps.jsonl")
+        if self.writer:
+            self.writer.append_jsonl(jsonl_path, record)
+        else:
+            with open(jsonl_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
     def save_metadata(self, path, metadata):
         json_path = os.path.join(path, "metadata.json")
+        if self.writer:
+            self.writer.write_json(json_path, metadata)
+            return
         with open(json_path, "w", encoding="utf-8") as f:
             json.dump(metadata, f, indent=4, ensure_ascii=False)
+
+    def save_trace(self, path, trace: dict):
+        """Chrome trace-event file (tracing.Tracer.chrome_trace) next to metadata.json."""
+        json_path = os.path.join(path, "trace.json")
+        if self.writer:
+            self.writer.write_json(json_path, trace)
+            return
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(trace, f)
+
+    def close(self):
+        """Flush and stop the background writer (if any); files are durable afterwards."""
+        if self.writer:
+            self.writer.close()
             
@@ -0,0 +1,264 @@
+# dom_probe.py
+"""
+Single round-trip DOM probe.
+
+The executor helpers used to answer "is a dialog open?", "which chip shows
+High?", "which menu item is In Progress?" with chains of locator.count() /
+inner_text() calls, one browser IPC each. PROBE_JS collects all of that in one
+page.evaluate() and returns a plain dict; the helpers below decide from it.
+
+Every element reported in the snapshot is tagged with data-sl-probe="<id>" so
+the executor can act on it with a single locator: probe_locator(page, id).
+Tags are rewritten on every probe, so only ids from the latest snapshot are valid.
+"""
+import re
+
+PROBE_ATTR = "data-sl-probe"
+
+PROBE_JS = r"""
+(opts) => {
+  const ATTR = opts.attr;
+  const maxItems = opts.maxItems || 200;
+  const needle = (opts.text || "").toLowerCase();
+  // light probes only answer open/closed questions and leave existing tags alone
+  if (!opts.light) {
+    for (const el of document.querySelectorAll('[' + ATTR + ']')) el.removeAttribute(ATTR);
+  }
+
+  let nextId = 0;
+  const tag = (el) => {
+    if (opts.light) return -1;
+    if (!el.hasAttribute(ATTR)) el.setAttribute(ATTR, String(nextId++));
+    return Number(el.getAttribute(ATTR));
+  };
+  const norm = (s) => (s || "").replace(/\s+/g, " ").trim();
+  const visible = (el) => {
+    if (!el || !el.isConnected) return false;
+    if (el.closest('[aria-hidden="true"], [hidden], [inert]')) return false;
+    const st = getComputedStyle(el);
+    if (st.visibility === "hidden" || st.display === "none") return false;
+    const r = el.getBoundingClientRect();
+    return r.width > 0 && r.height > 0;
+  };
+  const byIds = (ids) => (ids || "").split(/\s+/).map((id) => document.getElementById(id))
+    .filter(Boolean).map((e) => norm(e.innerText || e.textContent)).join(" ");
+  const accName = (el) => norm(
+    el.getAttribute("aria-label") || byIds(el.getAttribute("aria-labelledby")) ||
+    el.innerText || el.getAttribute("title") || el.getAttribute("placeholder") || el.value || ""
+  );
+  const role = (el) => {
+    const r = el.getAttribute("role");
+    if (r) return r.split(/\s+/)[0];
+    const t = el.tagName.toLowerCase();
+    if (t === "button") return "button";
+    if (t === "dialog") return "dialog";
+    if (t === "a" && el.hasAttribute("href")) return "link";
+    if (t === "textarea") return "textbox";
+    if (t === "select") return el.multiple || el.size > 1 ? "listbox" : "combobox";
+    if (t === "input") {
+      const ty = (el.getAttribute("type") || "text").toLowerCase();
+      if (["button", "submit", "reset"].includes(ty)) return "button";
+      if (ty === "checkbox") return "checkbox";
+      if (ty === "radio") return "radio";
+      return "textbox";
+    }
+    return t;
+  };
+  const box = (el) => {
+    const r = el.getBoundingClientRect();
+    return [Math.round(r.x), Math.round(r.y), Math.round(r.width), Math.round(r.height)];
+  };
+
+  const DIALOG_SEL = '[role="dialog"], [role="alertdialog"], dialog[open]';
+  const POPUP_SEL = '[role="menu"], [role="listbox"], [data-animated-popover-content]';
+  const ITEM_SEL = '[role="menuitem"], [role="menuitemradio"], [role="menuitemcheckbox"], [role="option"]';
+  const CONTROL_SEL = 'button, [role="button"], [role="combobox"], input[type="button"], input[type="submit"]';
+
+  const dialogs = [...document.querySelectorAll(DIALOG_SEL)].filter(visible);
+  const popups = [...document.querySelectorAll(POPUP_SEL)].filter(visible);
+
+  const out = {
+    url: location.href,
+    dialogs: dialogs.map((d) => ({
+      id: tag(d), role: role(d), name: norm(d.getAttribute("aria-label") || byIds(d.getAttribute("aria-labelledby"))),
+      text: norm(d.innerText).slice(0, 300), box: box(d),
+    })),
+    popups: popups.map((p) => ({
+      id: tag(p), role: p.getAttribute("role") || "popover",
+      has_filter: !!p.querySelector("input"), box: box(p),
+    })),
+    chips: [], items: [], text_hits: [],
+  };
+  if (opts.light) return out;
+
+  const seen = new Set();
+  for (const d of dialogs) {
+    for (const c of d.querySelectorAll(CONTROL_SEL)) {
+      if (seen.has(c) || !visible(c) || out.chips.length >= maxItems) continue;
+      seen.add(c);
+      const grp = c.parentElement && c.parentElement.closest('[role="group"], [role="region"]');
+      out.chips.push({
+        id: tag(c), role: role(c), name: accName(c), text: norm(c.innerText),
+        group: grp && d.contains(grp) ? norm(grp.getAttribute("aria-label") || byIds(grp.getAttribute("aria-labelledby"))) : "",
+        expanded: c.getAttribute("aria-expanded") === "true",
+      });
+    }
+  }
+
+  for (const it of document.querySelectorAll(ITEM_SEL)) {
+    if (out.items.length >= maxItems || !visible(it)) continue;
+    const pop = it.closest(POPUP_SEL);
+    out.items.push({
+      id: tag(it), role: it.getAttribute("role"), name: accName(it),
+      in_popup: pop ? popups.indexOf(pop) : -1,
+      selected: it.getAttribute("aria-selected") === "true" || it.getAttribute("aria-checked") === "true",
+    });
+  }
+
+  if (needle) {
+    const roots = [...popups, ...dialogs];
+    for (const root of roots) {
+      const walker = document.createTreeWalker(root, NodeFilter.SHOW_ELEMENT);
+      for (let el = walker.currentNode; el; el = walker.nextNode()) {
+        if (out.text_hits.length >= maxItems) break;
+        const own = [...el.childNodes].filter((n) => n.nodeType === 3).map((n) => n.textContent).join(" ");
+        if (!own.toLowerCase().includes(needle) || !visible(el)) continue;
+        out.text_hits.push({
+          id: tag(el), text: norm(el.innerText),
+          in_popup: popups.indexOf(el.closest(POPUP_SEL)), in_dialog: !!el.closest(DIALOG_SEL),
+        });
+      }
+    }
+  }
+  return out;
+}
+"""
+
+_EMPTY = {"url": "", "dialogs": [], "popups": [], "chips": [], "items": [], "text_hits": []}
+
+ITEM_ROLE_ORDER = ("menuitemradio", "menuitem", "option")
+
+
+def _probe_args(text, max_items, light):
+    return {"attr": PROBE_ATTR, "text": text or "", "maxItems": max_items, "light": light}
+
+
+def probe(page, text: str | None = None, max_items: int = 200, light: bool = False) -> dict:
+    """
+    One in-page evaluation returning open dialogs, popups, dialog chips/controls,
+    menu/listbox items and (optionally) elements whose own text contains `text`.
+    light=True only reports dialogs and popups (cheap enough for polling) and
+    does not retag elements, so ids from the last full probe stay valid.
+    Never raises; an empty snapshot is returned if the page cannot be evaluated.
+    """
+    try:
+        return page.evaluate(PROBE_JS, _probe_args(text, max_items, light)) or dict(_EMPTY)
+    except Exception:
+        return dict(_EMPTY)
+
+
+async def probe_async(page, text: str | None = None, max_items: int = 200, light: bool = False) -> dict:
+    try:
+        return await page.evaluate(PROBE_JS, _probe_args(text, max_items, light)) or dict(_EMPTY)
+    except Exception:
+        return dict(_EMPTY)
+
+
+def probe_locator(page, probe_id: int):
+    return page.locator(f'[{PROBE_ATTR}="{probe_id}"]')
+
+
+def dialog_open(snap: dict) -> bool:
+    return bool(snap.get("dialogs"))
+
+
+def popup_open(snap: dict) -> bool:
+    # Mirrors the old get_by_role("menu"|"listbox") check: animated popovers
+    # without a menu/listbox role do not count as an open picker.
+    return any(p["role"] in ("menu", "listbox") for p in snap.get("popups", []))
+
+
+def any_chip_has_value(snap: dict, desired_regex: str) -> bool:
+    pat = re.compile(desired_regex, re.I)
+    return any(c["text"] and pat.search(c["text"]) for c in snap.get("chips", []))
+
+
+def find_chip(snap: dict, prop_regex: str):
+    """
+    Chip/button in the open dialog whose accessible name (then visible text)
+    matches prop_regex. Returns the chip dict or None.
+    """
+    pat = re.compile(prop_regex, re.I)
+    word = re.compile(rf"\b{prop_regex}\b", re.I)
+    chips = [c for c in snap.get("chips", []) if c["role"] == "button"]
+    for c in chips:
+        if pat.search(c["name"]):
+            return c
+    for c in chips:
+        if word.search(c["text"]):
+            return c
+    return None
+
+
+def property_openers(snap: dict, label_regex: str) -> list:
+    """
+    Ordered opener candidates for a property picker, same ladder as
+    browser_agent._open_property_chip:
+      1) combobox/button inside a group/region labelled by the property
+      2) combobox by accessible name, 3) button by accessible name
+      4) a chip currently showing a known value (Backlog, No priority, ...)
+    """
+    pat = re.compile(label_regex, re.I)
+    chips = snap.get("chips", [])
+    ordered = []
+
+    grouped = [c for c in chips if c["group"] and pat.search(c["group"])]
+    ordered += [c for c in grouped if c["role"] == "combobox"]
+    ordered += [c for c in grouped if c["role"] != "combobox"]
+    ordered += [c for c in chips if c["role"] == "combobox" and pat.search(c["name"])]
+    ordered += [c for c in chips if c["role"] == "button" and pat.search(c["name"])]
+
+    value_patterns = []
+    if re.search(r"status", label_regex, re.I):
+        value_patterns = [r"Backlog", r"Planned", r"In\s*Progress", r"Completed", r"Canceled|Cancelled"]
+    elif re.search(r"priority", label_regex, re.I):
+        value_patterns = [r"No\s*priority", r"Low", r"Medium", r"High", r"Urgent"]
+    for vp in value_patterns:
+        vpat = re.compile(vp, re.I)
+        ordered += [c for c in chips if c["role"] == "button" and (vpat.search(c["name"]) or vpat.search(c["text"]))]
+
+    out, seen = [], set()
+    for c in ordered:
+        if c["id"] not in seen:
+            seen.add(c["id"])
+            out.append(c)
+    return out
+
+
+def popup_item_candidates(snap: dict, value: str, scope: str = "popup") -> list:
+    """
+    Ordered click candidates for selecting `value`.
+      scope="popup": role items inside each open popup (menuitemradio >
+                     menuitem > option), then plain text matches in that popup.
+      scope="page":  role items outside popups, then text matches in the dialog.
+    """
+    pat = re.compile(re.escape(value), re.I)
+    items = snap.get("items", [])
+    hits = snap.get("text_hits", [])
+    ordered = []
+    if scope == "popup":
+        for idx in range(len(snap.get("popups", []))):
+            for r in ITEM_ROLE_ORDER:
+                ordered += [i for i in items if i["in_popup"] == idx and i["role"] == r and pat.search(i["name"])]
+            ordered += [h for h in hits if h["in_popup"] == idx]
+    else:
+        for r in ITEM_ROLE_ORDER:
+            ordered += [i for i in items if i["in_popup"] < 0 and i["role"] == r and pat.search(i["name"])]
+        ordered += [h for h in hits if h["in_popup"] < 0 and h["in_dialog"]]
+
+    out, seen = [], set()
+    for c in ordered:
+        if c["id"] not in seen:
+            seen.add(c["id"])
+            out.append(c)
+    return out
@@ -1,18 +1,32 @@
 # llm_agent.py
 import os
-import json
 import re
-from openai import OpenAI
+import hashlib
+import time
 from dotenv import load_dotenv
 load_dotenv()
-from utils_llm import image_to_data_url 
+from action_stream import ActionStream
+from utils_llm import resolve_data_url
+from llm_cache import cache_key, digest, get_cache
+from planner_backends import get_backend
+from planner_output import PLANNER_SCHEMA, RETRY_PROMPT, repair, response_format
+from marks import OBS_MARKS
+from tracing import span
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+MODEL = os.getenv("LLM_MODEL", "gpt-5")
 
-ALLOWED_ACTIONS = {"click", "fill", "press", "navigate", "done"}
+# PLAN_MODE=1 lets the planner return {"plan": [action, ...]} so several steps
+# run per call (see BrowserAgent.execute_plan).
+PLAN_MODE = os.getenv("PLAN_MODE", "0") == "1"
+PLAN_MAX_STEPS = 8
 
+ALLOWED_ACTIONS = {"click", "fill", "press", "navigate", "request_input", "done"}
+
+# PLANNER_STREAM=1 streams the reply and hands the action to the caller's
+# on_early hook as soon as its kind and selector are known (see get_next_action).
+PLANNER_STREAM = os.getenv("PLANNER_STREAM", "0") == "1"
+EARLY_ACTIONS = {"click", "fill"}
 
-import re
 
 CSS_START_TOKENS = (".", "#", "[", ":", "/", "(")  # include xpath/others if you want
 CSS_TAG_PREFIXES = ("input", "button", "a", "form", "label", "textarea", "select", "div", "span")
@@ -64,22 +78,14 @@ def _normalize_selector(sel: str):
 
 
 
-
-
-def get_next_action(user_task, visible_text_or_html, previous_action_result, latest_screenshot_path: str | None):
-    """
-    Decide the next action. Returns a validated dict:
-      {
-        "action": "click|fill|press|navigate|done",
-        "selector": "<selector string for locator OR get_by_* expression>",
-        "value": "<text or url or key>",
-        "take_screenshot": true|false,
-        "screenshot_description": "<short description>"
-      }
-    """
-    system_prompt = """
+# The prompt is sent as the first message of every fresh chain so the provider
+# can serve it from its prompt cache; PROMPT_CACHE_KEY (a hash of the prompt)
+# routes all requests with the same prompt together.
+SYSTEM_PROMPT = """
     You are a web automation planner controlling a Playwright browser.
     When an image is provided, treat it as the current UI state and use it to choose precise selectors (chips, popovers, current values). Still return a SINGLE JSON object.
+    The page is given as an accessibility tree: one line per node, `- role "accessible name" [states]: value`, with any open dialog/popup listed first. Build role+name selectors from it (e.g. role=button[name=/Status/i]).
+    If the page section is titled "Changes since last step", it lists only added (+), removed (-) and changed (~ old -> new) nodes relative to the page you saw in your previous turn; everything else is unchanged.
     Before clicking a chip like Status/Priority, visually check in the image whether it already shows the requested value (e.g., the chip text reads “In Progress” or “High”). If it already matches, do NOT click it again; move to the next property.
 
     Return a SINGLE JSON object ONLY (no code fences, no commentary) with this exact schema:
@@ -188,64 +194,256 @@ def get_next_action(user_task, visible_text_or_html, previous_action_result, lat
         (e.g., a detail page, confirmation, or the dialog shows all requested values).
     """
 
+PLAN_PROMPT = f"""
+    Plan mode:
+    - You MAY return several actions at once as {{"action": "plan", "plan": [<action>, <action>, ...]}} (at most {PLAN_MAX_STEPS}), each item using the schema above.
+      Example for a create dialog: fill name, fill description, open the Status chip, pick the status option, open the Priority chip, pick the priority option, submit.
+    - Give each action an optional "expect" postcondition, checked right after it runs (all listed keys must hold):
+      {{"visible": "<selector>"}}, {{"hidden": "<selector>"}}, {{"text": "<text now on the page>"}}, {{"url": "<regex>"}}, {{"dialog": true|false}}, {{"popup": true|false}}
+    - Execution stops at the first failed step, unmet "expect", or unexpected navigation; you are then asked again with the per-step results.
+      Only plan steps whose targets are visible now or certain to appear (e.g. a menu option right after opening its chip).
+    - "request_input" and "done" are never part of a plan; return them on their own.
+    """
+MARKS_PROMPT = """
+    Element IDs:
+    - The observation starts with "## Elements": one line per interactable element, e.g. [7] textbox "Project name".
+      The screenshot shows the same numbers in labelled boxes.
+    - To click or fill a listed element, return its number as "element_id" (an integer), e.g.
+      {"action": "fill", "element_id": 7, "selector": "", "value": "Apollo", ...}.
+      The executor acts on exactly that element; prefer element_id over a selector whenever the target is listed.
+    - Use a selector only for elements that are not listed (e.g. not yet scrolled into view).
+    """
+if PLAN_MODE:
+    SYSTEM_PROMPT += PLAN_PROMPT
+if OBS_MARKS:
+    SYSTEM_PROMPT += MARKS_PROMPT
+PROMPT_CACHE_KEY = f"planner-{hashlib.sha256(SYSTEM_PROMPT.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _usage_summary(usage) -> dict:
+    """input/cached/output/reasoning token counts from a Responses usage object (zeros when absent)."""
+    details = getattr(usage, "input_tokens_details", None)
+    out_details = getattr(usage, "output_tokens_details", None)
+    return {
+        "model": MODEL,
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "reasoning_tokens": getattr(out_details, "reasoning_tokens", 0) or 0,
+    }
 
 
+def _finalize_action(action: dict) -> dict:
+    # Schema replies carry every optional field, as null when unused.
+    for k in [k for k, v in action.items() if v is None]:
+        del action[k]
+    if isinstance(action.get("expect"), dict):
+        action["expect"] = {k: v for k, v in action["expect"].items() if v is not None}
+    action.setdefault("action", "done")
+    action.setdefault("selector", "")
+    action.setdefault("value", "")
+    action.setdefault("take_screenshot", False)
+    action.setdefault("screenshot_description", "")
 
-    user_prompt = f"""
-    User task: {user_task}
+    if action["action"] not in ALLOWED_ACTIONS:
+        action["action"] = "done"
+    if "element_id" in action:
+        try:
+            action["element_id"] = int(action["element_id"])
+        except (TypeError, ValueError):
+            action.pop("element_id")
 
-    Visible page (truncated to 6000 chars):
-    {visible_text_or_html[:6000]}
+    norm = _normalize_selector(action.get("selector", ""))
+    action["_selector_engine"] = norm["selector_engine"]
+    action["_normalized_selector"] = norm["selector"]
+    action["_get_by_arg"] = norm["arg"]
+    return action
 
-    Previous action result: {previous_action_result or 'None'}
 
-    Return ONLY the JSON object described above.
+def _finalize_plan(items: list) -> dict:
+    """
+    Validate a {"plan": [...]} reply. A plan stops before any done/request_input
+    step (those only stand alone); a one-step plan collapses to that action.
+    """
+    steps = []
+    for item in items[:PLAN_MAX_STEPS]:
+        if not isinstance(item, dict):
+            continue
+        step = _finalize_action(item)
+        if step["action"] in ("done", "request_input"):
+            if not steps:
+                steps.append(step)
+            break
+        steps.append(step)
+    if len(steps) == 1:
+        return steps[0]
+    if not steps:
+        return _finalize_action({})
+    return {"action": "plan", "plan": steps, "selector": "", "value": "",
+            "take_screenshot": False, "screenshot_description": ""}
+
+
+def _parse_reply(raw: str) -> tuple:
     """
+    (validated action or plan, how) for a reply, or (None, reason) when even
+    planner_output.repair cannot recover a JSON object from it.
+    """
+    action, how = repair(raw)
+    if action is None:
+        return None, how
+    if isinstance(action.get("plan"), list):
+        return _finalize_plan(action["plan"]), how
+    return _finalize_action(action), how
+
+
+def _retry_request(request: dict, raw: str, response_id: str | None, reason: str) -> dict:
+    """The same request, continued with the unparseable reply and what was wrong with it."""
+    note = {"role": "user", "content": [{"type": "input_text", "text": RETRY_PROMPT.format(error=reason)}]}
+    retry = {k: v for k, v in request.items() if k not in ("input", "previous_response_id")}
+    if response_id:
+        retry.update(input=[note], previous_response_id=response_id)
+    else:
+        retry["input"] = request["input"] + [{"role": "assistant", "content": [{"type": "output_text", "text": raw}]}, note]
+    return retry
 
+
+def _add_usage(usage: dict, more: dict):
+    for k in ("input_tokens", "cached_tokens", "output_tokens", "reasoning_tokens", "latency_ms"):
+        usage[k] = round(usage.get(k, 0) + more.get(k, 0), 1)
+
+
+def _ms_since(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+
+def _stream_reply(stream, kwargs: dict, started: float, on_early):
+    """
+    Run the request through backend.stream, scanning the text as it arrives.
+    Returns (response, timing): ttft_ms, early_ms when on_early fired, and
+    object_ms when the action object closed.
+    """
+    scanner = ActionStream()
+    timing = {}
+
+    def on_text(delta):
+        if "ttft_ms" not in timing:
+            timing["ttft_ms"] = _ms_since(started)
+        if scanner.complete:
+            return
+        scanner.feed(delta or "")
+        if on_early and "early_ms" not in timing and scanner.ready(OBS_MARKS):
+            timing["early_ms"] = _ms_since(started)
+            early = _finalize_action(dict(scanner.fields))
+            if early["action"] in EARLY_ACTIONS:
+                on_early(early)
+        if scanner.complete:
+            timing["object_ms"] = _ms_since(started)
+
+    return stream(on_text, **kwargs), timing
+
+
+def get_next_action(user_task, visible_text_or_html, previous_action_result, latest_screenshot=None,
+                    previous_response_id: str | None = None, use_cache: bool = True, image_note: str | None = None,
+                    on_early=None):
+    """
+    Decide the next action: a validated dict (or {"action": "plan", ...} in
+    PLAN_MODE) with "_response_id" for chaining and "_usage" for
+    token_usage. With previous_response_id the observation may be an
+    ObservationTracker diff. An unparseable reply comes back as
+    {"action": "none", "_parse_error": ...} (see planner_output). on_early
+    gets a provisional click/fill while a PLANNER_STREAM reply is arriving.
+    """
     user_blocks = [
         {"type": "input_text", "text": f"Task:\n{user_task}"},
-        {"type": "input_text", "text": f"Visible text:\n{visible_text_or_html[:8000]}"},
+        {"type": "input_text", "text": f"Page (accessibility tree; open dialog/popup first):\n{visible_text_or_html}"},
         {"type": "input_text", "text": f"Previous action result:\n{previous_action_result or 'None'}"},
     ]
 
-    if latest_screenshot_path:
-        data_url = image_to_data_url(latest_screenshot_path)
+    with span("llm.image_wait"):
+        data_url = resolve_data_url(latest_screenshot)
+    if image_note:
+        user_blocks.append({"type": "input_text", "text": image_note})
+    if data_url:
         user_blocks.append({"type": "input_image", "image_url": data_url})
 
       
-    resp = client.responses.create(
-        model="gpt-5",  
-        input=[
-            {"role": "system", "content": [{"type": "input_text", "text": system_prompt}]},
-            {"role": "user", "content": user_blocks},
-        ],
+    messages = [{"role": "user", "content": user_blocks}]
+    extra = {}
+    if previous_response_id:
+        extra["previous_response_id"] = previous_response_id
+    else:
+        messages.insert(0, {"role": "system", "content": [{"type": "input_text", "text": SYSTEM_PROMPT}]})
+
+    text_opts = {"verbosity": "low"}
+    if PLANNER_SCHEMA:
+        text_opts["format"] = response_format(PLAN_MODE, OBS_MARKS)
+    request = dict(
+        model=MODEL,
+        input=messages,
         reasoning={"effort": "low"},
-        text={"verbosity": "low"},
+        text=text_opts,
+        prompt_cache_key=PROMPT_CACHE_KEY,
+        **extra,
     )
 
-    raw = (resp.output_text or "").strip()
-
-    m = re.search(r"\{.*\}", raw, re.DOTALL)
-    if m:
-        raw = m.group(0)
-
-    try:
-        action = json.loads(raw)
-    except Exception:
-        return {"action": "done", "selector": "", "value": "", "take_screenshot": False, "screenshot_description": ""}
-
-    action.setdefault("action", "done")
-    action.setdefault("selector", "")
-    action.setdefault("value", "")
-    action.setdefault("take_screenshot", False)
-    action.setdefault("screenshot_description", "")
-
-    if action["action"] not in ALLOWED_ACTIONS:
-        action["action"] = "done"
-
-    norm = _normalize_selector(action.get("selector", ""))
-    action["_selector_engine"] = norm["selector_engine"]
-    action["_normalized_selector"] = norm["selector"]
-    action["_get_by_arg"] = norm["arg"]
+    cache = get_cache() if use_cache else None
+    key = None
+    cached = None
+    if cache:
+        key = cache_key(MODEL, SYSTEM_PROMPT, user_task, visible_text_or_html, previous_action_result,
+                        digest((data_url or "") + (image_note or "")), previous_response_id, text_opts)
+        cached = cache.get(key)
+
+    if cached:
+        raw, response_id = cached["output_text"], cached.get("response_id")
+        usage = _usage_summary(None)
+    else:
+        backend = get_backend()
+        stream = getattr(backend, "stream", None) if PLANNER_STREAM else None
+        with span("llm.request", model=MODEL, chained=bool(previous_response_id), stream=bool(stream)) as attrs:
+            started = time.perf_counter()
+            if stream:
+                resp, timing = _stream_reply(stream, request, started, on_early)
+            else:
+                resp, timing = backend.create(**request), {}
+            raw = (resp.output_text or "").strip()
+            response_id = getattr(resp, "id", None)
+            usage = _usage_summary(getattr(resp, "usage", None))
+            usage["latency_ms"] = _ms_since(started)
+            usage.update(timing)
+            attrs.update(usage)
+
+    with span("llm.parse") as attrs:
+        action, how = _parse_reply(raw)
+        attrs["how"] = how
+    usage["parse"] = "ok" if how == "ok" else "repaired" if action is not None else "failed"
+    if action is not None and how != "ok":
+        usage["repair"] = how
+
+    if action is None:
+        print(f"Planner reply did not parse ({how}); retrying once: {raw[:200]!r}")
+        with span("llm.retry", reason=how) as attrs:
+            started = time.perf_counter()
+            resp = get_backend().create(**_retry_request(request, raw, response_id, how))
+            raw = (resp.output_text or "").strip()
+            response_id = getattr(resp, "id", None) or response_id
+            retry_usage = _usage_summary(getattr(resp, "usage", None))
+            retry_usage["latency_ms"] = _ms_since(started)
+            _add_usage(usage, retry_usage)
+            action, how = _parse_reply(raw)
+            attrs["how"] = how
+        usage["parse"] = "retried" if action is not None else "failed"
+        cached = None  # the cached reply (if any) was the bad one
+
+    if action is None:
+        return {"action": "none", "selector": "", "value": "", "take_screenshot": False, "screenshot_description": "",
+                "_parse_error": how, "_response_id": response_id, "_cache_hit": False, "_usage": usage}
+
+    if cache and not cached:
+        cache.put(key, {"output_text": raw, "response_id": response_id})
+
+    action["_response_id"] = response_id
+    action["_cache_hit"] = bool(cached)
+    action["_usage"] = usage
 
     return action
@@ -0,0 +1,149 @@
+# llm_cache.py
+"""
+Persistent, content-keyed cache for planner responses.
+
+Key = sha256 of (model, system prompt, task, normalized observation, previous
+action result, screenshot digest, chained response id, requested output
+format). A hit returns the stored raw model output, so get_next_action skips
+the network call entirely.
+
+Off by default: a hit replays an old decision for a UI that merely looks the
+same. Turn it on for offline and benchmark runs, where repeating the same
+decision is the point.
+
+Backed by SQLite (stdlib, safe across the batch runner's processes) with
+least-recently-used eviction by entry count and total bytes, plus a TTL.
+
+Env:
+  LLM_CACHE=1           enable the cache (default 0)
+  LLM_CACHE_BYPASS=1    never read from the cache (fresh responses still refresh it)
+  LLM_CACHE_PATH        default .cache/llm_responses.sqlite
+  LLM_CACHE_TTL_S       default 7 days
+  LLM_CACHE_MAX_ENTRIES default 5000
+  LLM_CACHE_MAX_MB      default 64
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+_RELATIVE_TIME = re.compile(r"\b\d+\s*(seconds?|secs?|minutes?|mins?|hours?|hrs?|days?)\s+ago\b", re.I)
+
+
+def normalize_observation(text: str) -> str:
+    """Collapse whitespace and mask relative timestamps ("3 minutes ago") that change between runs."""
+    text = _RELATIVE_TIME.sub(lambda m: f"N {m.group(1)} ago", text or "")
+    return " ".join(text.split())
+
+
+def cache_key(model, system_prompt, user_task, observation, previous_result, image_digest=None, previous_response_id=None,
+              output_format=None) -> str:
+    payload = json.dumps([
+        model,
+        hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest(),
+        user_task,
+        normalize_observation(observation),
+        previous_result or "",
+        image_digest or "",
+        previous_response_id or "",
+        output_format or {},  # text.format: a schema-constrained reply is not interchangeable with a free one
+    ], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def digest(data: str | bytes | None) -> str | None:
+    if not data:
+        return None
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=None, max_entries=None, max_bytes=None, ttl_s=None, bypass=None):
+        self.path = path or os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite"))
+        self.max_entries = max_entries or int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+        self.max_bytes = max_bytes or int(float(os.getenv("LLM_CACHE_MAX_MB", "64")) * 1024 * 1024)
+        self.ttl_s = ttl_s if ttl_s is not None else float(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600)))
+        self.bypass = bypass if bypass is not None else os.getenv("LLM_CACHE_BYPASS", "0") == "1"
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self._db.commit()
+
+    def get(self, key: str) -> dict | None:
+        if self.bypass:
+            self.misses += 1
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] > self.ttl_s:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                row = None
+            if not row:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict):
+        blob = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now),
+            )
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_s,))
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        # Oldest-accessed first until both limits hold again.
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": count, "bytes": total}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_cache = None
+
+
+def get_cache() -> ResponseCache | None:
+    """Process-wide cache, or None unless LLM_CACHE=1."""
+    global _cache
+    if os.getenv("LLM_CACHE", "0") != "1":
+        return None
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,173 @@
+# local_planner_server.py
+"""
+Local HTTP stand-in for the OpenAI Responses API (POST /v1/responses).
+
+Lets run_agent execute end-to-end offline so executor and loop overhead can be
+measured without model latency:
+
+    python local_planner_server.py --replay recordings/planner.jsonl --port 8089
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=local python main.py
+
+Answer sources, in priority order:
+  --replay FILE   responses recorded by planner_backends.RecordingBackend
+  --script FILE   JSON list (or JSONL) of action objects, served in order;
+                  {"action": "done"} once exhausted
+  (neither)       always {"action": "done"}
+--latency-ms adds a fixed delay per request to simulate model time.
+Requests with "stream": true get server-sent events (response.created,
+response.output_text.delta in STREAM_CHUNK_CHARS pieces, response.completed),
+so PLANNER_STREAM=1 runs can be timed offline too.
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from planner_backends import ReplayBackend
+
+STREAM_CHUNK_CHARS = 16
+
+_DONE = json.dumps({"action": "done", "selector": "", "value": "", "take_screenshot": False, "screenshot_description": ""})
+
+
+def response_body(text: str, model: str, resp_id: str, usage: dict | None = None) -> dict:
+    """Minimal Responses API object carrying `text` as the assistant output."""
+    usage = usage or {}
+    return {
+        "id": resp_id,
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": model,
+        "output": [{
+            "id": f"msg_{resp_id}",
+            "type": "message",
+            "role": "assistant",
+            "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": usage.get("input_tokens", 0),
+            "input_tokens_details": usage.get("input_tokens_details") or {"cached_tokens": 0},
+            "output_tokens": usage.get("output_tokens", 0),
+            "output_tokens_details": usage.get("output_tokens_details") or {"reasoning_tokens": 0},
+            "total_tokens": usage.get("total_tokens", 0),
+        },
+    }
+
+
+def stream_events(response: dict):
+    """Responses API stream events for a finished response body."""
+    text = response["output"][0]["content"][0]["text"]
+    item_id = response["output"][0]["id"]
+    yield {"type": "response.created", "response": dict(response, status="in_progress", output=[])}
+    for i in range(0, len(text), STREAM_CHUNK_CHARS):
+        yield {"type": "response.output_text.delta", "item_id": item_id, "output_index": 0, "content_index": 0,
+               "delta": text[i:i + STREAM_CHUNK_CHARS]}
+    yield {"type": "response.output_text.done", "item_id": item_id, "output_index": 0, "content_index": 0, "text": text}
+    yield {"type": "response.completed", "response": response}
+
+
+class PlannerStandIn:
+    def __init__(self, replay=None, script=None, latency_ms=0):
+        self.replay = ReplayBackend(replay) if replay else None
+        self.script = list(script or [])
+        self.latency_ms = latency_ms
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def answer(self, request: dict) -> dict:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        with self._lock:
+            resp_id = f"resp_local_{next(self._ids)}"
+            if self.script:
+                text, usage = json.dumps(self.script.pop(0)), None
+            elif self.replay:
+                try:
+                    rec = self.replay.next_record(request)
+                    text, usage = rec.get("output_text", ""), rec.get("usage")
+                except LookupError:
+                    text, usage = _DONE, None
+            else:
+                text, usage = _DONE, None
+        return response_body(text, request.get("model", "local"), resp_id, usage)
+
+
+def make_handler(stand_in: PlannerStandIn):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.rstrip("/") not in ("/v1/responses", "/responses"):
+                self.send_error(404)
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except Exception:
+                self.send_error(400, "invalid JSON")
+                return
+            response = stand_in.answer(request)
+            if request.get("stream"):
+                self._stream(response)
+                return
+            body = json.dumps(response).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, response: dict):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            for seq, event in enumerate(stream_events(response)):
+                event["sequence_number"] = seq
+                self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+        def log_message(self, fmt, *args):  # keep the agent's stdout readable
+            pass
+
+    return Handler
+
+
+def _load_script(path):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def serve(host="127.0.0.1", port=8089, replay=None, script=None, latency_ms=0):
+    server = ThreadingHTTPServer((host, port), make_handler(PlannerStandIn(replay, script, latency_ms)))
+    print(f"Local planner listening on http://{host}:{server.server_port}/v1")
+    return server
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Offline stand-in for the OpenAI Responses API.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--replay", help="JSONL recorded by PLANNER_BACKEND=record")
+    ap.add_argument("--script", help="JSON list / JSONL of actions to return in order")
+    ap.add_argument("--latency-ms", type=int, default=0)
+    args = ap.parse_args(argv)
+    server = serve(args.host, args.port, args.replay, _load_script(args.script) if args.script else None, args.latency_ms)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,21 @@
 # main.py (relevant bits)
 from user_input_manager import UserInputManager
-from llm_agent import get_next_action
+from llm_agent import PLANNER_STREAM, get_next_action
 from browser_agent import BrowserAgent
-from dataset_manager import DatasetManager
-import os, time
+from async_browser_agent import AsyncBrowserPool
+from dataset_manager import DatasetManager, DatasetWriter
+from observation import ObservationTracker, OBS_MODE
+from marks import OBS_MARKS
+from utils_llm import submit_data_url
+from visual_diff import FrameDiffer, image_note
+from trajectory_store import TrajectoryRun, TrajectoryStore
+from tracing import TRACING, Tracer, activate, deactivate, span
+from token_usage import UsageLedger, aggregate, format_usage
+import asyncio, time
 from dotenv import load_dotenv
 load_dotenv()
 from collections import defaultdict, deque
 
-recent_fills = defaultdict(int)
-recent_actions = deque(maxlen=8)
-
 def looks_like_auth_screen(visible_text: str) -> bool:
     s = (visible_text or "").lower()
     keywords = [
@@ -30,167 +35,507 @@ def goal_completed_guard(user_task: str, visible_text: str) -> bool:
     return True
 
 
-def run_agent(app_url, app_name, user_task):
-    browser = BrowserAgent(headless=False)
-    inputs = UserInputManager()
-    data = DatasetManager()
+def _fill_guard(action, recent_fills, recent_actions):
+    """
+    Returns a guard message when the planner keeps filling the same selector,
+    otherwise None.
+    """
+    if action.get("action") != "fill":
+        return None
+    key = (action.get("_normalized_selector") or action.get("selector") or "").strip()
+    if not key and action.get("element_id") is not None:
+        key = f"element {action['element_id']}"
+    val_sig = (action.get("value") or "")[:24]  # short signature
+    recent_actions.append(("fill", key, val_sig))
+    recent_fills[key] += 1
+    if recent_fills[key] >= 3:
+        recent_fills[key] = 0
+        return f"Guard: selector '{key}' used repeatedly; propose a more specific selector (e.g., aria-label/role/name) to avoid wrong field."
+    return None
+
+
+def _coerce_done_action(action, visible):
+    """
+    Converts a false 'done' on auth screens (or a 'done' carrying input metadata)
+    into a request_input action. Returns (action, note); note is set when a
+    spurious input request was ignored.
+    """
+    has_real_input_meta = bool(
+        (action.get("field")) or
+        (action.get("prompt")) or
+        (action.get("selector") and action.get("selector").strip())
+    )
+    if not (looks_like_auth_screen(visible) or has_real_input_meta):
+        return action, None
+
+    field = (action.get("field") or
+            ("email" if "email" in visible.lower() else
+            ("otp" if any(w in visible.lower() for w in ["code","otp","verification"]) else "custom")))
+    sel = action.get("selector") or (
+        'input[type="email"]' if field == "email" else
+        ('input[autocomplete="one-time-code"], input[name*="code"], input[placeholder*="code" i]'
+        if field in ("otp","code") else "")
+    )
 
-  
-    task_dir = data.create_task_dir(app_name, user_task)
-    metadata = {
-        "task_title": user_task.splitlines()[0][:120],  # short header
-        "task_full": user_task,                         # entire prompt
-        "steps": []
+    if field == "custom" and not sel:
+        return {"action": "done"}, "Ignoring spurious input request on a non-auth screen."
+
+    return {
+        "action": "request_input",
+        "selector": sel,
+        "value": "",
+        "take_screenshot": True,
+        "screenshot_description": f"Awaiting {field}",
+        "field": field,
+        "prompt": action.get("prompt") or f"Enter your {field}",
+        "mask": action.get("mask", field in ("password","otp","code")),
+        "persist_key": action.get("persist_key") or f"auth.{field}",
+        "_selector_engine": action.get("_selector_engine"),
+        "_normalized_selector": action.get("_normalized_selector") or sel,
+        "_get_by_arg": action.get("_get_by_arg"),
+    }, None
+
+
+def _input_followup(action, user_value):
+    field = (action.get("field") or "custom").lower()
+    return {
+        "action": "fill",
+        "selector": action.get("selector", ""),  # must be provided by LLM
+        "value": user_value,
+        "take_screenshot": True,
+        "screenshot_description": f"Filled {field}",
+        "_selector_engine": action.get("_selector_engine"),
+        "_normalized_selector": action.get("_normalized_selector"),
+        "_get_by_arg": action.get("_get_by_arg"),
+        "element_id": action.get("element_id"),
     }
 
 
-    browser.navigate(app_url)
+def _input_request_args(action):
+    field = (action.get("field") or "custom").lower()
+    prompt = action.get("prompt") or f"Enter {field}"
+    mask = bool(action.get("mask", field in ("password", "otp", "code")))
+    return field, prompt, mask, action.get("persist_key")
+
+
+def _early_hook_async(browser):
+    """on_early for the planner thread: start the agent's prepare_action on this event loop."""
+    if not PLANNER_STREAM:
+        return None
+    loop = asyncio.get_running_loop()
+    return lambda action: loop.call_soon_threadsafe(browser.start_prepare, action)
+
+
+def _planner_image(shot, fresh, latest_screenshot, latest_info, marks, differ, chained, focus):
+    """
+    (image, note, encoding info) for the next planner call. visual_diff
+    decides between the full frame, a crop of what changed, or no image; with
+    OBS_MARKS the image carries the current element IDs. `fresh` is False
+    when no screenshot was taken since the previous call. The info dict is
+    filled by utils_llm.encode_adaptive once the image is encoded.
+    """
+    if not shot:
+        return latest_screenshot, None, {}
+    kind, box, size = differ.decide(shot, chained, focus, fresh=fresh)
+    note = image_note("stale_full" if kind == "full" and not fresh else kind, box, size)
+    if kind in ("skip", "stale"):
+        return None, note, {}
+    marked = marks.order if OBS_MARKS and len(marks) else None
+    if kind == "full" and not marked:
+        return latest_screenshot, None, latest_info
+    info = {}
+    return submit_data_url(shot, marks=marked, crop=box, info=info), note, info
+
+
+def _record_image(metadata, step, info):
+    """Per-call encoding telemetry (format, size, quality, bytes, tokens) under metadata["images"]."""
+    if info:
+        metadata["images"].append({"step": step, **info})
+
+
+def _record_step(data, task_dir, metadata, record):
+    metadata["steps"].append(record)
+    data.save_step(task_dir, record)
+
+
+class TaskRun:
+    """
+    One task's state plus every decision the two run loops share: replay,
+    the planner request and reply, guards, step bookkeeping and metadata.
+    run_agent and run_agent_async only make the browser, planner and prompt
+    calls in between (plain or awaited).
+    """
+
+    def __init__(self, app_name, user_task, idempotent=False, prefix=""):
+        self.app_name = app_name
+        self.user_task = user_task
+        self.prefix = prefix
+        self.data = DatasetManager(writer=DatasetWriter())
+        self.task_dir = self.data.create_task_dir(app_name, user_task)
+        self.metadata = {
+            "task_title": user_task.splitlines()[0][:120],  # short header
+            "task_full": user_task,                         # entire prompt
+            "steps": [],
+            "images": [],
+            "usage": {},
+            "llm_calls": [],
+        }
+        self.usage = UsageLedger()
+        self.trajectory = TrajectoryRun(TrajectoryStore(), app_name, user_task, idempotent=idempotent)
+        self.differ = FrameDiffer()
+        self.tracer = Tracer(app_name) if TRACING else None
+        self.tracker = ObservationTracker() if OBS_MODE == "diff" else None
+        self.recent_fills = defaultdict(int)
+        self.recent_actions = deque(maxlen=8)
+        self.started = time.monotonic()
+        self.status = "step_cap"
+        self.step = 0
+        self.prev_result = None
+        self.fail_streak = 0
+        self.response_id = None
+        self.visible = ""
+        self.latest_screenshot = None  # Future[data URL] of latest_shot, without marks
+        self.latest_shot = None        # raw bytes, for the set-of-marks overlay and visual diff
+        self.shot_fresh = False        # latest_shot was taken after the previous planner call
+        self.latest_focus = []
+        self.latest_info = {}
+
+    @property
+    def stopped(self) -> bool:
+        return self.status != "step_cap"
+
+    def log(self, message):
+        print(f"{self.prefix}{message}")
+
+    def _frame(self, shot, focus):
+        self.latest_shot, self.shot_fresh, self.latest_focus, self.latest_info = shot, True, focus, {}
+
+    def captured(self, at_step, desc, shot, focus):
+        """A step screenshot: stored in the dataset and kept as the planner's next image."""
+        self._frame(shot, focus)
+        record = self.data.save_capture(self.task_dir, at_step, shot, {"step": at_step, "desc": desc})
+        _record_step(self.data, self.task_dir, self.metadata, record)
+        self.latest_screenshot = submit_data_url(shot, info=self.latest_info)
+
+    def planner_frame(self, shot, focus, marks):
+        """Planner-only frame taken with the observation, so element IDs are drawn on the page they name."""
+        self._frame(shot, focus)
+        self.latest_screenshot = None if len(marks) else submit_data_url(shot, info=self.latest_info)
+
+    def take_replay(self, fp):
+        """The stored action for this step, or None when the planner has to decide."""
+        replaying = self.trajectory.replaying
+        action = self.trajectory.take(fp)
+        self.visible = ""
+        if action:
+            self.log(f"Replaying stored step {self.trajectory.pos}/{len(self.trajectory.replay)}: {action}")
+            if self.tracker:
+                self.tracker.reset()  # the next planner call must get a full snapshot
+            self.response_id = None
+            return action
+        if replaying:
+            self.log(f"Replay stopped at step {self.trajectory.pos + 1} ({self.trajectory.stop_reason}); asking the planner.")
+        if self.tracker and self.response_id is None:
+            self.tracker.reset()  # no response to chain onto: a diff would have nothing to apply to
+        return None
+
+    def planner_request(self, observation, marks):
+        """(previous_response_id, image, image_note, encoding info) for get_next_action."""
+        self.visible = self.tracker.full_text if self.tracker else observation
+        chain_id = self.response_id if self.tracker and not self.tracker.last_was_full else None
+        image, note, info = _planner_image(self.latest_shot, self.shot_fresh, self.latest_screenshot, self.latest_info,
+                                           marks, self.differ, bool(chain_id), self.latest_focus)
+        self.shot_fresh = False
+        return chain_id, image, note, info
+
+    def planner_reply(self, action, info):
+        """Account for one reply; returns it, or None when it could not be parsed."""
+        _record_image(self.metadata, self.step, info)
+        self.response_id = action.get("_response_id")
+        self.log(f"LLM action: {action}")
+        self.log(self.usage.record(self.step, action))
+        if not action.get("_parse_error"):
+            return action
+        self.prev_result = f"Error: your reply could not be parsed as an action ({action['_parse_error']})."
+        self.fail_streak += 1
+        if self.fail_streak >= 3:
+            self.log("Stopping due to repeated unparseable planner replies.")
+            self.status = "failed"
+        return None
+
+    def decide(self, fp, action):
+        """
+        Guards between the reply (or replayed step) and the executor. Returns
+        the action to run, or None to skip it; `stopped` tells whether the
+        task ended.
+        """
+        guard = _fill_guard(action, self.recent_fills, self.recent_actions)
+        if guard:
+            self.prev_result = guard
+            return None
+
+        if action.get("action") == "done":
+            action, note = _coerce_done_action(action, self.visible)
+            if note:
+                self.prev_result = note
+            elif action.get("action") == "done":
+                self.log("✅ Task marked complete.")
+                self.trajectory.record(fp, action, "Task completed.", True)
+                self.status = "done"
+                return None
+
+        if action.get("action") == "request_input" and not action.get("selector") and action.get("element_id") is None:
+            self.prev_result = "Error: request_input missing selector; please return CSS selector for the input field."
+            return None
+        return action
+
+    def executed(self, fp, recorded, last_result, keep_going) -> bool:
+        """Bookkeeping after the executor ran; True when the task should stop."""
+        failed = "Error" in last_result or "Timeout" in last_result
+        self.trajectory.record(fp, recorded, last_result, not failed)  # a request_input is stored without the typed value
+        self.fail_streak = self.fail_streak + 1 if failed else 0
+        self.log(f"Step {self.step}: {last_result}")
+        if not keep_going or self.fail_streak >= 3:
+            self.log("Stopping due to completion or repeated failures.")
+            self.status = "done" if not keep_going else "failed"
+            return True
+        self.prev_result = last_result
+        self.step += 1
+        return False
+
+    def finalize(self, browser):
+        """Run statistics into metadata.json; queues it (and the trace) for writing."""
+        metadata = self.metadata
+        metadata["usage"] = self.usage.totals()
+        metadata["llm_calls"] = self.usage.calls
+        metadata["trajectory"] = self.trajectory.summary()
+        metadata["selector_cache"] = browser.selector_stats
+        metadata["preflight"] = browser.preflight_stats
+        metadata["screenshots"] = self.differ.stats
+        if browser.profiler:
+            metadata["pw_profile"] = browser.profiler.summary()
+        if self.tracer:
+            metadata["timings"] = self.tracer.step_timings()
+            self.data.save_trace(self.task_dir, self.tracer.chrome_trace())
+        self.data.save_metadata(self.task_dir, metadata)
+
+    def close(self):
+        """
+        Flush the dataset and store the trajectory (blocking; the async loop
+        runs it in a thread). Write errors are printed rather than raised, so
+        a failed flush never skips the trajectory or the caller's cleanup.
+        """
+        try:
+            self.data.close()
+        except Exception as e:
+            self.log(f"Dataset write failed: {e!r}")
+        try:
+            self.trajectory.finish(self.status)
+        except Exception as e:
+            self.log(f"Trajectory not stored: {e!r}")
+
+    def report(self):
+        print(f"📸 Captured {len(self.metadata['steps'])} screenshots at: {self.task_dir}")
+        self.log(f"💰 Usage: {format_usage(self.metadata['usage'])}")
+
+    def summary(self) -> dict:
+        return {
+            "app_name": self.app_name,
+            "task_dir": self.task_dir,
+            "status": self.status,
+            "steps": min(self.step, 40),
+            "screenshots": len(self.metadata["steps"]),
+            "duration_s": round(time.monotonic() - self.started, 3),
+            "usage": self.metadata["usage"],
+        }
+
+
+def run_agent(app_url, app_name, user_task, headless=False, inputs=None, idempotent=False):
+    """
+    Drive one task to completion. Returns a summary dict with the final
+    status ("done" | "failed" | "step_cap"), executed step count, screenshot
+    count and wall-clock duration.
+    """
+    browser = BrowserAgent(headless=headless)
+    inputs = inputs or UserInputManager()
+    run = TaskRun(app_name, user_task, idempotent)
+    trace_token = activate(run.tracer)
     try:
-        browser.page.wait_for_load_state("domcontentloaded", timeout=15000)
-    except Exception:
-        pass
-
-    step = 1
-    prev_result = None
-    fail_streak = 0
-    latest_screenshot_path = None
-
-    while step <= 40:  # safety cap
-        visible = browser.get_visible_text()
-        action = get_next_action(user_task, visible, prev_result, latest_screenshot_path)
-        print(f"LLM action: {action}")
-
-        if action.get("action") == "fill":
-            key = (action.get("_normalized_selector") or action.get("selector") or "").strip()
-            val_sig = (action.get("value") or "")[:24]  # short signature
-            recent_actions.append(("fill", key, val_sig))
-            recent_fills[key] += 1
-            if recent_fills[key] >= 3:
-                prev_result = f"Guard: selector '{key}' used repeatedly; propose a more specific selector (e.g., aria-label/role/name) to avoid wrong field."
-                recent_fills[key] = 0
+        browser.navigate(app_url)
+        try:
+            browser.page.wait_for_load_state("domcontentloaded", timeout=15000)
+        except Exception:
+            pass
+
+        def capture(at_step, desc):
+            with span("screenshot.capture"):
+                shot, focus = browser.capture_screenshot(), browser.focus_boxes()
+            run.captured(at_step, desc, shot, focus)
+
+        run.step = 1
+        while run.step <= 40:  # safety cap
+            if run.tracer:
+                run.tracer.step = run.step
+            with span("trajectory.fingerprint"):
+                fp = run.trajectory.fingerprint(browser.page)
+            action = run.take_replay(fp)
+            if action:
+                if action.get("action") == "done":
+                    run.visible = browser.get_observation()
+            else:
+                with span("observation", mode=OBS_MODE):
+                    observation = browser.get_observation(tracker=run.tracker)
+                if OBS_MARKS:
+                    with span("screenshot.capture", planner_only=True):
+                        shot, focus = browser.capture_screenshot(), browser.focus_boxes()
+                    run.planner_frame(shot, focus, browser.marks)
+                chain_id, image, note, info = run.planner_request(observation, browser.marks)
+                with span("planner"):
+                    action = get_next_action(user_task, observation, run.prev_result, image, chain_id, image_note=note,
+                                             on_early=browser.prepare_action if PLANNER_STREAM else None)
+                action = run.planner_reply(action, info)
+
+            action = run.decide(fp, action) if action else None
+            if action is None:
+                if run.stopped:
+                    break
                 continue
 
-        def looks_like_auth_screen(visible_text: str) -> bool:
-            s = (visible_text or "").lower()
-            keywords = [
-                "log in", "login", "sign in", "sign-in",
-                "continue with email",
-                "verification code", "one-time code", "otp", "enter code", "magic link",
-                "back to login", "continue with login code"
-            ]
-            return any(k in s for k in keywords)
+            recorded = action
+            if action.get("action") == "request_input":
+                action = _input_followup(action, inputs.request(*_input_request_args(action)))
 
-        if action.get("action") == "done":
-            has_real_input_meta = bool(
-                (action.get("field")) or
-                (action.get("prompt")) or
-                (action.get("selector") and action.get("selector").strip())
-            )
-            if looks_like_auth_screen(visible) or has_real_input_meta:
-                field = (action.get("field") or
-                        ("email" if "email" in visible.lower() else
-                        ("otp" if any(w in visible.lower() for w in ["code","otp","verification"]) else "custom")))
-                sel = action.get("selector") or (
-                    'input[type="email"]' if field == "email" else
-                    ('input[autocomplete="one-time-code"], input[name*="code"], input[placeholder*="code" i]'
-                    if field in ("otp","code") else "")
-                )
-
-                if field == "custom" and not sel:
-                    prev_result = "Ignoring spurious input request on a non-auth screen."
-                    action = {"action": "done"}  
-                else:
-                    action = {
-                        "action": "request_input",
-                        "selector": sel,
-                        "value": "",
-                        "take_screenshot": True,
-                        "screenshot_description": f"Awaiting {field}",
-                        "field": field,
-                        "prompt": action.get("prompt") or f"Enter your {field}",
-                        "mask": action.get("mask", field in ("password","otp","code")),
-                        "persist_key": action.get("persist_key") or f"auth.{field}",
-                        "_selector_engine": action.get("_selector_engine"),
-                        "_normalized_selector": action.get("_normalized_selector") or sel,
-                        "_get_by_arg": action.get("_get_by_arg"),
-                    }
+            if action.get("action") == "plan":
+                def on_step(i, planned, base=run.step):
+                    if planned.get("take_screenshot"):
+                        capture(base + i, planned.get("screenshot_description", ""))
+
+                keep_going, executed = browser.execute_plan(action["plan"], on_step=on_step)
+                run.step += executed - 1
             else:
-                print("✅ Task marked complete.")
+                keep_going = browser.execute_action(action)
+                if action.get("take_screenshot"):
+                    capture(run.step, action.get("screenshot_description", ""))
+
+            if run.executed(fp, recorded, browser.last_result, keep_going):
                 break
+            browser.settle()
+
+    finally:
+        try:
+            run.finalize(browser)
+            browser.close()
+        finally:
+            run.close()
+            deactivate(trace_token)
+    run.report()
+    return run.summary()
 
 
-        if action.get("action") == "request_input":
-            if not action.get("selector"):
-                prev_result = "Error: request_input missing selector; please return CSS selector for the input field."
+async def run_agent_async(pool, app_url, app_name, user_task, inputs=None, batch_usage=None, idempotent=False):
+    """
+    Same loop as run_agent, driven through an AsyncBrowserAgent leased from
+    `pool` (one isolated BrowserContext per task). The blocking planner call and
+    terminal prompts run in worker threads so other tasks keep moving.
+    """
+    browser = await pool.new_agent()
+    early = _early_hook_async(browser)
+    inputs = inputs or UserInputManager()
+    run = TaskRun(app_name, user_task, idempotent, prefix=f"[{app_name}] ")
+    trace_token = activate(run.tracer)
+    try:
+        await browser.navigate(app_url)
+        try:
+            await browser.page.wait_for_load_state("domcontentloaded", timeout=15000)
+        except Exception:
+            pass
+
+        async def capture(at_step, desc):
+            with span("screenshot.capture"):
+                shot, focus = await browser.capture_screenshot(), await browser.focus_boxes()
+            run.captured(at_step, desc, shot, focus)
+
+        run.step = 1
+        while run.step <= 40:  # safety cap
+            if run.tracer:
+                run.tracer.step = run.step
+            with span("trajectory.fingerprint"):
+                fp = await run.trajectory.fingerprint_async(browser.page)
+            action = run.take_replay(fp)
+            if action:
+                if action.get("action") == "done":
+                    run.visible = await browser.get_observation()
+            else:
+                with span("observation", mode=OBS_MODE):
+                    observation = await browser.get_observation(tracker=run.tracker)
+                if OBS_MARKS:
+                    with span("screenshot.capture", planner_only=True):
+                        shot, focus = await browser.capture_screenshot(), await browser.focus_boxes()
+                    run.planner_frame(shot, focus, browser.marks)
+                chain_id, image, note, info = run.planner_request(observation, browser.marks)
+                with span("planner"):
+                    action = await asyncio.to_thread(get_next_action, user_task, observation, run.prev_result, image,
+                                                     chain_id, image_note=note, on_early=early)
+                action = run.planner_reply(action, info)
+
+            action = run.decide(fp, action) if action else None
+            if action is None:
+                if run.stopped:
+                    break
                 continue
 
-            field = (action.get("field") or "custom").lower()
-            prompt = action.get("prompt") or f"Enter {field}"
-            mask = bool(action.get("mask", field in ("password", "otp", "code")))
-            persist_key = action.get("persist_key")
-
-            user_value = inputs.request(field, prompt, mask, persist_key)
-
-            followup = {
-                "action": "fill",
-                "selector": action.get("selector", ""),  # must be provided by LLM
-                "value": user_value,
-                "take_screenshot": True,
-                "screenshot_description": f"Filled {field}",
-                "_selector_engine": action.get("_selector_engine"),
-                "_normalized_selector": action.get("_normalized_selector"),
-                "_get_by_arg": action.get("_get_by_arg"),
-            }
-            keep_going = browser.execute_action(followup)
-
-            if followup.get("take_screenshot"):
-                img_path = os.path.join(task_dir, f"step_{step}.png")
-                browser.screenshot(img_path)
-                metadata["steps"].append({
-                    "step": step,
-                    "desc": followup.get("screenshot_description", ""),
-                    "image": os.path.basename(img_path),
-                })
-                latest_screenshot_path = img_path
-                step += 1
-
-            prev_result = browser.last_result
-            fail_streak = 0
-            print(prev_result)
-            time.sleep(0.5)
-            continue  
-
-
-        keep_going = browser.execute_action(action)
-
-        if action.get("take_screenshot"):
-            img_path = os.path.join(task_dir, f"step_{step}.png")
-            browser.screenshot(img_path)
-            metadata["steps"].append({
-                "step": step,
-                "desc": action.get("screenshot_description", ""),
-                "image": os.path.basename(img_path),
-            })
-            latest_screenshot_path = img_path
-
-        if "Error" in browser.last_result or "Timeout" in browser.last_result:
-            fail_streak += 1
-        else:
-            fail_streak = 0
-
-        print(f"Step {step}: {browser.last_result}")
-
-        if not keep_going or fail_streak >= 3:
-            print("Stopping due to completion or repeated failures.")
-            break
-
-        prev_result = browser.last_result
-        step += 1
-        time.sleep(1.0)
-
-    data.save_metadata(task_dir, metadata)
-    browser.close()
-    print(f"📸 Captured {len(metadata['steps'])} screenshots at: {task_dir}")
+            recorded = action
+            if action.get("action") == "request_input":
+                user_value = await asyncio.to_thread(inputs.request, *_input_request_args(action))
+                action = _input_followup(action, user_value)
+
+            if action.get("action") == "plan":
+                async def on_step(i, planned, base=run.step):
+                    if planned.get("take_screenshot"):
+                        await capture(base + i, planned.get("screenshot_description", ""))
+
+                keep_going, executed = await browser.execute_plan(action["plan"], on_step=on_step)
+                run.step += executed - 1
+            else:
+                keep_going = await browser.execute_action(action)
+                if action.get("take_screenshot"):
+                    await capture(run.step, action.get("screenshot_description", ""))
+
+            if run.executed(fp, recorded, browser.last_result, keep_going):
+                break
+            await browser.settle()
+    finally:
+        try:
+            run.finalize(browser)
+            await browser.close()
+        finally:
+            await asyncio.to_thread(run.close)
+            deactivate(trace_token)
+    run.report()
+    if batch_usage is not None:
+        batch_usage.append((run.status, run.metadata["usage"]))
+    return run.task_dir
+
+
+async def run_tasks_concurrently(tasks, max_contexts=4, headless=True):
+    """
+    Run many tasks at once inside one shared Chromium.
+    `tasks` is an iterable of dicts with app_url, app_name, user_task (and
+    optionally "idempotent", see trajectory_store).
+    Returns task dirs (or the raised exception) in input order.
+    """
+    inputs = UserInputManager()  # one prompt cache shared by all tasks
+    batch_usage = []
+    async with AsyncBrowserPool(headless=headless, max_contexts=max_contexts) as pool:
+        results = await asyncio.gather(
+            *(run_agent_async(pool, t["app_url"], t["app_name"], t["user_task"], inputs=inputs, batch_usage=batch_usage,
+                              idempotent=t.get("idempotent", False))
+              for t in tasks),
+            return_exceptions=True,
+        )
+    done = sum(1 for status, _ in batch_usage if status == "done")
+    print(f"💰 Batch usage: {format_usage(aggregate([u for _, u in batch_usage], succeeded=done))}")
+    return results
 
 
 
@@ -0,0 +1,165 @@
+# marks.py
+"""
+Set-of-marks element IDs: the planner names an element by number instead of
+guessing a selector.
+
+With OBS_MARKS=1 every observation starts with one page.evaluate (MARK_JS)
+that finds the visible interactable elements in the viewport, tags each one
+with a numeric data-sl-mark attribute and returns its role, name and box:
+
+    ## Elements (act on one with "element_id")
+    [3] button "Status" (in dialog)
+    [7] textbox "Project name" = Apollo
+
+An element keeps its ID for as long as it stays in the document, so IDs
+remain valid across steps on the same page. A navigation starts a new
+numbering. The same numbers are drawn on the planner's copy of the screenshot
+(utils_llm.draw_marks). The executor resolves {"element_id": 7} through the
+per-step ElementRegistry to [data-sl-mark="7"]: one lookup, one click or
+fill, with no selector normalization or fallback ladder.
+
+Env:
+  OBS_MARKS=1         tag elements and accept element_id actions
+  OBS_MARKS_MAX=150   elements listed per observation
+"""
+import os
+
+OBS_MARKS = os.getenv("OBS_MARKS", "0") == "1"
+MARKS_MAX = int(os.getenv("OBS_MARKS_MAX", "150"))
+MARK_ATTR = "data-sl-mark"
+MARK_NAME_CHARS = 60
+MARK_ACTION_TIMEOUT_MS = 3000  # a listed element is already visible; don't wait long if it vanished
+
+# Roles a Playwright role= selector can use to re-find the element later.
+_ARIA_ROLES = {
+    "button", "link", "menuitem", "menuitemradio", "menuitemcheckbox", "option", "tab",
+    "checkbox", "radio", "switch", "combobox", "textbox", "searchbox", "slider", "treeitem",
+}
+
+MARK_JS = r"""
+(opts) => {
+  const ATTR = opts.attr;
+  const ROLES = ["button", "link", "menuitem", "menuitemradio", "menuitemcheckbox", "option", "tab",
+                 "checkbox", "radio", "switch", "combobox", "textbox", "searchbox", "slider", "treeitem"];
+  const SEL = ['a[href]', 'button', 'input:not([type="hidden"])', 'textarea', 'select', 'summary',
+               '[contenteditable=""]', '[contenteditable="true"]', '[tabindex]:not([tabindex="-1"])']
+              .concat(ROLES.map((r) => `[role="${r}"]`)).join(", ");
+  const LEAF = 'a[href], button, [role="button"], [role="link"], [role="menuitem"], [role="option"], [role="tab"]';
+  const DIALOG = '[role="dialog"], [role="alertdialog"], dialog[open]';
+  const INPUT_ROLES = {checkbox: "checkbox", radio: "radio", range: "slider", search: "searchbox",
+                       button: "button", submit: "button", reset: "button"};
+  const roleOf = (el) => {
+    const explicit = el.getAttribute("role");
+    if (explicit) return explicit;
+    const tag = el.tagName.toLowerCase();
+    if (tag === "a") return "link";
+    if (tag === "button" || tag === "summary") return "button";
+    if (tag === "select") return "combobox";
+    if (tag === "textarea" || el.isContentEditable) return "textbox";
+    if (tag === "input") return INPUT_ROLES[(el.type || "").toLowerCase()] || "textbox";
+    return tag;
+  };
+  const nameOf = (el) => {
+    const label = el.labels && el.labels.length ? el.labels[0].innerText : "";
+    return (el.getAttribute("aria-label") || label || el.getAttribute("placeholder") || el.innerText ||
+            el.getAttribute("title") || el.getAttribute("alt") || "").trim().replace(/\s+/g, " ").slice(0, opts.nameChars);
+  };
+  const box = (el) => {
+    const r = el.getBoundingClientRect();
+    if (r.width < 2 || r.height < 2 || r.bottom < 0 || r.right < 0 || r.top > innerHeight || r.left > innerWidth) return null;
+    const st = getComputedStyle(el);
+    if (st.visibility === "hidden" || st.display === "none" || Number(st.opacity) === 0) return null;
+    return [Math.round(r.left), Math.round(r.top), Math.round(r.width), Math.round(r.height)];
+  };
+
+  let next = window.__slMarkNext || 0;
+  const keep = new Set(), out = [];
+  for (const el of document.querySelectorAll(SEL)) {
+    if (out.length >= opts.max) break;
+    const b = box(el);
+    if (!b) continue;
+    const outer = el.parentElement && el.parentElement.closest(LEAF);
+    if (outer && keep.has(outer)) continue;          // a button's inner span etc.
+    let id = Number(el.getAttribute(ATTR)) || 0;
+    if (!id) { id = ++next; el.setAttribute(ATTR, String(id)); }
+    keep.add(el);
+    const value = ("value" in el && typeof el.value === "string") ? el.value : (el.isContentEditable ? el.innerText : "");
+    out.push({
+      id, role: roleOf(el), name: nameOf(el), value: (value || "").trim().slice(0, 40),
+      disabled: !!(el.disabled || el.getAttribute("aria-disabled") === "true"),
+      in_dialog: !!el.closest(DIALOG), box: b,
+    });
+  }
+  window.__slMarkNext = next;
+  for (const el of document.querySelectorAll(`[${ATTR}]`)) if (!keep.has(el)) el.removeAttribute(ATTR);
+  return out;
+}
+"""
+
+
+def mark_selector(element_id) -> str:
+    return f'[{MARK_ATTR}="{int(element_id)}"]'
+
+
+class ElementRegistry:
+    """The marks of one observation, by ID."""
+
+    def __init__(self, marks=None):
+        self.order = list(marks or [])
+        self._by_id = {m["id"]: m for m in self.order}
+
+    def __len__(self):
+        return len(self.order)
+
+    def get(self, element_id) -> dict | None:
+        try:
+            return self._by_id.get(int(element_id))
+        except (TypeError, ValueError):
+            return None
+
+    def render(self) -> str:
+        """Observation section, dialog elements first (they are what the planner acts on next)."""
+        if not self.order:
+            return ""
+        lines = ['## Elements (act on one with "element_id")']
+        for m in sorted(self.order, key=lambda m: not m["in_dialog"]):
+            line = f'[{m["id"]}] {m["role"]} "{m["name"]}"'
+            if m["value"] and m["value"] != m["name"]:
+                line += f" = {m['value']}"
+            if m["disabled"]:
+                line += " (disabled)"
+            if m["in_dialog"]:
+                line += " (in dialog)"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def role_selector(self, element_id) -> str:
+        """A role+name selector for the element (what trajectories store), or "" when none is safe."""
+        m = self.get(element_id)
+        if not m or m["role"] not in _ARIA_ROLES or not m["name"]:
+            return ""
+        name = m["name"].replace("\\", "\\\\").replace('"', '\\"')
+        return f'role={m["role"]}[name="{name}"]'
+
+
+def _opts() -> dict:
+    return {"attr": MARK_ATTR, "max": MARKS_MAX, "nameChars": MARK_NAME_CHARS}
+
+
+def mark_elements(page) -> ElementRegistry:
+    try:
+        return ElementRegistry(page.evaluate(MARK_JS, _opts()))
+    except Exception:
+        return ElementRegistry()
+
+
+async def mark_elements_async(page) -> ElementRegistry:
+    try:
+        return ElementRegistry(await page.evaluate(MARK_JS, _opts()))
+    except Exception:
+        return ElementRegistry()
+
+
+def with_marks(observation: str, registry: ElementRegistry) -> str:
+    section = registry.render()
+    return f"{section}\n\n{observation}" if section else observation
@@ -0,0 +1,264 @@
+# observation.py
+"""
+Compact, token-budgeted page observation for the planner.
+
+Built from Playwright's ARIA snapshot (one call per step), which already lists
+roles, accessible names, values and states:
+
+    - dialog "New project":
+      - textbox "Project name": Apollo Launch
+      - button "Status" [expanded]
+
+The open dialog and popup (menu/listbox) subtrees are lifted to the top so
+they survive truncation, link URL children are dropped, long text is clipped,
+and whole lines are kept until the token budget is spent.
+
+ObservationTracker adds an incremental mode: after one full snapshot it emits
+only added/removed/changed nodes plus a short summary, and falls back to a
+full snapshot on navigation, large diffs, or after max_chain diffs.
+"""
+import os
+import re
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("OBS_TOKEN_BUDGET", "2500"))
+CHARS_PER_TOKEN = 4  # rough estimate, good enough for budgeting
+
+OBS_MODE = os.getenv("OBS_MODE", "full")  # "full" | "diff"
+
+DIALOG_ROLES = ("dialog", "alertdialog")
+POPUP_ROLES = ("menu", "listbox")
+MAX_LINE_CHARS = 160
+
+_NODE_RE = re.compile(r"^(\s*)- ['\"]?(/?[\w-]+)")
+_NAMED_RE = re.compile(r'^[\w-]+ "((?:[^"\\]|\\.)*)"')
+_STATES_RE = re.compile(r"\s*\[[^\]]*\]")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _parse(snapshot: str) -> list:
+    """[(indent, role, line)] for every ARIA snapshot line we keep."""
+    nodes = []
+    for raw in (snapshot or "").splitlines():
+        m = _NODE_RE.match(raw)
+        if not m:
+            continue
+        indent, role = len(m.group(1)), m.group(2)
+        if role.startswith("/"):  # /url:, /placeholder: property children
+            continue
+        line = raw.rstrip()
+        if len(line) > indent + MAX_LINE_CHARS:
+            line = line[: indent + MAX_LINE_CHARS] + "…"
+        nodes.append((indent, role, line))
+    return nodes
+
+
+def _subtree_end(nodes: list, i: int) -> int:
+    base = nodes[i][0]
+    j = i + 1
+    while j < len(nodes) and nodes[j][0] > base:
+        j += 1
+    return j
+
+
+def _extract(nodes: list, roles: tuple):
+    """Split out every subtree rooted at one of `roles`; returns (subtrees, rest)."""
+    picked, rest, i = [], [], 0
+    while i < len(nodes):
+        if nodes[i][1] in roles:
+            j = _subtree_end(nodes, i)
+            base = nodes[i][0]
+            picked.append([(ind - base, role, line[base:]) for ind, role, line in nodes[i:j]])
+            i = j
+        else:
+            rest.append(nodes[i])
+            i += 1
+    return picked, rest
+
+
+def compact_observation(snapshot: str, token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """
+    Turn an ARIA snapshot into the planner observation, within token_budget.
+    Section order: open dialog(s) (innermost/last first), open popup(s), page.
+    """
+    nodes = _parse(snapshot)
+    popups, nodes = _extract(nodes, POPUP_ROLES)
+    dialogs, nodes = _extract(nodes, DIALOG_ROLES)
+
+    sections = []
+    for d in reversed(dialogs):
+        sections.append(("Open dialog", d))
+    for p in reversed(popups):
+        sections.append(("Open popup", p))
+    sections.append(("Page", nodes))
+
+    budget_chars = max(token_budget, 1) * CHARS_PER_TOKEN
+    out, used = [], 0
+    for title, lines in sections:
+        if not lines:
+            continue
+        header = f"## {title}"
+        if used + len(header) + 1 > budget_chars:
+            out.append(f"… ({title.lower()} truncated)")
+            break
+        out.append(header)
+        used += len(header) + 1
+        for n, (_, _, line) in enumerate(lines):
+            if used + len(line) + 1 > budget_chars:
+                out.append(f"… ({len(lines) - n} more nodes truncated)")
+                return "\n".join(out)
+            out.append(line)
+            used += len(line) + 1
+    return "\n".join(out)
+
+
+def _node_identity(line: str) -> str:
+    """
+    Identity of a node within its parent: role + accessible name when named
+    (so value/state edits show up as changes), else the content minus states
+    (text nodes are identified by their text).
+    """
+    content = line.strip()[2:].strip("'")
+    m = _NAMED_RE.match(content)
+    if m:
+        return content[: m.end()]
+    return _STATES_RE.sub("", content).rstrip(":")
+
+
+def _keyed_nodes(snapshot: str) -> dict:
+    """{path key: line} where the path is the chain of ancestor identities."""
+    keyed, stack, seen = {}, [], {}
+    for indent, _, line in _parse(snapshot):
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        ident = _node_identity(line)
+        path = " > ".join([s[1] for s in stack] + [ident])
+        n = seen.get(path, 0)
+        seen[path] = n + 1
+        keyed[path if n == 0 else f"{path} #{n + 1}"] = line.strip()[2:]
+        stack.append((indent, ident))
+    return keyed
+
+
+def _context(path: str) -> str:
+    parts = path.split(" > ")
+    return f" (in {' > '.join(parts[-3:-1])})" if len(parts) > 1 else ""
+
+
+def _summary(snapshot: str, keyed: dict) -> str:
+    nodes = _parse(snapshot)
+    dialogs, _ = _extract(nodes, DIALOG_ROLES)
+    popups, _ = _extract(nodes, POPUP_ROLES)
+    parts = [f"{len(keyed)} nodes"]
+    parts += [f"open {d[0][2].strip()[2:].rstrip(':')}" for d in dialogs]
+    parts += [f"open {p[0][2].strip()[2:].rstrip(':')}" for p in popups]
+    return "; ".join(parts)
+
+
+class ObservationTracker:
+    """
+    Keeps the previous snapshot and turns the next one into a diff.
+
+    observe() returns the text to send and sets:
+      last_was_full  True when a full snapshot was emitted (new chain)
+      full_text      compact full view of the current page (for local guards)
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET, max_change_ratio: float = 0.25, max_chain: int = 8):
+        self.token_budget = token_budget
+        self.max_change_ratio = max_change_ratio
+        self.max_chain = max_chain
+        self.reset()
+
+    def reset(self):
+        self._prev = None
+        self._prev_url = None
+        self._chain = 0
+        self.last_was_full = True
+        self.full_text = ""
+
+    def observe(self, snapshot: str, url: str = "") -> str:
+        keyed = _keyed_nodes(snapshot)
+        self.full_text = compact_observation(snapshot, self.token_budget)
+        prev, prev_url = self._prev, self._prev_url
+        self._prev, self._prev_url = keyed, url
+
+        if prev is None or url != prev_url or self._chain >= self.max_chain:
+            return self._full()
+
+        added = [k for k in keyed if k not in prev]
+        removed = [k for k in prev if k not in keyed]
+        changed = [k for k in keyed if k in prev and keyed[k] != prev[k]]
+        n_changes = len(added) + len(removed) + len(changed)
+        if n_changes > self.max_change_ratio * max(len(prev), len(keyed), 1):
+            return self._full()
+
+        out = [
+            "## Changes since last step (same page; unchanged nodes omitted)",
+            f"Summary: {_summary(snapshot, keyed)}; +{len(added)} -{len(removed)} ~{len(changed)}",
+        ]
+        if not n_changes:
+            out.append("(no changes)")
+        out += [f"+ {keyed[k]}{_context(k)}" for k in added]
+        out += [f"- {prev[k]}{_context(k)}" for k in removed]
+        out += [f"~ {prev[k]}  ->  {keyed[k]}{_context(k)}" for k in changed]
+        text = "\n".join(out)
+        if estimate_tokens(text) > self.token_budget:
+            return self._full()
+
+        self._chain += 1
+        self.last_was_full = False
+        return text
+
+    def _full(self) -> str:
+        self._chain = 0
+        self.last_was_full = True
+        return self.full_text
+
+
+def read_snapshot(page) -> str | None:
+    try:
+        return page.locator("body").aria_snapshot()
+    except Exception:
+        return None
+
+
+async def read_snapshot_async(page) -> str | None:
+    try:
+        return await page.locator("body").aria_snapshot()
+    except Exception:
+        return None
+
+
+def _fallback_text(text, tracker, token_budget):
+    text = (text or "")[: token_budget * CHARS_PER_TOKEN]
+    if tracker:
+        tracker.reset()
+        tracker.full_text = text
+    return text
+
+
+def build_observation(page, token_budget: int = DEFAULT_TOKEN_BUDGET, tracker: ObservationTracker | None = None) -> str:
+    snapshot = read_snapshot(page)
+    if snapshot is None:
+        try:
+            return _fallback_text(page.inner_text("body"), tracker, token_budget)
+        except Exception:
+            return _fallback_text("", tracker, token_budget)
+    if tracker:
+        return tracker.observe(snapshot, page.url)
+    return compact_observation(snapshot, token_budget)
+
+
+async def build_observation_async(page, token_budget: int = DEFAULT_TOKEN_BUDGET, tracker: ObservationTracker | None = None) -> str:
+    snapshot = await read_snapshot_async(page)
+    if snapshot is None:
+        try:
+            return _fallback_text(await page.inner_text("body"), tracker, token_budget)
+        except Exception:
+            return _fallback_text("", tracker, token_budget)
+    if tracker:
+        return tracker.observe(snapshot, page.url)
+    return compact_observation(snapshot, token_budget)
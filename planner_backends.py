@@ -0,0 +1,191 @@
+# planner_backends.py
+"""
+Pluggable transport for the planner's Responses API call.
+
+  OpenAIBackend     the real API (or any server speaking the same shape, e.g.
+                    local_planner_server.py via OPENAI_BASE_URL / base_url)
+  RecordingBackend  wraps another backend and appends request/response pairs to JSONL
+  ReplayBackend     serves responses from such a JSONL file, no network at all
+
+Every backend exposes create(**kwargs) -> object with .id, .output_text, .usage,
+i.e. the subset of openai's Response that llm_agent uses. stream(on_text,
+**kwargs) returns the same object but calls on_text(delta) as the output text
+arrives (PLANNER_STREAM=1); replay hands over the recorded text in one delta.
+
+Selected by env in get_backend():
+  PLANNER_BACKEND=openai (default) | record | replay
+  PLANNER_RECORD_PATH / PLANNER_REPLAY_PATH   default recordings/planner.jsonl
+"""
+import hashlib
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+DEFAULT_RECORDING = os.path.join("recordings", "planner.jsonl")
+
+
+def request_key(kwargs: dict) -> str:
+    """
+    Stable hash of a create() request. Inline images are reduced to their
+    digest, and previous_response_id is left out because recorded ids are not
+    reproducible across runs.
+    """
+    def _strip(obj):
+        if isinstance(obj, dict):
+            return {k: _strip(v) for k, v in obj.items() if k != "previous_response_id"}
+        if isinstance(obj, list):
+            return [_strip(v) for v in obj]
+        if isinstance(obj, str) and obj.startswith("data:"):
+            return "sha256:" + hashlib.sha256(obj.encode("utf-8")).hexdigest()
+        return obj
+    blob = json.dumps(_strip(kwargs), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _usage_dict(usage) -> dict | None:
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        return usage
+    if hasattr(usage, "model_dump"):
+        return usage.model_dump()
+    return dict(vars(usage))
+
+
+def _namespace(obj):
+    if isinstance(obj, dict):
+        return SimpleNamespace(**{k: _namespace(v) for k, v in obj.items()})
+    return obj
+
+
+class ReplayResponse:
+    def __init__(self, record: dict):
+        self.id = record.get("id")
+        self.output_text = record.get("output_text", "")
+        self.usage = _namespace(record.get("usage"))
+
+
+class OpenAIBackend:
+    def __init__(self, api_key=None, base_url=None):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI  # imported lazily so replay runs need no SDK/network
+            self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._client
+
+    def create(self, **kwargs):
+        return self.client.responses.create(**kwargs)
+
+    def stream(self, on_text, **kwargs):
+        final = None
+        for event in self.client.responses.create(stream=True, **kwargs):
+            kind = getattr(event, "type", "")
+            if kind == "response.output_text.delta":
+                on_text(event.delta)
+            elif kind in ("response.completed", "response.incomplete"):
+                final = event.response
+            elif kind in ("response.failed", "error"):
+                raise RuntimeError(f"planner stream failed: {getattr(event, 'response', None) or event}")
+        if final is None:
+            raise RuntimeError("planner stream ended without a response")
+        return final
+
+
+class RecordingBackend:
+    def __init__(self, inner, path=DEFAULT_RECORDING):
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def create(self, **kwargs):
+        return self._record(kwargs, self.inner.create(**kwargs))
+
+    def stream(self, on_text, **kwargs):
+        return self._record(kwargs, self.inner.stream(on_text, **kwargs))
+
+    def _record(self, kwargs: dict, resp):
+        record = {
+            "key": request_key(kwargs),
+            "model": kwargs.get("model"),
+            "response": {
+                "id": getattr(resp, "id", None),
+                "output_text": getattr(resp, "output_text", "") or "",
+                "usage": _usage_dict(getattr(resp, "usage", None)),
+            },
+        }
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return resp
+
+
+class ReplayBackend:
+    """
+    Serves recorded responses. A request whose key was recorded gets that
+    response; otherwise (strict=False) the next unused recording in file order
+    is returned, which keeps replays working when the page text drifts.
+    """
+
+    def __init__(self, path=DEFAULT_RECORDING, strict=False):
+        self.path = path
+        self.strict = strict
+        self._records = []
+        self._by_key = {}
+        self._used = set()
+        self._lock = threading.Lock()
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                self._by_key.setdefault(rec["key"], []).append(len(self._records))
+                self._records.append(rec)
+
+    def next_record(self, kwargs: dict) -> dict:
+        """The recorded response dict ({"id", "output_text", "usage"}) for this request."""
+        key = request_key(kwargs)
+        with self._lock:
+            idx = next((i for i in self._by_key.get(key, []) if i not in self._used), None)
+            if idx is None and not self.strict:
+                idx = next((i for i in range(len(self._records)) if i not in self._used), None)
+            if idx is None:
+                raise LookupError(f"No recorded planner response for request {key[:12]} in {self.path}")
+            self._used.add(idx)
+        return self._records[idx]["response"]
+
+    def create(self, **kwargs):
+        return ReplayResponse(self.next_record(kwargs))
+
+    def stream(self, on_text, **kwargs):
+        resp = self.create(**kwargs)
+        on_text(resp.output_text)
+        return resp
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        kind = os.getenv("PLANNER_BACKEND", "openai")
+        if kind == "replay":
+            _backend = ReplayBackend(os.getenv("PLANNER_REPLAY_PATH", DEFAULT_RECORDING))
+        elif kind == "record":
+            _backend = RecordingBackend(OpenAIBackend(), os.getenv("PLANNER_RECORD_PATH", DEFAULT_RECORDING))
+        else:
+            _backend = OpenAIBackend()
+    return _backend
+
+
+def set_backend(backend):
+    """Install a backend explicitly (tests, benchmarks); None resets to the env default."""
+    global _backend
+    _backend = backend
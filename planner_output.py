@@ -0,0 +1,180 @@
+# planner_output.py
+"""
+Schema and local repair for the planner's JSON reply.
+
+A reply that did not parse used to become {"action": "done"}, which ended
+the run. Three layers now stand between a bad reply and the run:
+
+  schema   action_schema() is sent as the Responses API structured-output
+           format (text.format json_schema, strict), so the model can only
+           emit the action fields, request_input fields, element_id and plan
+           items the executor understands. PLANNER_SCHEMA=0 turns it off for
+           servers that reject json_schema.
+  repair   repair() fixes near-valid JSON locally, without a call: prose or
+           code fences around the object, // comments (whole lines copied
+           from the prompt or after a value, outside strings), trailing commas, smart quotes, Python literals, and a reply cut off
+           mid-object (rebuilt from its completed members when those are
+           enough to act on; a half-streamed value is never used).
+  retry    only when repair fails does llm_agent ask once more, continuing
+           the bad response with the parse error (RETRY_PROMPT).
+
+Every outcome is reported on the action's "_usage" ("parse": ok, repaired,
+retried, failed) and counted per task by token_usage.UsageLedger.
+"""
+import json
+import os
+import re
+
+from action_stream import ActionStream
+
+PLANNER_SCHEMA = os.getenv("PLANNER_SCHEMA", "1") == "1"
+ACTIONS = ["click", "fill", "press", "navigate", "request_input", "done"]
+INPUT_FIELDS = ["email", "password", "otp", "code", "phone", "username", "custom"]
+
+RETRY_PROMPT = (
+    "Your previous reply could not be parsed as the action JSON ({error}). "
+    "Reply again with only the JSON object for the next action, no prose or code fences."
+)
+
+
+def _nullable(schema: dict) -> dict:
+    return {"anyOf": [schema, {"type": "null"}]}
+
+
+def _strict_object(props: dict) -> dict:
+    return {"type": "object", "properties": props, "required": list(props), "additionalProperties": False}
+
+
+def _action_props(actions: list, marks: bool, plan_item: bool) -> dict:
+    props = {
+        "action": {"type": "string", "enum": actions},
+        "selector": {"type": "string"},
+        "value": {"type": "string"},
+        "take_screenshot": {"type": "boolean"},
+        "screenshot_description": {"type": "string"},
+        # request_input only; null otherwise
+        "field": _nullable({"type": "string", "enum": INPUT_FIELDS}),
+        "prompt": _nullable({"type": "string"}),
+        "mask": _nullable({"type": "boolean"}),
+        "persist_key": _nullable({"type": "string"}),
+    }
+    if marks:
+        props["element_id"] = _nullable({"type": "integer"})
+    if plan_item:
+        expect = {k: _nullable({"type": "string"}) for k in ("visible", "hidden", "text", "url")}
+        expect.update({k: _nullable({"type": "boolean"}) for k in ("dialog", "popup")})
+        props["expect"] = _nullable(_strict_object(expect))
+    return props
+
+
+def action_schema(plan_mode: bool = False, marks: bool = False) -> dict:
+    """
+    Strict JSON schema for one planner reply. Strict mode makes every
+    property required, so optional fields are nullable; _finalize_action
+    drops the nulls. In plan mode the reply is {"action": "plan", "plan": [...]}
+    or a single action with "plan": null.
+    """
+    if not plan_mode:
+        return _strict_object(_action_props(ACTIONS, marks, plan_item=False))
+    item = _strict_object(_action_props(ACTIONS, marks, plan_item=True))
+    props = _action_props(ACTIONS + ["plan"], marks, plan_item=False)
+    props["plan"] = _nullable({"type": "array", "items": item})
+    return _strict_object(props)
+
+
+def response_format(plan_mode: bool = False, marks: bool = False) -> dict:
+    """The Responses API text.format block."""
+    return {"type": "json_schema", "name": "planner_action", "strict": True,
+            "schema": action_schema(plan_mode, marks)}
+
+
+_FENCE = re.compile(r"```(?:json)?", re.I)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_PY_LITERAL = re.compile(r"([:\[,]\s*)(True|False|None)(?=\s*[,}\]])")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_SMART_QUOTES = str.maketrans({"\u201c": '"', "\u201d": '"'})
+
+
+def _strip_comments(text: str) -> str:
+    """Drop every // to the end of its line, unless it is inside a string (URLs, selectors)."""
+    out, start, i, in_str, esc = [], 0, 0, False, False
+    while i < len(text):
+        ch = text[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif text.startswith("//", i):
+            out.append(text[start:i].rstrip(" \t"))
+            i = text.find("\n", i)
+            if i < 0:
+                return "".join(out)
+            start = i
+            continue
+        i += 1
+    out.append(text[start:])
+    return "".join(out)
+
+
+def _clean(raw: str, smart_quotes: bool = False) -> str:
+    text = _FENCE.sub("", raw)
+    if smart_quotes:  # only as a second try: curly quotes inside values are legitimate
+        text = text.translate(_SMART_QUOTES)
+    text = _strip_comments(text)
+    text = _TRAILING_COMMA.sub(r"\1", text)
+    return _PY_LITERAL.sub(lambda m: m.group(1) + _PY_LITERALS[m.group(2)], text)
+
+
+def _loads(text: str | None):
+    if not text:
+        return None
+    try:
+        obj = json.loads(text)
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def _actionable(fields: dict) -> bool:
+    """Completed fields of a truncated reply that are enough to act on safely."""
+    kind = fields.get("action")
+    if kind == "click":
+        return bool(fields.get("selector") or fields.get("element_id") is not None)
+    if kind == "fill":
+        return "value" in fields and bool(fields.get("selector") or fields.get("element_id") is not None)
+    if kind in ("press", "navigate"):
+        return bool(fields.get("value"))
+    if kind == "request_input":
+        return "field" in fields and bool(fields.get("selector") or fields.get("element_id") is not None)
+    return False  # a truncated "done" or plan is not trusted
+
+
+def repair(raw: str) -> tuple:
+    """
+    (object, how) for a planner reply, or (None, reason) when nothing local
+    works. how is "ok" when the first object parsed as is.
+    """
+    raw = raw or ""
+    obj = _loads(ActionStream().feed(raw).text())
+    if obj is not None:
+        return obj, "ok"
+
+    reason = "no JSON object"
+    for smart_quotes in (False, True):
+        scanner = ActionStream().feed(_clean(raw, smart_quotes))
+        obj = _loads(scanner.text())
+        if obj is not None:
+            return obj, "cleaned"
+        if scanner.complete:
+            reason = "invalid JSON object"
+            continue
+        if scanner.started():
+            if _actionable(scanner.fields):
+                return dict(scanner.fields), "truncated"
+            reason = "truncated reply"
+    return None, reason
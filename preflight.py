@@ -0,0 +1,128 @@
+# preflight.py
+"""
+Selector pre-flight: validate a planner selector in one round trip before
+the click ladder starts waiting on it.
+
+A selector that matches nothing used to cost the whole timeout budget before
+the planner heard about it. preflight() resolves the selector with
+Playwright's own engine (role=, text=, >> chains all work) and runs
+PREFLIGHT_JS over every match in a single locator.evaluate_all call. It
+returns the match count, whether a dialog is open, and per match: role,
+accessible name, visibility, enabled state and whether it sits inside the
+open dialog. The dialog-scoped variant the ladder would try first is just
+the in_dialog subset, so it needs no second call.
+
+verdict() turns the report into a short reason ("0 matches",
+'3 visible matches: button "Save", button "Save draft", ...') or None when
+the ladder should run. Callers pass rescuable=True when some ladder rung
+(popup selection, chip opener, dialog text) can succeed without the
+selector matching; 0-match and all-hidden selectors then go to the ladder
+as before.
+
+With scroll=True the first visible match is also scrolled into view when it
+is outside the viewport, in the same call. The streaming planner uses this
+to prepare an action before the reply has finished (llm_agent, PLANNER_STREAM).
+
+Env:
+  PREFLIGHT=0     skip the check
+"""
+import os
+import re
+
+PREFLIGHT = os.getenv("PREFLIGHT", "1") == "1"
+PREFLIGHT_LIMIT = 20  # matches described in the report (count is exact)
+
+PREFLIGHT_JS = r"""
+(els, opts) => {
+  const DIALOG = '[role="dialog"], [role="alertdialog"], dialog[open]';
+  const visible = (el) => {
+    const r = el.getBoundingClientRect(), st = getComputedStyle(el);
+    return r.width > 0 && r.height > 0 && st.visibility !== "hidden" && st.display !== "none";
+  };
+  const name = (el) => (el.getAttribute("aria-label") || el.innerText || el.value ||
+    el.getAttribute("placeholder") || el.getAttribute("title") || "").trim().replace(/\s+/g, " ").slice(0, 60);
+  if (opts.scroll) {
+    const el = els.find(visible);
+    const r = el && el.getBoundingClientRect();
+    if (r && (r.bottom < 0 || r.right < 0 || r.top > innerHeight || r.left > innerWidth)) el.scrollIntoView({block: "center"});
+  }
+  return {
+    count: els.length,
+    dialog_open: [...document.querySelectorAll(DIALOG)].some(visible),
+    items: els.slice(0, opts.limit).map((el) => ({
+      role: el.getAttribute("role") || el.tagName.toLowerCase(),
+      name: name(el),
+      visible: visible(el),
+      enabled: !(el.disabled || el.getAttribute("aria-disabled") === "true"),
+      in_dialog: !!el.closest(DIALOG),
+    })),
+  };
+}
+"""
+
+_INVALID = re.compile(r"unexpected token|unknown engine|not a valid selector|error while parsing", re.I)
+
+
+def _locator(page, sel: str, engine: str, arg):
+    return page.get_by_text(arg, exact=False) if engine == "get_by_text" and arg else page.locator(sel)
+
+
+def _error_report(e: Exception) -> dict:
+    msg = (str(e).strip().splitlines() or [type(e).__name__])[0]
+    return {"error": msg, "invalid": bool(_INVALID.search(msg))}
+
+
+def preflight(page, sel: str, engine: str = "locator", arg=None, scroll: bool = False) -> dict:
+    """{"count", "dialog_open", "items": [...]}, or {"error", "invalid"} when evaluation failed."""
+    try:
+        return _locator(page, sel, engine, arg).evaluate_all(PREFLIGHT_JS, {"limit": PREFLIGHT_LIMIT, "scroll": scroll})
+    except Exception as e:
+        return _error_report(e)
+
+
+async def preflight_async(page, sel: str, engine: str = "locator", arg=None, scroll: bool = False) -> dict:
+    try:
+        return await _locator(page, sel, engine, arg).evaluate_all(PREFLIGHT_JS, {"limit": PREFLIGHT_LIMIT, "scroll": scroll})
+    except Exception as e:
+        return _error_report(e)
+
+
+def _describe(items: list, total: int) -> str:
+    shown = ", ".join(f'{i["role"]} "{i["name"]}"' for i in items[:5])
+    more = total - min(len(items), 5)
+    return shown + (f", +{more} more" if more > 0 else "")
+
+
+def verdict(report: dict, wanted: str | None = None, rescuable: bool = False) -> str | None:
+    """
+    Reason to reject the selector without running the ladder, or None.
+    `wanted` is the text the selector asks for; an ambiguous match set is
+    accepted when its first visible match carries exactly that name (the
+    ladder clicks .first).
+    """
+    if "error" in report:
+        return f"invalid selector ({report['error']})" if report["invalid"] else None
+    count, items = report.get("count", 0), report.get("items", [])
+    if count == 0:
+        return None if rescuable else "0 matches"
+    shown = [i for i in items if i["visible"]]
+    if not shown:
+        return None if rescuable else f"{count} match{'es' if count > 1 else ''}, none visible"
+    if report.get("dialog_open"):
+        shown = [i for i in shown if i["in_dialog"]] or shown
+    enabled = [i for i in shown if i["enabled"]]
+    if not enabled:
+        return f"{len(shown)} visible match{'es' if len(shown) > 1 else ''}, all disabled: {_describe(shown, len(shown))}"
+    if len({i["name"].lower() for i in enabled}) > 1:
+        if wanted and enabled[0]["name"].lower() == wanted.strip().lower():
+            return None
+        return f"{len(enabled)} visible matches: {_describe(enabled, len(enabled))}"
+    return None
+
+
+def feedback(sel: str, reason: str) -> str:
+    """last_result text for a rejected selector; 'Error' marks the step failed for the loop."""
+    return (
+        f"Error: preflight rejected selector '{sel}': {reason}. "
+        f"Choose a selector from the current observation (role+name, or scope to the open dialog)."
+    )
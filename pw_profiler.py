@@ -0,0 +1,206 @@
+# pw_profiler.py
+"""
+Opt-in Playwright round-trip profiler for the executor helpers.
+
+Most helpers in browser_agent.py wrap their calls in try/except, so a
+strategy that burns 30 IPC calls and two timeouts looks the same as one
+that succeeds at once. With PW_PROFILE=1 the agents hand their helpers a
+profiled proxy of the page. Every Locator, Keyboard and other Playwright
+object reached from it is proxied too. Each protocol call is timed and
+attributed to the innermost tracing span, which is the helper name from
+@traced("ladder.select_from_popup") and friends.
+
+Per scope it keeps:
+  calls      protocol round trips (locator builders and listeners excluded)
+  ms         wall time spent in them
+  errors     calls that raised
+  timeouts   errors that were Playwright timeouts
+  swallowed  errors that did not propagate out of the helper
+
+Stats come per action (begin_action/end_action, stored on the action's
+tracing span) and per run (summary(), written to metadata.json as
+"pw_profile").
+
+Env:
+  PW_PROFILE=1   enable (off by default: one extra Python frame per call)
+"""
+import inspect
+import os
+import threading
+import time
+from collections import defaultdict
+
+from tracing import add_exit_hook, current_scope, remove_exit_hook
+
+PW_PROFILE = os.getenv("PW_PROFILE", "0") == "1"
+UNSCOPED = "(unscoped)"
+
+# Methods that build objects or register listeners locally, without a round trip.
+_LOCAL = {
+    "locator", "get_by_role", "get_by_text", "get_by_label", "get_by_placeholder", "get_by_test_id",
+    "get_by_title", "get_by_alt_text", "frame_locator", "filter", "nth", "and_", "or_",
+    "on", "once", "remove_listener", "set_default_timeout", "set_default_navigation_timeout",
+}
+
+
+def _new_stats() -> dict:
+    return {"calls": 0, "ms": 0.0, "errors": 0, "timeouts": 0, "swallowed": 0}
+
+
+# Playwright objects whose methods are worth timing; anything else (bytes, dicts,
+# expect_* context managers) is returned as is.
+_PROXIED = {"Page", "Frame", "Locator", "FrameLocator", "ElementHandle", "Keyboard", "Mouse"}
+
+
+def _proxied(obj) -> bool:
+    cls = type(obj)
+    return cls.__name__ in _PROXIED and cls.__module__.startswith("playwright.")
+
+
+def _unwrap(value):
+    return value._target if isinstance(value, Profiled) else value
+
+
+class Profiler:
+    def __init__(self):
+        self.run = defaultdict(_new_stats)
+        self.methods = defaultdict(_new_stats)
+        self._action = None
+        self._lock = threading.Lock()
+        self._key = f"pw_errors:{id(self)}"  # spans are shared by every profiler in the process
+        add_exit_hook(self._scope_exit)
+
+    def _add(self, table, key, ms, exc):
+        s = table[key]
+        s["calls"] += 1
+        s["ms"] += ms
+        if exc is not None:
+            s["errors"] += 1
+            if "Timeout" in type(exc).__name__:
+                s["timeouts"] += 1
+
+    def record(self, method: str, ms: float, exc: BaseException | None):
+        frame = current_scope()
+        scope = frame["name"] if frame else UNSCOPED
+        if exc is not None and frame is not None:
+            frame[self._key] = frame.get(self._key, 0) + 1
+        with self._lock:
+            self._add(self.run, scope, ms, exc)
+            self._add(self.methods, method, ms, exc)
+            if self._action is not None:
+                self._add(self._action, scope, ms, exc)
+
+    def _scope_exit(self, frame, error):
+        """
+        Errors raised inside a span that closed normally were swallowed there.
+        A span that closes with an error hands that one error to its parent,
+        which may swallow it in turn.
+        """
+        raised = frame.get(self._key, 0)
+        if not raised:
+            return
+        swallowed = raised
+        if error is not None:
+            swallowed -= 1
+            parent = frame.get("parent")
+            if parent is not None:
+                parent[self._key] = parent.get(self._key, 0) + 1
+        if swallowed <= 0:
+            return
+        with self._lock:
+            self.run[frame["name"]]["swallowed"] += swallowed
+            if self._action is not None:
+                self._action[frame["name"]]["swallowed"] += swallowed
+
+    def close(self):
+        remove_exit_hook(self._scope_exit)
+
+    def begin_action(self):
+        with self._lock:
+            self._action = defaultdict(_new_stats)
+
+    def end_action(self) -> dict:
+        """{"calls", "ms", "errors", "swallowed", "by_scope": {...}} for the action just run."""
+        with self._lock:
+            table, self._action = self._action or {}, None
+        return _totals(table)
+
+    def summary(self) -> dict:
+        with self._lock:
+            out = _totals(self.run)
+            out["by_method"] = {k: _round(v) for k, v in sorted(self.methods.items(), key=lambda kv: -kv[1]["ms"])}
+        return out
+
+
+def _round(s: dict) -> dict:
+    return dict(s, ms=round(s["ms"], 1))
+
+
+def _totals(table: dict) -> dict:
+    total = _new_stats()
+    for s in table.values():
+        for k in total:
+            total[k] += s[k]
+    ranked = sorted(table.items(), key=lambda kv: -kv[1]["ms"])
+    return dict(_round(total), by_scope={k: _round(v) for k, v in ranked})
+
+
+class Profiled:
+    """Proxy that times every protocol call on a Playwright object and proxies the objects it returns."""
+
+    __slots__ = ("_target", "_profiler", "_kind")
+
+    def __init__(self, target, profiler: Profiler):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_profiler", profiler)
+        object.__setattr__(self, "_kind", type(target).__name__)
+
+    def _wrap(self, value):
+        return Profiled(value, self._profiler) if _proxied(value) else value
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if not callable(value):
+            return self._wrap(value)  # e.g. locator.first, page.keyboard
+        if name in _LOCAL:
+            return lambda *a, **kw: self._wrap(value(*[_unwrap(x) for x in a], **{k: _unwrap(v) for k, v in kw.items()}))
+        return self._timed(value, f"{self._kind}.{name}")
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __repr__(self):
+        return f"Profiled({self._target!r})"
+
+    def _timed(self, fn, method):
+        profiler = self._profiler
+
+        def call(*args, **kwargs):
+            args = [_unwrap(a) for a in args]
+            kwargs = {k: _unwrap(v) for k, v in kwargs.items()}
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                profiler.record(method, (time.perf_counter() - started) * 1000, e)
+                raise
+            if inspect.isawaitable(result):
+                return self._awaited(result, method, started)
+            profiler.record(method, (time.perf_counter() - started) * 1000, None)
+            return self._wrap(result)
+
+        return call
+
+    async def _awaited(self, awaitable, method, started):
+        try:
+            result = await awaitable
+        except BaseException as e:
+            self._profiler.record(method, (time.perf_counter() - started) * 1000, e)
+            raise
+        self._profiler.record(method, (time.perf_counter() - started) * 1000, None)
+        return self._wrap(result)
+
+
+def profiled(page, profiler: Profiler | None):
+    """`page` wrapped for profiling, or unchanged when profiler is None."""
+    return Profiled(page, profiler) if profiler else page
@@ -0,0 +1,104 @@
+# selector_cache.py
+"""
+Per-app memory of how the executor resolved a planner selector.
+
+execute_action walks a long fallback ladder (dialog-scoped locator, chip
+opener, popup selection, text match, ...) for every click. When a rung
+succeeds, the (domain, normalized selector) pair is stored with the
+strategy that worked and its concrete target, e.g.
+
+    ("linear.app", "role=button[name=/Status/i]") -> ("chip_open", "role=button[name=/Status/i]")
+    ("linear.app", "role=menuitem[name=/High/i]") -> ("popup_select", "High")
+
+Next time the executor tries that strategy first, with a short timeout, and
+only falls back to the full ladder (dropping the entry) when it fails.
+
+Backed by SQLite like llm_cache, so batch worker processes share it.
+
+Env:
+  SELECTOR_CACHE=0       disable
+  SELECTOR_CACHE_PATH    default .cache/selectors.sqlite
+"""
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+CACHED_CLICK_TIMEOUT_MS = 2000
+
+
+def app_domain(url: str) -> str:
+    return urlsplit(url or "").netloc.lower()
+
+
+class SelectorCache:
+    def __init__(self, path=None):
+        self.path = path or os.getenv("SELECTOR_CACHE_PATH", os.path.join(".cache", "selectors.sqlite"))
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS resolutions ("
+            " domain TEXT NOT NULL, selector TEXT NOT NULL, strategy TEXT NOT NULL, target TEXT NOT NULL,"
+            " successes INTEGER NOT NULL DEFAULT 1, updated REAL NOT NULL,"
+            " PRIMARY KEY (domain, selector))"
+        )
+        self._db.commit()
+
+    def get(self, domain: str, selector: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT strategy, target, successes FROM resolutions WHERE domain = ? AND selector = ?",
+                (domain, selector),
+            ).fetchone()
+        if not row:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"strategy": row[0], "target": row[1], "successes": row[2]}
+
+    def put(self, domain: str, selector: str, strategy: str, target: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO resolutions (domain, selector, strategy, target, successes, updated)"
+                " VALUES (?, ?, ?, ?, 1, ?)"
+                " ON CONFLICT(domain, selector) DO UPDATE SET"
+                "  successes = CASE WHEN strategy = excluded.strategy AND target = excluded.target"
+                "              THEN successes + 1 ELSE 1 END,"
+                "  strategy = excluded.strategy, target = excluded.target, updated = excluded.updated",
+                (domain, selector, strategy, target, time.time()),
+            )
+            self._db.commit()
+
+    def invalidate(self, domain: str, selector: str):
+        self.invalidations += 1
+        with self._lock:
+            self._db.execute("DELETE FROM resolutions WHERE domain = ? AND selector = ?", (domain, selector))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            (count,) = self._db.execute("SELECT COUNT(*) FROM resolutions").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations, "entries": count}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_cache = None
+
+
+def get_selector_cache() -> SelectorCache | None:
+    """Process-wide cache, or None when SELECTOR_CACHE=0."""
+    global _cache
+    if os.getenv("SELECTOR_CACHE", "1") == "0":
+        return None
+    if _cache is None:
+        _cache = SelectorCache()
+    return _cache
@@ -0,0 +1,158 @@
+# settle.py
+"""
+Wait for the UI to settle instead of sleeping a fixed time.
+
+SETTLE_JS runs inside the page: a MutationObserver timestamps every DOM
+change, and an animation-frame loop (setTimeout when the tab is hidden)
+treats running finite CSS/Web animations as activity. The promise resolves
+once nothing has changed for quiet_ms, or at the cap. NetworkTracker counts
+in-flight requests from Playwright's request events. settle() only returns
+"settled" early when the DOM is quiet and no recent request is still
+pending. Requests older than LONG_REQUEST_MS (long-poll, sync channels) are
+ignored, so they cannot pin every wait at the cap.
+
+A navigation mid-wait destroys the execution context; settle() then waits
+for domcontentloaded and keeps observing the new document.
+
+Env:
+  SETTLE_QUIET_MS   quiet window, default 150
+  SETTLE_CAP_MS     hard cap, default 3000
+"""
+import os
+import time
+
+from tracing import span
+
+SETTLE_QUIET_MS = int(os.getenv("SETTLE_QUIET_MS", "150"))
+SETTLE_CAP_MS = int(os.getenv("SETTLE_CAP_MS", "3000"))
+LONG_REQUEST_MS = 2000
+_IGNORED_TYPES = ("websocket", "eventsource", "media")
+
+SETTLE_JS = r"""
+(opts) => new Promise((resolve) => {
+  const start = performance.now();
+  let last = start, mutations = 0;
+  const obs = new MutationObserver((records) => { mutations += records.length; last = performance.now(); });
+  obs.observe(document.documentElement || document, {subtree: true, childList: true, attributes: true, characterData: true});
+  const animating = () => {
+    if (!document.getAnimations) return false;
+    return document.getAnimations().some((a) => {
+      if (a.playState !== "running") return false;
+      const t = a.effect && a.effect.getTiming ? a.effect.getTiming() : null;
+      return !t || t.iterations !== Infinity;   // spinners loop forever; ignore them
+    });
+  };
+  const schedule = (f) => document.hidden ? setTimeout(f, 16) : requestAnimationFrame(f);
+  const tick = () => {
+    const now = performance.now();
+    if (animating()) last = now;
+    const quiet = now - last >= opts.quietMs;
+    if (quiet || now - start >= opts.capMs) {
+      obs.disconnect();
+      resolve({quiet, waited_ms: Math.round(now - start), mutations});
+      return;
+    }
+    schedule(tick);
+  };
+  schedule(tick);
+})
+"""
+
+
+class NetworkTracker:
+    """In-flight request bookkeeping fed by page.on("request"/"requestfinished"/"requestfailed")."""
+
+    def __init__(self):
+        self._pending = {}
+
+    def attach(self, page):
+        page.on("request", self._started)
+        page.on("requestfinished", self._done)
+        page.on("requestfailed", self._done)
+        return self
+
+    def _started(self, request):
+        if request.resource_type not in _IGNORED_TYPES:
+            self._pending[id(request)] = time.monotonic()
+
+    def _done(self, request):
+        self._pending.pop(id(request), None)
+
+    def busy(self) -> bool:
+        cutoff = time.monotonic() - LONG_REQUEST_MS / 1000.0
+        return any(t > cutoff for t in self._pending.values())
+
+
+def _result(settled, started, mutations):
+    return {"settled": settled, "waited_ms": int((time.monotonic() - started) * 1000), "mutations": mutations}
+
+
+def settle(page, quiet_ms: int = SETTLE_QUIET_MS, cap_ms: int = SETTLE_CAP_MS, network: NetworkTracker | None = None) -> dict:
+    """
+    Block until the DOM has been quiet for quiet_ms (and the network is idle,
+    when a tracker is given) or cap_ms has passed.
+    Returns {"settled", "waited_ms", "mutations"}.
+    """
+    with span("settle", cap_ms=cap_ms) as attrs:
+        res = _settle(page, quiet_ms, cap_ms, network)
+        attrs["settled"] = res["settled"]
+    return res
+
+
+async def settle_async(page, quiet_ms: int = SETTLE_QUIET_MS, cap_ms: int = SETTLE_CAP_MS, network: NetworkTracker | None = None) -> dict:
+    with span("settle", cap_ms=cap_ms) as attrs:
+        res = await _settle_async(page, quiet_ms, cap_ms, network)
+        attrs["settled"] = res["settled"]
+    return res
+
+
+def _settle(page, quiet_ms, cap_ms, network) -> dict:
+    started = time.monotonic()
+    deadline = started + cap_ms / 1000.0
+    mutations = failures = 0
+    while True:
+        remaining = int((deadline - time.monotonic()) * 1000)
+        if remaining <= 0:
+            return _result(False, started, mutations)
+        try:
+            res = page.evaluate(SETTLE_JS, {"quietMs": quiet_ms, "capMs": remaining})
+        except Exception:
+            failures += 1
+            if failures > 2:
+                return _result(False, started, mutations)
+            try:  # navigated mid-wait: follow the new document
+                page.wait_for_load_state("domcontentloaded", timeout=max(remaining, 1))
+            except Exception:
+                return _result(False, started, mutations)
+            continue
+        mutations += res.get("mutations", 0)
+        if not res.get("quiet"):
+            return _result(False, started, mutations)
+        if network is None or not network.busy():
+            return _result(True, started, mutations)
+
+
+async def _settle_async(page, quiet_ms, cap_ms, network) -> dict:
+    started = time.monotonic()
+    deadline = started + cap_ms / 1000.0
+    mutations = failures = 0
+    while True:
+        remaining = int((deadline - time.monotonic()) * 1000)
+        if remaining <= 0:
+            return _result(False, started, mutations)
+        try:
+            res = await page.evaluate(SETTLE_JS, {"quietMs": quiet_ms, "capMs": remaining})
+        except Exception:
+            failures += 1
+            if failures > 2:
+                return _result(False, started, mutations)
+            try:
+                await page.wait_for_load_state("domcontentloaded", timeout=max(remaining, 1))
+            except Exception:
+                return _result(False, started, mutations)
+            continue
+        mutations += res.get("mutations", 0)
+        if not res.get("quiet"):
+            return _result(False, started, mutations)
+        if network is None or not network.busy():
+            return _result(True, started, mutations)
@@ -0,0 +1,118 @@
+# timeout_budget.py
+"""
+Per-action timeout budgets learned from observed latency.
+
+A fixed 15 s timeout means one wrong selector from the planner costs 15 s
+before the error reaches it. TimeoutBudgets keeps the latency of recent
+successful actions per (app domain, action kind). Once MIN_SAMPLES are known,
+an action gets p95 * 1.5 + 500 ms, clamped to [TIMEOUT_MIN_MS, TIMEOUT_DEFAULT_MS];
+until then it gets the default.
+
+The executor turns the budget into a Deadline at the start of
+execute_action. Every wait in the fallback ladder draws from the same
+remaining time instead of starting its own 15 s clock.
+
+History is kept in .cache/action_latency.json so daily runs start warm.
+
+Env:
+  TIMEOUT_BUDGETS=0     always use TIMEOUT_DEFAULT_MS
+  TIMEOUT_DEFAULT_MS    default 15000 (also the upper clamp)
+  TIMEOUT_MIN_MS        default 2000
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+DEFAULT_TIMEOUT_MS = int(os.getenv("TIMEOUT_DEFAULT_MS", "15000"))
+MIN_TIMEOUT_MS = int(os.getenv("TIMEOUT_MIN_MS", "2000"))
+MIN_SAMPLES = 5
+HISTORY = 50
+P95_FACTOR = 1.5
+MARGIN_MS = 500
+RUNG_FLOOR_MS = 250  # later ladder rungs always get at least this much
+
+
+def _p95(values) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+class Deadline:
+    def __init__(self, budget_ms: int):
+        self.budget_ms = budget_ms
+        self._end = time.monotonic() + budget_ms / 1000.0
+
+    def remaining_ms(self, floor: int = RUNG_FLOOR_MS) -> int:
+        return max(int((self._end - time.monotonic()) * 1000), floor)
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self._end
+
+
+class TimeoutBudgets:
+    def __init__(self, path=None, enabled=None):
+        self.path = path or os.path.join(".cache", "action_latency.json")
+        self.enabled = enabled if enabled is not None else os.getenv("TIMEOUT_BUDGETS", "1") != "0"
+        self._history = defaultdict(lambda: deque(maxlen=HISTORY))
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for key, values in json.load(f).items():
+                    self._history[key].extend(values)
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def _key(domain: str, kind: str) -> str:
+        return f"{domain}|{kind}"
+
+    def budget_ms(self, domain: str, kind: str) -> int:
+        if not self.enabled:
+            return DEFAULT_TIMEOUT_MS
+        with self._lock:
+            samples = list(self._history.get(self._key(domain, kind), ()))
+        if len(samples) < MIN_SAMPLES:
+            return DEFAULT_TIMEOUT_MS
+        budget = _p95(samples) * P95_FACTOR + MARGIN_MS
+        return int(min(max(budget, MIN_TIMEOUT_MS), DEFAULT_TIMEOUT_MS))
+
+    def deadline(self, domain: str, kind: str) -> Deadline:
+        return Deadline(self.budget_ms(domain, kind))
+
+    def observe(self, domain: str, kind: str, elapsed_ms: float, ok: bool):
+        """Record a finished action; failures are not latency samples (they mostly are timeouts)."""
+        if not ok:
+            return
+        with self._lock:
+            self._history[self._key(domain, kind)].append(round(elapsed_ms, 1))
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            blob = json.dumps({k: list(v) for k, v in self._history.items()})
+            self._dirty = False
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(blob)
+        os.replace(tmp, self.path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            keys = list(self._history)
+        return {k: self.budget_ms(*k.split("|", 1)) for k in keys}
+
+
+_budgets = None
+
+
+def get_timeout_budgets() -> TimeoutBudgets:
+    global _budgets
+    if _budgets is None:
+        _budgets = TimeoutBudgets()
+    return _budgets
@@ -0,0 +1,162 @@
+# token_usage.py
+"""
+Token, latency and cost accounting for planner calls.
+
+llm_agent attaches "_usage" to every action it returns: input, cached,
+output and reasoning tokens, model latency, and time to first token when the
+call was streamed. UsageLedger collects those per step for one task:
+
+    ledger = UsageLedger()
+    print(ledger.record(step, action))    # "tokens: in=... cached=... out=... (reasoning=...) 812 ms $0.0041"
+    metadata["usage"] = ledger.totals()
+    metadata["llm_calls"] = ledger.calls
+
+aggregate() sums the totals of several tasks (batch_runner) and reports
+tokens and cost per successful task, which is what trajectories are
+budgeted by. Replies that needed a local repair or a retry, or failed to
+parse (planner_output), are counted as parse_repaired/retried/failed.
+
+Prices are USD per million tokens, by model prefix. LLM_PRICE_INPUT,
+LLM_PRICE_CACHED and LLM_PRICE_OUTPUT override the table (e.g. for a local
+planner server, set all three to 0).
+"""
+import os
+
+# model prefix -> (input, cached input, output) USD per 1M tokens; longest prefix wins
+PRICES = {
+    "gpt-5": (1.25, 0.125, 10.0),
+    "gpt-5-mini": (0.25, 0.025, 2.0),
+    "gpt-5-nano": (0.05, 0.005, 0.4),
+    "gpt-4.1": (2.0, 0.5, 8.0),
+    "gpt-4.1-mini": (0.4, 0.1, 1.6),
+    "gpt-4o": (2.5, 1.25, 10.0),
+    "gpt-4o-mini": (0.15, 0.075, 0.6),
+}
+TOKEN_KEYS = ("input_tokens", "cached_tokens", "output_tokens", "reasoning_tokens")
+
+
+def _env_price(name: str):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else None
+
+
+def price_for(model: str) -> tuple | None:
+    """(input, cached, output) per 1M tokens for `model`, or None when unknown."""
+    matches = [p for p in PRICES if (model or "").startswith(p)]
+    base = PRICES[max(matches, key=len)] if matches else None
+    overrides = (_env_price("LLM_PRICE_INPUT"), _env_price("LLM_PRICE_CACHED"), _env_price("LLM_PRICE_OUTPUT"))
+    if base is None and None in overrides:
+        return None
+    base = base or (0.0, 0.0, 0.0)
+    return tuple(o if o is not None else b for o, b in zip(overrides, base))
+
+
+def cost_usd(model: str, usage: dict) -> float | None:
+    """Cost of one call; cached input is billed at the cached rate, reasoning is part of output."""
+    price = price_for(model)
+    if price is None:
+        return None
+    cached = usage.get("cached_tokens", 0)
+    uncached = max(usage.get("input_tokens", 0) - cached, 0)
+    return (uncached * price[0] + cached * price[1] + usage.get("output_tokens", 0) * price[2]) / 1e6
+
+
+PARSE_KEYS = {"repaired": "parse_repaired", "retried": "parse_retried", "failed": "parse_failed"}
+
+
+def _new_totals() -> dict:
+    return {"calls": 0, "cache_hits": 0, **{k: 0 for k in TOKEN_KEYS},
+            "latency_ms": 0.0, "ttft_ms": [], "cost_usd": 0.0, "unpriced_calls": 0,
+            **{k: 0 for k in PARSE_KEYS.values()}}
+
+
+class UsageLedger:
+    def __init__(self):
+        self.calls = []   # one record per planner call, for metadata.json "llm_calls"
+        self._totals = _new_totals()
+
+    def record(self, step: int, action: dict) -> str:
+        """Account for one planner reply; returns the per-step log line."""
+        usage = action.get("_usage") or {}
+        t = self._totals
+        t["calls"] += 1
+        if action.get("_cache_hit"):
+            t["cache_hits"] += 1
+            self.calls.append({"step": step, "cache_hit": True})
+            return "tokens: local cache hit"
+
+        cost = cost_usd(usage.get("model", ""), usage)
+        entry = {"step": step, **usage, "cost_usd": None if cost is None else round(cost, 6)}
+        self.calls.append(entry)
+        for k in TOKEN_KEYS:
+            t[k] += usage.get(k, 0)
+        t["latency_ms"] += usage.get("latency_ms", 0.0)
+        if usage.get("parse") in PARSE_KEYS:
+            t[PARSE_KEYS[usage["parse"]]] += 1
+        if usage.get("ttft_ms") is not None:
+            t["ttft_ms"].append(usage["ttft_ms"])
+        if cost is None:
+            t["unpriced_calls"] += 1
+        else:
+            t["cost_usd"] += cost
+
+        line = (f"tokens: in={usage.get('input_tokens', 0)} cached={usage.get('cached_tokens', 0)} "
+                f"out={usage.get('output_tokens', 0)} (reasoning={usage.get('reasoning_tokens', 0)})")
+        if "latency_ms" in usage:
+            line += f" {usage['latency_ms']:.0f} ms"
+        if usage.get("ttft_ms") is not None:
+            line += f" (ttft {usage['ttft_ms']:.0f} ms)"
+        if cost is not None:
+            line += f" ${cost:.4f}"
+        if usage.get("parse", "ok") != "ok":
+            line += f" [reply {usage['parse']}{': ' + usage['repair'] if usage.get('repair') else ''}]"
+        return line
+
+    def totals(self) -> dict:
+        """Per-task totals for metadata.json "usage" and the run_agent summary."""
+        t = dict(self._totals)
+        ttft = t.pop("ttft_ms")
+        billed = t["calls"] - t["cache_hits"]
+        t["latency_ms"] = round(t["latency_ms"], 1)
+        t["mean_latency_ms"] = round(t["latency_ms"] / billed, 1) if billed else None
+        t["mean_ttft_ms"] = round(sum(ttft) / len(ttft), 1) if ttft else None
+        t["cost_usd"] = round(t["cost_usd"], 6)
+        return t
+
+
+def aggregate(usages: list, succeeded: int | None = None) -> dict:
+    """Sum per-task totals; with `succeeded`, also tokens and cost per successful task."""
+    out = {"tasks": 0, "calls": 0, "cache_hits": 0, **{k: 0 for k in TOKEN_KEYS},
+           "latency_ms": 0.0, "cost_usd": 0.0, "unpriced_calls": 0, **{k: 0 for k in PARSE_KEYS.values()}}
+    for u in usages:
+        if not u:
+            continue
+        out["tasks"] += 1
+        for k in out:
+            if k != "tasks":
+                out[k] += u.get(k, 0) or 0
+    out["latency_ms"] = round(out["latency_ms"], 1)
+    out["cost_usd"] = round(out["cost_usd"], 6)
+    if succeeded:
+        out["tokens_per_success"] = round((out["input_tokens"] + out["output_tokens"]) / succeeded)
+        out["cost_per_success_usd"] = round(out["cost_usd"] / succeeded, 6)
+    return out
+
+
+def format_usage(totals: dict) -> str:
+    """One-line summary of per-task or aggregated totals."""
+    line = (f"{totals.get('calls', 0)} planner calls ({totals.get('cache_hits', 0)} local cache hits), "
+            f"tokens in={totals.get('input_tokens', 0)} cached={totals.get('cached_tokens', 0)} "
+            f"out={totals.get('output_tokens', 0)} reasoning={totals.get('reasoning_tokens', 0)}, "
+            f"model time {totals.get('latency_ms', 0) / 1000:.1f}s")
+    if totals.get("mean_ttft_ms") is not None:
+        line += f", mean ttft {totals['mean_ttft_ms']:.0f} ms"
+    line += f", ${totals.get('cost_usd', 0):.4f}"
+    bad = [f"{totals.get(k, 0)} {k.split('_')[1]}" for k in PARSE_KEYS.values() if totals.get(k)]
+    if bad:
+        line += f", replies {'/'.join(bad)}"
+    if totals.get("unpriced_calls"):
+        line += f" (+{totals['unpriced_calls']} calls with unknown price)"
+    if "tokens_per_success" in totals:
+        line += f"; per successful task: {totals['tokens_per_success']} tokens, ${totals['cost_per_success_usd']:.4f}"
+    return line
@@ -0,0 +1,172 @@
+# tracing.py
+"""
+Step-level latency spans for a run.
+
+run_agent installs a Tracer for the duration of a task (activate/deactivate,
+or the use_tracer context manager) and sets tracer.step before each step.
+Code anywhere below it opens spans without a handle being passed around:
+
+    with span("llm.request", model=MODEL):
+        ...
+
+    @traced("ladder.select_from_popup")
+    def _select_from_popup(page, value): ...
+
+The current tracer lives in a ContextVar, so asyncio tasks (one per
+concurrent run) and asyncio.to_thread keep their own tracer. Work handed to
+a thread pool should be submitted through contextvars.copy_context().run.
+With no tracer installed, span() costs one ContextVar lookup.
+
+Per-step spans go into metadata.json under "timings". chrome_trace() gives
+the same data in Chrome trace-event format (trace.json next to
+metadata.json; open it in chrome://tracing or https://ui.perfetto.dev).
+
+Env:
+  TRACING=0     no spans, no trace.json
+"""
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+TRACING = os.getenv("TRACING", "1") == "1"
+
+_current = contextvars.ContextVar("tracer", default=None)
+_scopes = contextvars.ContextVar("scopes", default=())
+_exit_hooks = []  # fn(frame, error) when a span ends; see add_exit_hook
+
+
+class Tracer:
+    def __init__(self, name: str = "run"):
+        self.name = name
+        self.step = 0
+        self.spans = []
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._t0) * 1e6
+
+    def add(self, name: str, start_us: float, end_us: float, attrs: dict):
+        record = {
+            "name": name, "step": self.step, "ts": round(start_us, 1), "dur": round(end_us - start_us, 1),
+            "tid": threading.get_ident(), "args": attrs,
+        }
+        with self._lock:
+            self.spans.append(record)
+
+    def step_timings(self) -> list:
+        """[{"step", "total_ms", "spans": [{"name", "start_ms", "ms", ...attrs}]}] for metadata.json."""
+        by_step = {}
+        for s in self.spans:
+            by_step.setdefault(s["step"], []).append(s)
+        out = []
+        for step, spans in sorted(by_step.items()):
+            start = min(s["ts"] for s in spans)
+            end = max(s["ts"] + s["dur"] for s in spans)
+            out.append({
+                "step": step,
+                "total_ms": round((end - start) / 1000, 1),
+                "spans": [{"name": s["name"], "start_ms": round((s["ts"] - start) / 1000, 1),
+                           "ms": round(s["dur"] / 1000, 1), **s["args"]}
+                          for s in sorted(spans, key=lambda s: s["ts"])],
+            })
+        return out
+
+    def chrome_trace(self) -> dict:
+        """Chrome trace-event JSON ("X" complete events, one track per thread)."""
+        tids = {}
+        events = [{"name": "process_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": self.name}}]
+        for s in sorted(self.spans, key=lambda s: s["ts"]):
+            tid = tids.setdefault(s["tid"], len(tids) + 1)
+            events.append({
+                "name": s["name"], "cat": s["name"].split(".", 1)[0], "ph": "X", "pid": 1, "tid": tid,
+                "ts": s["ts"], "dur": s["dur"], "args": {"step": s["step"], **s["args"]},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def activate(tracer: Tracer | None) -> contextvars.Token:
+    """Install `tracer` as the current one for this context (None disables spans); pair with deactivate()."""
+    return _current.set(tracer)
+
+
+def deactivate(token: contextvars.Token):
+    _current.reset(token)
+
+
+@contextmanager
+def use_tracer(tracer: Tracer | None):
+    token = activate(tracer)
+    try:
+        yield tracer
+    finally:
+        deactivate(token)
+
+
+def current_tracer() -> Tracer | None:
+    return _current.get()
+
+
+def current_scope() -> dict | None:
+    """Innermost open span as a mutable frame {"name", "parent"}; None outside spans or when nothing listens."""
+    scopes = _scopes.get()
+    return scopes[-1] if scopes else None
+
+
+def add_exit_hook(fn):
+    """Call fn(frame, error) whenever a span closes (pw_profiler uses this); also enables scope tracking."""
+    if fn not in _exit_hooks:
+        _exit_hooks.append(fn)
+
+
+def remove_exit_hook(fn):
+    if fn in _exit_hooks:
+        _exit_hooks.remove(fn)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the block as one span; yields the attrs dict so callers can add results."""
+    tracer = _current.get()
+    if tracer is None and not _exit_hooks:
+        yield attrs
+        return
+    scopes = _scopes.get()
+    frame = {"name": name, "parent": scopes[-1] if scopes else None}
+    token = _scopes.set(scopes + (frame,))
+    start = tracer._now_us() if tracer else 0.0
+    error = None
+    try:
+        yield attrs
+    except BaseException as e:
+        error = e
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        _scopes.reset(token)
+        for hook in _exit_hooks:
+            hook(frame, error)
+        if tracer:
+            tracer.add(name, start, tracer._now_us(), attrs)
+
+
+def traced(name: str):
+    """Decorator form of span() for sync and async functions."""
+    def wrap(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def run_async(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return run
+    return wrap
@@ -0,0 +1,223 @@
+# trajectory_store.py
+"""
+Recorded trajectories of successful runs, replayed without the planner.
+
+Each executed step is stored with the page fingerprint seen right before it,
+the action the planner returned (selectors already normalized) and the
+executor's result:
+
+    {"fingerprint": "3f9c…", "action": {...}, "result": "Filled … with 'Apollo'", "ok": true}
+
+A run that ends in "done" is written to trajectories/<app>/<task slug>.json.
+The next run of the same app + task replays it step by step for as long as
+the live fingerprint matches the recorded one; on the first mismatch (or a
+failed replayed step) control goes back to get_next_action, and the healed
+run overwrites the stored trajectory once it succeeds.
+
+The fingerprint is deliberately coarse: URL path with id-like segments
+masked, plus the names of open dialogs and the presence of an open popup,
+taken from one light dom_probe evaluation. A match only means the UI looks
+the same, not that the task is still undone, so replay is opt-in and stops
+before the first step with side effects (fills, typed input, Enter, and
+clicks on create/save/submit/post-like targets): the planner decides those,
+and can see that an update was already posted. Tasks that are safe to
+repeat in full pass idempotent=True.
+
+Env:
+  TRAJECTORIES=1        record and replay (default 0)
+  TRAJECTORY_DIR        default trajectories
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+import dom_probe
+from dataset_manager import _fsync_write, _short_slug
+from settle import settle, settle_async
+
+TRAJECTORIES = os.getenv("TRAJECTORIES", "0") == "1"
+TRAJECTORY_DIR = os.getenv("TRAJECTORY_DIR", "trajectories")
+FINGERPRINT_WAIT_MS = 1500
+
+# Planner fields worth replaying; _response_id/_usage/_cache_hit are per call.
+_ACTION_FIELDS = (
+    "action", "selector", "value", "take_screenshot", "screenshot_description",
+    "_selector_engine", "_normalized_selector", "_get_by_arg", "expect", "plan",
+    "field", "prompt", "mask", "persist_key",
+)
+_SIDE_EFFECT = re.compile(
+    r"\b(create|save|submit|confirm|finish|publish|post|send|add|delete|remove|update|archive|invite|pay|order)\b", re.I)
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[\w-]{6,}$|^\d+$")
+
+
+def _url_shape(url: str) -> str:
+    parts = urlsplit(url or "")
+    segs = [":id" if _ID_SEGMENT.match(s) else s for s in parts.path.split("/") if s]
+    return f"{parts.netloc}/{'/'.join(segs)}"
+
+
+def fingerprint_from(url: str, snap: dict) -> str:
+    dialogs = sorted((d.get("name") or d.get("role") or "") for d in snap.get("dialogs", []))
+    payload = json.dumps([_url_shape(url), dialogs, dom_probe.popup_open(snap)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def page_fingerprint(page) -> str:
+    try:
+        return fingerprint_from(page.url, dom_probe.probe(page, light=True))
+    except Exception:
+        return ""
+
+
+async def page_fingerprint_async(page) -> str:
+    try:
+        return fingerprint_from(page.url, await dom_probe.probe_async(page, light=True))
+    except Exception:
+        return ""
+
+
+def wait_for_fingerprint(page, expected: str, timeout_ms: int = FINGERPRINT_WAIT_MS) -> str:
+    """
+    Current fingerprint. When it differs from `expected`, the page may still
+    be mid-transition: settle it (at most timeout_ms) and take it once more.
+    """
+    fp = page_fingerprint(page)
+    if fp != expected:
+        settle(page, cap_ms=timeout_ms)
+        fp = page_fingerprint(page)
+    return fp
+
+
+async def wait_for_fingerprint_async(page, expected: str, timeout_ms: int = FINGERPRINT_WAIT_MS) -> str:
+    fp = await page_fingerprint_async(page)
+    if fp != expected:
+        await settle_async(page, cap_ms=timeout_ms)
+        fp = await page_fingerprint_async(page)
+    return fp
+
+
+def has_side_effect(action: dict) -> bool:
+    """Whether replaying `action` may change app data (and so needs the planner's judgement)."""
+    kind = action.get("action")
+    if kind == "plan":
+        return any(has_side_effect(a) for a in action.get("plan") or [])
+    if kind in ("fill", "request_input"):
+        return True
+    if kind == "press":
+        return "enter" in (action.get("value") or "Enter").lower()
+    if kind == "click":
+        return bool(_SIDE_EFFECT.search(f"{action.get('selector') or ''} {action.get('value') or ''}"))
+    return False
+
+
+def _replayable(action: dict) -> dict:
+    out = {k: action[k] for k in _ACTION_FIELDS if k in action}
+    if "plan" in out:
+        out["plan"] = [_replayable(a) for a in out["plan"]]
+    return out
+
+
+class TrajectoryStore:
+    def __init__(self, base_dir: str = TRAJECTORY_DIR):
+        self.base_dir = base_dir
+
+    def path_for(self, app_name: str, user_task: str) -> str:
+        task = " ".join((user_task or "").split())
+        digest = hashlib.sha1(task.encode("utf-8")).hexdigest()[:10]
+        return os.path.join(self.base_dir, _short_slug(app_name), f"{_short_slug(task, 48)}-{digest}.json")
+
+    def load(self, app_name: str, user_task: str) -> list | None:
+        try:
+            with open(self.path_for(app_name, user_task), "r", encoding="utf-8") as f:
+                return json.load(f).get("steps") or None
+        except (OSError, ValueError):
+            return None
+
+    def save(self, app_name: str, user_task: str, steps: list):
+        path = self.path_for(app_name, user_task)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        body = {"app_name": app_name, "task": user_task, "saved_at": time.time(), "steps": steps}
+        _fsync_write(path, json.dumps(body, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+class TrajectoryRun:
+    """
+    Per-run replay cursor plus recorder.
+
+    fingerprint(page) -> fingerprint to record/compare for the next step;
+    take(fp) -> the stored action when fp matches and it has no side effects
+    (or the task is idempotent), else None (and replay stops for the rest of
+    the run); record() logs every executed step and stops replay when a
+    replayed step fails.
+    """
+
+    def __init__(self, store: TrajectoryStore, app_name: str, user_task: str, enabled: bool = TRAJECTORIES,
+                 idempotent: bool = False):
+        self.store = store
+        self.app_name = app_name
+        self.user_task = user_task
+        self.enabled = enabled
+        self.idempotent = idempotent
+        self.replay = (store.load(app_name, user_task) if enabled else None) or []
+        self.pos = 0
+        self.replayed = 0
+        self.diverged_at = None
+        self.stop_reason = None
+        self.steps = []
+
+    @property
+    def replaying(self) -> bool:
+        return self.diverged_at is None and self.pos < len(self.replay)
+
+    def expected_fingerprint(self) -> str | None:
+        return self.replay[self.pos]["fingerprint"] if self.replaying else None
+
+    def fingerprint(self, page) -> str:
+        """Fingerprint before the next step; waits briefly for the stored one while replaying."""
+        if not self.enabled:
+            return ""
+        expected = self.expected_fingerprint()
+        return wait_for_fingerprint(page, expected) if expected else page_fingerprint(page)
+
+    async def fingerprint_async(self, page) -> str:
+        if not self.enabled:
+            return ""
+        expected = self.expected_fingerprint()
+        return await wait_for_fingerprint_async(page, expected) if expected else await page_fingerprint_async(page)
+
+    def take(self, fingerprint: str) -> dict | None:
+        if not self.replaying:
+            return None
+        step = self.replay[self.pos]
+        if fingerprint != step["fingerprint"]:
+            self.stop("diverged")
+            return None
+        if not self.idempotent and has_side_effect(step["action"]):
+            self.stop("side_effect")
+            return None
+        self.pos += 1
+        self.replayed += 1
+        return dict(step["action"], _replayed=True)
+
+    def stop(self, reason: str = "failed"):
+        if self.diverged_at is None:
+            self.diverged_at, self.stop_reason = self.pos, reason
+
+    def record(self, fingerprint: str, action: dict, result: str, ok: bool):
+        if not ok and action.get("_replayed"):
+            self.stop("failed")
+        if self.enabled:
+            self.steps.append({"fingerprint": fingerprint, "action": _replayable(action), "result": result, "ok": ok})
+
+    def finish(self, status: str):
+        """Persist the run's successful steps when the task ended in "done"."""
+        steps = [s for s in self.steps if s["ok"]]
+        if self.enabled and status == "done" and steps:
+            self.store.save(self.app_name, self.user_task, steps)
+
+    def summary(self) -> dict:
+        return {"stored_steps": len(self.replay), "replayed": self.replayed, "diverged_at": self.diverged_at,
+                "stop_reason": self.stop_reason}
@@ -2,8 +2,8 @@
 from getpass import getpass
 
 class UserInputManager:
-    def __init__(self):
-        self._cache = {}  # persist_key -> value
+    def __init__(self, preset: dict | None = None):
+        self._cache = dict(preset or {})  # persist_key -> value
 
     def request(self, field: str, prompt: str, mask: bool, persist_key: str | None = None) -> str:
         if persist_key and persist_key in self._cache:
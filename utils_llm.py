@@ -1,12 +1,32 @@
 # utils_llm.py (or top of llm_agent.py)
-import os, io, base64
-from PIL import Image
+import os, io, base64, math, contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image, ImageDraw, ImageFilter, ImageOps
+
+from tracing import span
+
+# Encoding runs off the agent loop thread; Playwright calls stay on the loop.
+_ENCODER = ThreadPoolExecutor(max_workers=2, thread_name_prefix="img-encode")
+
+# Content-adaptive planner images (encode_adaptive): per-frame width/format/quality
+# chosen to fit a byte (and optional vision-token) budget while text stays legible.
+IMAGE_ADAPTIVE = os.getenv("IMAGE_ADAPTIVE", "1") == "1"
+IMAGE_BUDGET_BYTES = int(os.getenv("IMAGE_BUDGET_KB", "100")) * 1024
+IMAGE_TOKEN_BUDGET = int(os.getenv("IMAGE_TOKEN_BUDGET", "0"))  # 0 = bytes only
+LEGIBLE_W_DENSE = 1024
+LEGIBLE_W_SPARSE = 640
+DENSE_EDGES = 0.06   # edge share above which a frame counts as text-dense
+FLAT_COLORS = 48
+
 
 def image_to_data_url(path: str, max_w: int = 1280, quality: int = 70) -> str:
     """
     Load an image, optionally downscale to max_w, JPEG encode (quality),
     and return a data URL suitable for input_image.
     """
+    if IMAGE_ADAPTIVE:
+        with open(path, "rb") as f:
+            return bytes_to_data_url(f.read(), max_w, quality)
     img = Image.open(path).convert("RGB")
     if img.width > max_w:
         h = int(img.height * (max_w / img.width))
@@ -16,3 +36,169 @@ def image_to_data_url(path: str, max_w: int = 1280, quality: int = 70) -> str:
     img.save(buf, format="JPEG", quality=quality, optimize=True)
     b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
     return f"data:image/jpeg;base64,{b64}"
+
+
+MARK_COLOR = (230, 0, 90)
+
+
+def draw_marks(img, marks: list):
+    """Outline each set-of-marks element (CSS-pixel boxes, see marks.py) and label it with its ID."""
+    draw = ImageDraw.Draw(img)
+    for m in marks:
+        x, y, w, h = m["box"]
+        draw.rectangle([x, y, x + w, y + h], outline=MARK_COLOR, width=2)
+        label = str(m["id"])
+        top = max(y - 12, 0)
+        draw.rectangle([x, top, x + 6 * len(label) + 4, top + 12], fill=MARK_COLOR)
+        draw.text((x + 2, top), label, fill=(255, 255, 255))
+    return img
+
+
+def image_tokens(w: int, h: int) -> int:
+    """Vision input tokens for a high-detail image: fit 2048x2048, shortest side <= 768, 170 per 512px tile + 85."""
+    scale = min(1.0, 2048 / max(w, h))
+    w, h = w * scale, h * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+
+
+def _edge_density(img) -> float:
+    """Share of strong edges on a 320 px greyscale thumbnail; text-heavy pages score high."""
+    thumb = img.convert("L")
+    thumb.thumbnail((320, 320))
+    hist = thumb.filter(ImageFilter.FIND_EDGES).histogram()
+    return sum(hist[48:]) / max(thumb.width * thumb.height, 1)
+
+
+def _is_flat(img) -> bool:
+    """Few distinct colours (sparse dialogs, plain forms): a palette PNG is small and keeps text sharp."""
+    thumb = img.convert("RGB")
+    thumb.thumbnail((320, 320))
+    thumb = ImageOps.posterize(thumb, 3)  # fold JPEG noise into its base colour
+    counts = sorted((n for n, _ in thumb.getcolors(maxcolors=512) or []), reverse=True)
+    return sum(counts[:FLAT_COLORS]) >= 0.97 * thumb.width * thumb.height
+
+
+def _encode(img, fmt: str, quality: int | None) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "PNG":
+        img.quantize(colors=64).save(buf, format="PNG", optimize=True)
+    else:
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def encode_adaptive(img, source: tuple | None = None, max_w: int = 1280,
+                    byte_budget: int | None = None, token_budget: int | None = None) -> tuple:
+    """
+    Pick width, format and quality for one frame: (bytes, mime, info).
+
+    Text-dense frames keep at least LEGIBLE_W_DENSE px and give up JPEG
+    quality before resolution; sparse frames may shrink to LEGIBLE_W_SPARSE
+    and flat ones try a palette PNG first. The first candidate within
+    byte_budget (and token_budget, if set) wins, else the smallest. `source`
+    is (bytes, mime) of an encoding that is sent as-is when it already fits.
+    """
+    byte_budget = byte_budget or IMAGE_BUDGET_BYTES
+    token_budget = IMAGE_TOKEN_BUDGET if token_budget is None else token_budget
+    density = _edge_density(img)
+    dense = density >= DENSE_EDGES
+    info = {"edge_density": round(density, 3), "dense": dense,
+            "source_bytes": len(source[0]) if source else None, "attempts": 0}
+
+    def fits(data, w, h):
+        return len(data) <= byte_budget and (not token_budget or image_tokens(w, h) <= token_budget)
+
+    def result(data, fmt, w, h, quality, mime=None):
+        info.update(format=fmt, width=w, height=h, quality=quality, bytes=len(data), tokens=image_tokens(w, h))
+        return data, mime or ("image/png" if fmt == "PNG" else "image/jpeg"), info
+
+    if source and img.width <= max_w and fits(source[0], img.width, img.height):
+        return result(source[0], "passthrough", img.width, img.height, None, mime=source[1])
+
+    floor = min(img.width, LEGIBLE_W_DENSE if dense else LEGIBLE_W_SPARSE)
+    widths = sorted({min(img.width, w) for w in (max_w, 1024, 896, 768, 640) if min(img.width, w) >= floor},
+                    reverse=True) or [floor]
+    qualities = (80, 70, 60, 50) if dense else (70, 55, 40)
+    candidates = [("PNG", widths[0], None)] if _is_flat(img) else []
+    candidates += [("JPEG", w, q) for w in widths for q in qualities]
+
+    best, rgb, resized = None, img.convert("RGB"), {}
+    for fmt, w, q in candidates:
+        if w not in resized:
+            resized[w] = rgb if w == rgb.width else rgb.resize((w, int(rgb.height * w / rgb.width)), Image.LANCZOS)
+        frame = resized[w]
+        data = _encode(frame, fmt, q)
+        info["attempts"] += 1
+        if fits(data, frame.width, frame.height):
+            return result(data, fmt, frame.width, frame.height, q)
+        if best is None or len(data) < len(best[0]):
+            best = (data, fmt, frame.width, frame.height, q)
+    return result(*best)
+
+
+def bytes_to_data_url(data: bytes, max_w: int = 1280, quality: int = 70, marks: list | None = None,
+                      crop: tuple | None = None, info: dict | None = None) -> str:
+    """
+    Data URL for an already-encoded JPEG/PNG buffer (e.g. page.screenshot()).
+    With IMAGE_ADAPTIVE (default) the frame goes through encode_adaptive and
+    `info`, when given, receives the chosen parameters and payload sizes.
+    Otherwise the buffer is reused as-is unless it is wider than max_w,
+    set-of-marks labels have to be drawn, or only the (x, y, w, h) `crop`
+    region is wanted; only then is it decoded and re-encoded as JPEG.
+    """
+    with span("image.encode", source_bytes=len(data)) as attrs:
+        url = _to_data_url(data, max_w, quality, marks, crop, info)
+        attrs["payload_bytes"] = len(url)
+    return url
+
+
+def _to_data_url(data, max_w, quality, marks, crop, info) -> str:
+    img = Image.open(io.BytesIO(data))  # header only; pixels are not decoded yet
+    source = (data, Image.MIME.get(img.format, "image/jpeg"))
+    if marks or crop:
+        img = img.convert("RGB")
+        if marks:
+            draw_marks(img, marks)
+        if crop:
+            x, y, w, h = crop
+            img = img.crop((x, y, x + w, y + h))
+        source = None
+
+    if IMAGE_ADAPTIVE:
+        data, mime, meta = encode_adaptive(img, source, max_w)
+        if info is not None:
+            info.update(meta)
+    elif img.width > max_w or not source:
+        img = img.convert("RGB")
+        if img.width > max_w:
+            h = int(img.height * (max_w / img.width))
+            img = img.resize((max_w, h), Image.LANCZOS)
+        data, mime = _encode(img, "JPEG", quality), "image/jpeg"
+    else:
+        mime = source[1]
+    return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+def submit_data_url(data: bytes, max_w: int = 1280, quality: int = 70, marks: list | None = None,
+                    crop: tuple | None = None, info: dict | None = None) -> Future:
+    """Start bytes_to_data_url on the encoder pool; returns a Future[str] (`info` is filled when it completes)."""
+    ctx = contextvars.copy_context()  # keeps the run's tracer for the image.encode span
+    return _ENCODER.submit(ctx.run, bytes_to_data_url, data, max_w, quality, marks, crop, info)
+
+
+def resolve_data_url(image) -> str | None:
+    """
+    Accepts what the loop hands the planner as the latest screenshot: a file
+    path, raw image bytes, a Future from submit_data_url, or a data URL.
+    """
+    if not image:
+        return None
+    if isinstance(image, Future):
+        return image.result()
+    if isinstance(image, (bytes, bytearray)):
+        return bytes_to_data_url(bytes(image))
+    if isinstance(image, str) and image.startswith("data:"):
+        return image
+    return image_to_data_url(image)
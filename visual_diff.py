@@ -0,0 +1,117 @@
+# visual_diff.py
+"""
+Send the planner only the part of a screenshot that changed.
+
+The loop used to attach the latest screenshot to every planner call, even
+when it was the same frame as last step or only a popover had opened.
+FrameDiffer compares each frame against the last one the planner was sent,
+using 160 px wide greyscale thumbnails:
+
+  skip   fewer than 0.2% of thumbnail pixels changed: no image, one note
+  crop   the changed area, padded (or the open dialog/popup box around it),
+         covers at most VISUAL_DIFF_CROP_MAX of the frame: send that region
+         plus its coordinates
+  full   anything else, a new viewport size, or the first frame
+  stale  no screenshot was taken since the last call: no image, and a note
+         that the planner's last frame may be out of date
+
+Skipping and cropping only make sense when the planner still has the earlier
+frame in context. That is the case when the call continues the previous
+response (OBS_MODE=diff chains). For standalone calls the full frame is
+always sent and becomes the new reference.
+
+Env:
+  VISUAL_DIFF=0              always send the full frame
+  VISUAL_DIFF_CROP_MAX=0.4   largest crop, as a fraction of the frame area
+"""
+import io
+import os
+
+from PIL import Image, ImageChops
+
+VISUAL_DIFF = os.getenv("VISUAL_DIFF", "1") == "1"
+CROP_MAX_AREA = float(os.getenv("VISUAL_DIFF_CROP_MAX", "0.4"))
+THUMB_W = 160
+PIXEL_THRESHOLD = 24   # grey levels; JPEG noise stays below this
+MIN_CHANGED = 0.002    # fraction of thumbnail pixels
+CROP_PAD = 16          # CSS px around the changed area
+
+
+def _area(box) -> int:
+    return box[2] * box[3]
+
+
+def _contains(outer, inner) -> bool:
+    return (outer[0] <= inner[0] and outer[1] <= inner[1]
+            and outer[0] + outer[2] >= inner[0] + inner[2] and outer[1] + outer[3] >= inner[1] + inner[3])
+
+
+def _clamp(box, size):
+    x0, y0 = max(box[0], 0), max(box[1], 0)
+    x1, y1 = min(box[0] + box[2], size[0]), min(box[1] + box[3], size[1])
+    return (x0, y0, max(x1 - x0, 0), max(y1 - y0, 0))
+
+
+def image_note(kind: str, box=None, size=None) -> str | None:
+    """Text block sent next to (or instead of) the image."""
+    if kind == "skip":
+        return "Screenshot omitted: nothing visible changed since the last screenshot you were sent."
+    if kind == "stale":
+        return ("No new screenshot was taken since the last one you were sent; "
+                "it may be out of date, rely on the page text for the current state.")
+    if kind == "stale_full":
+        return "This screenshot was taken before the last action and may be out of date; the page text is current."
+    if kind == "crop":
+        x, y, w, h = box
+        return (f"Screenshot shows only the changed region x={x}, y={y}, w={w}, h={h} of the "
+                f"{size[0]}x{size[1]} viewport; everything else looks as in the previous screenshot.")
+    return None
+
+
+class FrameDiffer:
+    def __init__(self, enabled: bool = VISUAL_DIFF):
+        self.enabled = enabled
+        self.stats = {"full": 0, "cropped": 0, "skipped": 0, "stale": 0}
+        self._ref = None    # (size, thumbnail) of the last frame sent
+
+    def _thumb(self, img):
+        h = max(1, round(img.height * THUMB_W / img.width))
+        return img.convert("L").resize((THUMB_W, h), Image.BILINEAR)
+
+    def _sent(self, size, thumb, kind, box=None):
+        self._ref = (size, thumb)
+        self.stats["full" if kind == "full" else "cropped"] += 1
+        return kind, box, size
+
+    def decide(self, data: bytes, chained: bool, focus_boxes=(), fresh: bool = True) -> tuple:
+        """
+        ("full" | "crop" | "skip" | "stale", crop box or None, frame size) for
+        `data` against the last frame sent. Boxes are (x, y, w, h) in
+        screenshot pixels. fresh=False means `data` is the previous capture
+        again: nothing new to compare, so a chained call gets "stale".
+        """
+        if self.enabled and chained and not fresh and self._ref is not None:
+            self.stats["stale"] += 1
+            return "stale", None, self._ref[0]
+        img = Image.open(io.BytesIO(data))
+        size, thumb = img.size, self._thumb(img)
+        ref = self._ref
+        if not (self.enabled and chained) or ref is None or ref[0] != size or ref[1].size != thumb.size:
+            return self._sent(size, thumb, "full")
+
+        mask = ImageChops.difference(ref[1], thumb).point(lambda p: 255 if p > PIXEL_THRESHOLD else 0)
+        if mask.histogram()[255] < MIN_CHANGED * thumb.width * thumb.height:
+            self.stats["skipped"] += 1  # the reference stays the frame the planner actually saw
+            return "skip", None, size
+
+        scale = size[0] / THUMB_W
+        x0, y0, x1, y1 = mask.getbbox()
+        box = _clamp((int(x0 * scale) - CROP_PAD, int(y0 * scale) - CROP_PAD,
+                      int((x1 - x0) * scale) + 2 * CROP_PAD, int((y1 - y0) * scale) + 2 * CROP_PAD), size)
+        for focus in sorted((tuple(f) for f in focus_boxes or ()), key=_area):
+            if _contains(focus, box):
+                box = _clamp(focus, size)
+                break
+        if _area(box) > CROP_MAX_AREA * size[0] * size[1]:
+            return self._sent(size, thumb, "full")
+        return self._sent(size, thumb, "crop", box)